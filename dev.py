@@ -10,6 +10,7 @@ Usage:
     python dev.py simulator       # Build and launch iOS simulator
     python dev.py simulator --mock-api  # Launch with mock API data
     python dev.py open            # Open Xcode project
+    python dev.py s3-event KEY    # Send an S3 ObjectCreated event to the local server
 """
 
 from __future__ import annotations
@@ -167,6 +168,31 @@ def open_xcode(args: argparse.Namespace) -> None:
     subprocess.run(["open", str(PROJECT)])
 
 
+def s3_event(args: argparse.Namespace) -> None:
+    """Stand in for S3 event notifications: tell the local server KEY was uploaded."""
+    from urllib.parse import quote_plus
+    from urllib.request import Request, urlopen
+
+    event = {
+        "Records": [
+            {
+                "eventSource": "aws:s3",
+                "eventName": "ObjectCreated:Put",
+                "s3": {"object": {"key": quote_plus(key)}},
+            }
+            for key in args.keys
+        ]
+    }
+    request = Request(
+        f"{args.url}/webhooks/s3",
+        data=json.dumps(event).encode(),
+        headers={"Content-Type": "application/json", "X-Webhook-Secret": args.secret},
+        method="POST",
+    )
+    with urlopen(request) as response:
+        print(response.read().decode())
+
+
 def _load_simctl_devices() -> dict | None:
     for _ in range(3):
         result = subprocess.run(
@@ -280,6 +306,17 @@ def main() -> None:
     open_parser = subparsers.add_parser("open", help="Open Xcode project")
     open_parser.set_defaults(func=open_xcode)
 
+    # s3-event
+    s3_event_parser = subparsers.add_parser("s3-event", help="Send an S3 upload event to the local server")
+    s3_event_parser.add_argument("keys", nargs="+", help="Uploaded S3 object keys")
+    s3_event_parser.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+    s3_event_parser.add_argument(
+        "--secret",
+        default=os.environ.get("S3_WEBHOOK_SECRET", "dev_s3_webhook_secret"),
+        help="Webhook secret (defaults to $S3_WEBHOOK_SECRET or the dev default)",
+    )
+    s3_event_parser.set_defaults(func=s3_event)
+
     args = parser.parse_args()
     args.func(args)
 
@@ -0,0 +1,428 @@
+"""
+Alignment of submission audio to a piece's score, for a time -> measure map.
+
+A piece can carry a reference (PUT /pieces/{id}/reference): a MusicXML file, or
+a recording plus the time each of its measures starts. Both become chroma
+features (energy per pitch class, FRAME_RATE frames per second): MusicXML notes
+are rendered straight into chroma at the score's tempo, recordings go through
+the same STFT as submissions.
+
+Submission chroma is aligned to the reference with dynamic time warping:
+
+- Steps are (1, 1), (1, 2) and (2, 1) (submission, reference) frames, so a take
+  can run between half and double the reference tempo and every row depends
+  only on the two rows before it: each row is a handful of array operations.
+- Alignment is subsequence DTW: a take can start and end anywhere in the
+  reference, as students rarely play a piece top to bottom.
+- It runs twice. A full DTW at 1/COARSE_FACTOR resolution finds the route; the
+  full-resolution DTW then only fills a band BAND_RADIUS frames either side of
+  it, so cost grows with the recording's length rather than with its square.
+
+Repeats are not expanded: the score is aligned as written.
+
+The result (models.SubmissionAnalysis, kind "alignment") is:
+
+    summary     similarity (mean cosine similarity along the path; takes below
+                MIN_SIMILARITY are not mapped), first_measure, last_measure
+    measure     {seconds_per_step, positions}: the measure being played every
+                seconds_per_step, as measure number + fraction through it
+    spans       [{measure, start_seconds, end_seconds}] per measure played,
+                also stored as models.SubmissionMeasure rows for range queries
+"""
+
+import io
+import zipfile
+from dataclasses import dataclass
+from xml.etree import ElementTree
+
+import numpy as np
+from cachetools import LRUCache
+from sqlmodel import Session
+
+from app import audio, models
+
+VERSION = 1
+
+FRAME_RATE = 10  # Chroma frames per second
+N_FFT = 4096  # ~4 Hz bins at 16 kHz: semitones apart down to cello C
+MIN_HZ = 55.0
+MAX_HZ = 4000.0
+COARSE_FACTOR = 4
+BAND_RADIUS = 2 * COARSE_FACTOR
+MIN_SIMILARITY = 0.6
+# Seconds per entry of the stored measure positions
+MAP_STEP_SECONDS = 0.5
+# Used when a MusicXML file has no <sound tempo>; in quarter notes per minute
+DEFAULT_TEMPO = 100.0
+# Score chroma also sounds each note's third harmonic (a fifth above), as
+# strings do
+FIFTH_WEIGHT = 0.3
+
+PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+
+class InvalidReference(ValueError):
+    """A reference file that can't be used for alignment"""
+
+
+@dataclass
+class Reference:
+    """Chroma of a piece's reference and where its measures start"""
+
+    chroma: np.ndarray  # (frames, 12), unit rows
+    measure_numbers: list[int]
+    # Measure boundaries in seconds: starts, then the end of the last measure
+    boundaries: np.ndarray
+
+
+# MARK: - Features
+
+
+def _normalize(chroma: np.ndarray) -> np.ndarray:
+    """Log-compressed, unit-length rows; silent frames stay zero."""
+    chroma = np.log1p(10 * chroma)
+    norms = np.linalg.norm(chroma, axis=1, keepdims=True)
+    return np.divide(chroma, norms, out=np.zeros_like(chroma), where=norms > 0)
+
+
+def _pitch_class_matrix(n_fft: int, sample_rate: int) -> np.ndarray:
+    """(bins, 12) weights folding STFT bins into pitch classes."""
+    hz = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    in_range = (hz >= MIN_HZ) & (hz <= MAX_HZ)
+    pitch_class = np.round(12 * np.log2(np.where(in_range, hz, 440.0) / 440.0) + 9)
+    matrix = np.zeros((len(hz), 12), dtype=np.float32)
+    matrix[in_range, pitch_class[in_range].astype(int) % 12] = 1
+    return matrix
+
+
+def chroma(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """(frames, 12) chroma of a recording at FRAME_RATE."""
+    hop = sample_rate // FRAME_RATE
+    energy = np.square(audio.spectrogram(samples, N_FFT, hop))
+    return _normalize(energy @ _pitch_class_matrix(N_FFT, sample_rate))
+
+
+def _musicxml_root(data: bytes) -> ElementTree.Element:
+    """The score element of a .musicxml/.xml file or a compressed .mxl."""
+    if data[:2] == b"PK":
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                names = archive.namelist()
+                path = None
+                if "META-INF/container.xml" in names:
+                    container = ElementTree.fromstring(
+                        archive.read("META-INF/container.xml")
+                    )
+                    rootfile = container.find(".//{*}rootfile")
+                    path = rootfile.get("full-path") if rootfile is not None else None
+                if path is None:
+                    path = next(
+                        name
+                        for name in names
+                        if name.endswith((".xml", ".musicxml"))
+                        and not name.startswith("META-INF/")
+                    )
+                data = archive.read(path)
+        except (zipfile.BadZipFile, KeyError, StopIteration) as e:
+            raise InvalidReference("Not a MusicXML archive") from e
+    try:
+        return ElementTree.fromstring(data)
+    except ElementTree.ParseError as e:
+        raise InvalidReference("Not a MusicXML file") from e
+
+
+def _duration(element: ElementTree.Element) -> int:
+    value = element.findtext("duration")
+    return int(value) if value and value.strip().isdigit() else 0
+
+
+def score_reference(data: bytes) -> Reference:
+    """
+    Reference from a partwise MusicXML score.
+
+    Notes of every part are rendered into chroma on a quarter-note timeline at
+    the first <sound tempo> (or DEFAULT_TEMPO); measures come from the first part.
+    """
+    root = _musicxml_root(data)
+    parts = root.findall("part")
+    if root.tag != "score-partwise" or not parts:
+        raise InvalidReference("Only partwise MusicXML scores are supported")
+
+    sound = root.find(".//sound[@tempo]")
+    tempo = float(sound.get("tempo")) if sound is not None else DEFAULT_TEMPO
+    seconds_per_quarter = 60 / tempo
+
+    notes = []  # (start quarter, end quarter, pitch class)
+    measure_numbers: list[int] = []
+    measure_starts: list[float] = []
+    end = 0.0
+    for index, part in enumerate(parts):
+        divisions = 1
+        start = 0.0  # Quarters
+        for measure in part.findall("measure"):
+            if index == 0:
+                number = measure.get("number", "")
+                measure_numbers.append(
+                    int(number)
+                    if number.isdigit()
+                    else (measure_numbers[-1] + 1 if measure_numbers else 1)
+                )
+                measure_starts.append(start)
+            position = longest = 0
+            last_onset = 0
+            for element in measure:
+                if element.tag == "attributes" and element.findtext("divisions"):
+                    divisions = max(1, int(element.findtext("divisions")))
+                elif element.tag == "backup":
+                    position -= _duration(element)
+                elif element.tag == "forward":
+                    position += _duration(element)
+                elif element.tag == "note":
+                    duration = _duration(element)
+                    onset = (
+                        last_onset if element.find("chord") is not None else position
+                    )
+                    pitch = element.find("pitch")
+                    if pitch is not None and element.find("grace") is None:
+                        pitch_class = PITCH_CLASSES.get(pitch.findtext("step", ""))
+                        if pitch_class is not None:
+                            alter = float(pitch.findtext("alter") or 0)
+                            notes.append(
+                                (
+                                    start + onset / divisions,
+                                    start + (onset + duration) / divisions,
+                                    (pitch_class + round(alter)) % 12,
+                                )
+                            )
+                    if element.find("chord") is None:
+                        last_onset = position
+                        position += duration
+                longest = max(longest, position)
+            start += longest / divisions
+        end = max(end, start)
+
+    if not measure_numbers or end <= 0:
+        raise InvalidReference("The score has no measures")
+
+    frames = int(np.ceil(end * seconds_per_quarter * FRAME_RATE)) + 1
+    energy = np.zeros((frames, 12), dtype=np.float32)
+    for note_start, note_end, pitch_class in notes:
+        first = int(note_start * seconds_per_quarter * FRAME_RATE)
+        last = max(first + 1, int(note_end * seconds_per_quarter * FRAME_RATE))
+        energy[first:last, pitch_class] += 1
+        energy[first:last, (pitch_class + 7) % 12] += FIFTH_WEIGHT
+
+    return Reference(
+        chroma=_normalize(energy),
+        measure_numbers=measure_numbers,
+        boundaries=np.array(measure_starts + [end]) * seconds_per_quarter,
+    )
+
+
+def recording_reference(
+    samples: np.ndarray, sample_rate: int, measure_times: list[float]
+) -> Reference:
+    """Reference from a recording whose measure i + 1 starts at measure_times[i]."""
+    duration = len(samples) / sample_rate
+    return Reference(
+        chroma=chroma(samples, sample_rate),
+        measure_numbers=list(range(1, len(measure_times) + 1)),
+        boundaries=np.array(list(measure_times) + [duration]),
+    )
+
+
+def validate_measure_times(measure_times: list[float]) -> None:
+    if not measure_times:
+        raise InvalidReference("measure_times is empty")
+    if measure_times[0] < 0 or any(
+        b <= a for a, b in zip(measure_times, measure_times[1:])
+    ):
+        raise InvalidReference("measure_times must be increasing and non-negative")
+
+
+# Backfills align many takes of the same few pieces
+_reference_cache: LRUCache[str, Reference] = LRUCache(maxsize=16)
+
+
+def cached_reference(key: str, load) -> Reference:
+    """The reference cached under `key` (its S3 key), building it with load()."""
+    reference = _reference_cache.get(key)
+    if reference is None:
+        reference = _reference_cache[key] = load()
+    return reference
+
+
+def reference_piece(db: Session, piece: models.Piece | None) -> models.Piece | None:
+    """The piece whose reference `piece` aligns to: itself, or what it's a copy of."""
+    if piece is None:
+        return None
+    if piece.reference_s3_key is None and piece.shared_from_piece_id:
+        piece = db.get(models.Piece, piece.shared_from_piece_id)
+    return piece if piece is not None and piece.reference_s3_key else None
+
+
+# MARK: - DTW
+
+
+def dtw(
+    query: np.ndarray, reference: np.ndarray, lo: np.ndarray, hi: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Subsequence DTW of `query` rows against `reference` rows (unit chroma),
+    filling only reference columns [lo[i], hi[i]) of each query row i.
+
+    Returns the path as (query indices, reference indices). Costs are weighted
+    by the query frames each step covers, so every path costs the same number
+    of frames and paths ending anywhere compare fairly.
+    """
+    n, m = len(query), len(reference)
+    previous = np.full(m + 2, np.inf)  # Row i - 1, offset by 2 columns
+    before = np.full(m + 2, np.inf)  # Row i - 2
+    steps = []
+
+    for i in range(n):
+        columns = slice(lo[i], hi[i])
+        cost = 1 - reference[columns] @ query[i]
+        row = np.full(m + 2, np.inf)
+        if i == 0:
+            # Free start anywhere in the reference
+            row[lo[i] + 2 : hi[i] + 2] = cost
+            step = np.zeros(hi[i] - lo[i], dtype=np.int8)
+        else:
+            candidates = np.stack(
+                [
+                    previous[lo[i] + 1 : hi[i] + 1] + cost,  # (1, 1)
+                    previous[lo[i] : hi[i]] + cost,  # (1, 2)
+                    before[lo[i] + 1 : hi[i] + 1] + 2 * cost,  # (2, 1)
+                ]
+            )
+            step = np.argmin(candidates, axis=0).astype(np.int8)
+            row[lo[i] + 2 : hi[i] + 2] = np.take_along_axis(
+                candidates, step[None, :].astype(np.intp), axis=0
+            )[0]
+        steps.append(step)
+        before, previous = previous, row
+
+    # Free end: the cheapest cell of the last row
+    i, j = n - 1, int(np.argmin(previous[2:]))
+    if not np.isfinite(previous[j + 2]):
+        return np.array([], dtype=int), np.array([], dtype=int)
+    rows, columns = [i], [j]
+    while i > 0:
+        step = steps[i][j - lo[i]]
+        i, j = (
+            (i - 1, j - 1)
+            if step == 0
+            else (i - 1, j - 2)
+            if step == 1
+            else (i - 2, j - 1)
+        )
+        rows.append(i)
+        columns.append(j)
+    return np.array(rows[::-1]), np.array(columns[::-1])
+
+
+def _pool(features: np.ndarray, factor: int) -> np.ndarray:
+    """Mean of every `factor` rows, renormalized."""
+    usable = len(features) - len(features) % factor
+    pooled = features[:usable].reshape(-1, factor, features.shape[1]).mean(axis=1)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return np.divide(pooled, norms, out=np.zeros_like(pooled), where=norms > 0)
+
+
+def align(query: np.ndarray, reference: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Reference frame for every query frame (and its path), via banded DTW."""
+    n, m = len(query), len(reference)
+    coarse_query = _pool(query, COARSE_FACTOR)
+    coarse_reference = _pool(reference, COARSE_FACTOR)
+
+    if len(coarse_query) < 2 or len(coarse_reference) < 2:
+        lo, hi = np.zeros(n, dtype=int), np.full(n, m)
+    else:
+        rows, columns = dtw(
+            coarse_query,
+            coarse_reference,
+            np.zeros(len(coarse_query), dtype=int),
+            np.full(len(coarse_query), len(coarse_reference)),
+        )
+        if not len(rows):
+            return rows, columns
+        # Band: the coarse route's columns for each fine row, widened
+        coarse_lo = np.full(len(coarse_query), len(coarse_reference))
+        coarse_hi = np.zeros(len(coarse_query), dtype=int)
+        np.minimum.at(coarse_lo, rows, columns)
+        np.maximum.at(coarse_hi, rows, columns + 1)
+        # Rows skipped by (2, 1) steps take their neighbours' columns
+        coarse_lo = np.minimum.accumulate(coarse_lo[::-1])[::-1]
+        coarse_hi = np.maximum.accumulate(coarse_hi)
+        fine_rows = np.minimum(np.arange(n) // COARSE_FACTOR, len(coarse_query) - 1)
+        lo = np.clip(coarse_lo[fine_rows] * COARSE_FACTOR - BAND_RADIUS, 0, m - 1)
+        hi = np.clip(coarse_hi[fine_rows] * COARSE_FACTOR + BAND_RADIUS, lo + 1, m)
+
+    return dtw(query, reference, lo, hi)
+
+
+# MARK: - Measure map
+
+
+def analyze(samples: np.ndarray, sample_rate: int, reference: Reference) -> dict:
+    query = chroma(samples, sample_rate)
+    rows, columns = align(query, reference.chroma)
+
+    similarity = (
+        float(np.mean(np.sum(query[rows] * reference.chroma[columns], axis=1)))
+        if len(rows)
+        else 0.0
+    )
+    matched = similarity >= MIN_SIMILARITY and len(rows) > 0
+
+    positions: list[float | None] = []
+    spans: list[dict] = []
+    if matched:
+        # Reference time of every submission frame, then of every map step
+        frames = np.arange(len(query))
+        reference_seconds = np.interp(frames, rows, columns) / FRAME_RATE
+        boundaries = reference.boundaries
+        measure_index = np.clip(
+            np.searchsorted(boundaries, reference_seconds, side="right") - 1,
+            0,
+            len(reference.measure_numbers) - 1,
+        )
+        numbers = np.array(reference.measure_numbers, dtype=float)
+        lengths = np.diff(boundaries)
+        fraction = np.clip(
+            (reference_seconds - boundaries[measure_index])
+            / np.maximum(lengths[measure_index], 1e-6),
+            0,
+            1,
+        )
+        step = int(MAP_STEP_SECONDS * FRAME_RATE)
+        positions = [
+            round(float(v), 2) for v in (numbers[measure_index] + fraction)[::step]
+        ]
+
+        # The path is monotonic: each measure is one run of frames
+        changes = np.flatnonzero(np.diff(measure_index)) + 1
+        starts = np.concatenate([[0], changes])
+        ends = np.concatenate([changes, [len(frames)]])
+        spans = [
+            {
+                "measure": reference.measure_numbers[measure_index[start]],
+                "start_seconds": round(float(start) / FRAME_RATE, 2),
+                "end_seconds": round(float(end) / FRAME_RATE, 2),
+            }
+            for start, end in zip(starts, ends)
+        ]
+
+    return {
+        "summary": {
+            "similarity": round(similarity, 3),
+            "first_measure": spans[0]["measure"] if spans else None,
+            "last_measure": spans[-1]["measure"] if spans else None,
+        },
+        "measure": {
+            "seconds_per_step": MAP_STEP_SECONDS,
+            "positions": positions,
+        },
+        "spans": spans,
+    }
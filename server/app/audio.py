@@ -0,0 +1,72 @@
+"""
+Decoded audio for the analysis jobs (app.intonation, ...).
+
+Analyses work on mono float32 samples at a fixed rate. Decoding streams through
+an ffmpeg pipe, so only the decoded samples (4 bytes x rate x seconds, ~38 MB
+for 10 minutes at 16 kHz) are ever held, never the video.
+"""
+
+import numpy as np
+
+from app import media
+
+ANALYSIS_SAMPLE_RATE = 16000
+
+
+def load(input_url: str, sample_rate: int = ANALYSIS_SAMPLE_RATE) -> np.ndarray:
+    """The first audio track of `input_url` as mono float32 in [-1, 1]."""
+    pcm = bytearray()
+    for chunk in media.stream_ffmpeg(
+        [
+            "-i",
+            input_url,
+            "-map",
+            "0:a:0",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "-f",
+            "f32le",
+            "pipe:1",
+        ]
+    ):
+        pcm += chunk
+    usable = len(pcm) - len(pcm) % 4
+    return np.frombuffer(pcm, dtype="<f4", count=usable // 4).astype(
+        np.float32, copy=False
+    )
+
+
+def frame(samples: np.ndarray, frame_length: int, hop: int) -> np.ndarray:
+    """
+    Overlapping frames as a (frames, frame_length) strided view, without copying.
+
+    The signal is zero-padded so its tail gets a frame of its own.
+    """
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    else:
+        remainder = (len(samples) - frame_length) % hop
+        if remainder:
+            samples = np.pad(samples, (0, hop - remainder))
+    return np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop]
+
+
+def spectrogram(
+    samples: np.ndarray, n_fft: int, hop: int, block_frames: int = 4096
+) -> np.ndarray:
+    """
+    Magnitude STFT as (frames, n_fft // 2 + 1) float32, Hann-windowed.
+
+    Frames are transformed with one batched rfft per block of the strided frame
+    view, so temporaries stay at a block's size; only the result (~77 MB for 10
+    minutes at 16 kHz with n_fft=1024, hop=256) scales with the recording.
+    """
+    frames = frame(samples, n_fft, hop)
+    window = np.hanning(n_fft).astype(np.float32)
+    magnitude = np.empty((len(frames), n_fft // 2 + 1), dtype=np.float32)
+    for start in range(0, len(frames), block_frames):
+        block = frames[start : start + block_frames] * window
+        magnitude[start : start + len(block)] = np.abs(np.fft.rfft(block, axis=1))
+    return magnitude
@@ -0,0 +1,170 @@
+"""
+Queue submission analyses for videos uploaded before they existed (or analysed
+by an older version of them).
+
+For every complete submission, each analysis in tasks.SUBMISSION_ANALYSES that
+has no stored result at its current VERSION, and isn't already queued, gets a
+job. Submissions are paged by id and each page committed on its own, so a large
+archive can be queued while workers are already draining it. The jobs run on
+`python -m app.media_worker`, which uses one process per core by default.
+
+Usage:
+    python -m app.backfill              # Dry run: report what would be queued
+    python -m app.backfill --enqueue    # Queue the jobs
+    python -m app.backfill --enqueue --kind analysis.tempo
+"""
+
+import argparse
+from dataclasses import dataclass, field
+
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col, select
+
+from app import alignment, intonation, jobs, models, tasks, tempo
+
+# Job kind -> (SubmissionAnalysis.kind, current version)
+ANALYSES = {
+    "analysis.intonation": ("intonation", intonation.VERSION),
+    "analysis.tempo": ("tempo", tempo.VERSION),
+    "analysis.alignment": ("alignment", alignment.VERSION),
+}
+
+PAGE_SIZE = 500
+
+
+@dataclass
+class BackfillReport:
+    dry_run: bool
+    scanned: int = 0
+    queued: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        action = "would queue" if self.dry_run else "queued"
+        lines = [f"Scanned {self.scanned} submissions"]
+        lines += [f"  {kind}: {action} {n}" for kind, n in self.queued.items()]
+        return "\n".join(lines)
+
+
+def _pending(db: Session, kinds: list[str]) -> set[tuple[str, str]]:
+    """(kind, submission id) of analysis jobs still waiting to run."""
+    pending = db.exec(
+        select(models.Job).where(
+            col(models.Job.kind).in_(kinds),
+            col(models.Job.status).in_(["queued", "running"]),
+        )
+    ).all()
+    return {(job.kind, job.payload.get("id")) for job in pending}
+
+
+def _with_reference(db: Session, ids: list) -> set:
+    """Submissions among `ids` whose piece (or its original) has a reference."""
+    original = aliased(models.Piece)
+    return set(
+        db.exec(
+            select(models.VideoSubmission.id)
+            .join(models.Piece, models.Piece.id == models.VideoSubmission.piece_id)
+            .join(
+                original,
+                original.id == models.Piece.shared_from_piece_id,
+                isouter=True,
+            )
+            .where(
+                col(models.VideoSubmission.id).in_(ids),
+                or_(
+                    col(models.Piece.reference_s3_key).is_not(None),
+                    col(original.reference_s3_key).is_not(None),
+                ),
+            )
+        ).all()
+    )
+
+
+def backfill(
+    db: Session,
+    *,
+    kinds: list[str] | None = None,
+    dry_run: bool = True,
+    page_size: int = PAGE_SIZE,
+) -> BackfillReport:
+    """Find (and unless `dry_run`, queue) missing or outdated analyses."""
+    kinds = kinds or tasks.SUBMISSION_ANALYSES
+    report = BackfillReport(dry_run=dry_run, queued={kind: 0 for kind in kinds})
+    pending = _pending(db, kinds)
+    latest = dict(ANALYSES.values())
+
+    after = None
+    while True:
+        query = select(models.VideoSubmission.id).where(
+            models.VideoSubmission.upload_state == "complete"
+        )
+        if after is not None:
+            query = query.where(models.VideoSubmission.id > after)
+        ids = db.exec(query.order_by(models.VideoSubmission.id).limit(page_size)).all()
+        if not ids:
+            break
+        after = ids[-1]
+        report.scanned += len(ids)
+
+        stored = db.exec(
+            select(
+                models.SubmissionAnalysis.submission_id,
+                models.SubmissionAnalysis.kind,
+                models.SubmissionAnalysis.version,
+            ).where(col(models.SubmissionAnalysis.submission_id).in_(ids))
+        ).all()
+        current = {
+            (submission_id, kind)
+            for submission_id, kind, version in stored
+            if version >= latest.get(kind, version + 1)
+        }
+
+        referenced = (
+            _with_reference(db, ids) if "analysis.alignment" in kinds else set()
+        )
+
+        for submission_id in ids:
+            for kind in kinds:
+                analysis, _ = ANALYSES[kind]
+                if (submission_id, analysis) in current:
+                    continue
+                # Nothing to align to; attaching a reference queues these
+                if kind == "analysis.alignment" and submission_id not in referenced:
+                    continue
+                if (kind, str(submission_id)) in pending:
+                    continue
+                report.queued[kind] += 1
+                if not dry_run:
+                    jobs.enqueue(
+                        db,
+                        kind,
+                        {"resource": "video_submission", "id": str(submission_id)},
+                    )
+        if not dry_run:
+            db.commit()
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--enqueue", action="store_true", help="Queue the jobs (default: dry run)"
+    )
+    parser.add_argument(
+        "--kind",
+        action="append",
+        choices=tasks.SUBMISSION_ANALYSES,
+        help="Only this analysis (repeatable; default: all)",
+    )
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    with Session(engine) as db:
+        report = backfill(db, kinds=args.kind, dry_run=not args.enqueue)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+CloudFront signed URLs for downloads (DOWNLOAD_DELIVERY=cdn).
+
+Presigned S3 GETs can't be edge-cached and every fetch is an S3 request. In CDN
+mode download URLs point at a CloudFront distribution whose origin is the bucket,
+signed with a canned policy. CloudFront strips Expires/Signature/Key-Pair-Id from
+the cache key, so everyone downloading a popular bundled score or a video under
+repeated review shares one cached copy however their URLs were signed.
+
+Content-addressed PDFs never change, so their URLs are signed for a day at a time
+and the objects carry an immutable Cache-Control (see app.storage). Other keys can
+be overwritten by a re-upload and use the same hourly expiry as S3 URLs.
+
+Without CDN_PRIVATE_KEY (dev and tests) an HMAC stand-in replaces the RSA signer;
+verify_url checks those URLs the way the edge would.
+"""
+
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable, Iterable, Optional
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+from botocore.signers import CloudFrontSigner
+from cachetools import TLRUCache
+
+from app import storage
+from app.config import settings
+from app.s3 import DOWNLOAD_URL_BUCKET_SECONDS, DOWNLOAD_URL_REFRESH_MARGIN_SECONDS
+
+IMMUTABLE_URL_BUCKET_SECONDS = 24 * 3600
+IMMUTABLE_URL_REFRESH_MARGIN_SECONDS = 3600
+LOCAL_KEY_PAIR_ID = "LOCAL"
+
+_SIGNED_PARAMS = ("Expires", "Signature", "Key-Pair-Id")
+
+
+def _local_sign(message: bytes) -> bytes:
+    """Stand-in for CloudFront's RSA-SHA1 signature in dev and tests."""
+    key = hmac.new(
+        settings.jwt_secret_key.encode(), b"cadenza-cdn", hashlib.sha256
+    ).digest()
+    return hmac.new(key, message, hashlib.sha256).digest()
+
+
+def _rsa_signer(private_key_pem: str) -> Callable[[bytes], bytes]:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    private_key = serialization.load_pem_private_key(
+        private_key_pem.encode(), password=None
+    )
+    # CloudFront only accepts SHA-1 signatures
+    return lambda message: private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+
+@lru_cache(maxsize=1)
+def _get_signer(private_key_pem: Optional[str], key_pair_id: str) -> CloudFrontSigner:
+    """Signer for the configured key; parsing the PEM happens once per process."""
+    if private_key_pem:
+        return CloudFrontSigner(key_pair_id, _rsa_signer(private_key_pem))
+    return CloudFrontSigner(LOCAL_KEY_PAIR_ID, _local_sign)
+
+
+def _resource_url(s3_key: str) -> str:
+    return f"{settings.cdn_base_url.rstrip('/')}/{quote(s3_key)}"
+
+
+def _url_expiry(s3_key: str, now: float) -> int:
+    """First bucket boundary that leaves more than the refresh margin."""
+    if storage.is_content_addressed(s3_key):
+        size, margin = (
+            IMMUTABLE_URL_BUCKET_SECONDS,
+            IMMUTABLE_URL_REFRESH_MARGIN_SECONDS,
+        )
+    else:
+        size, margin = DOWNLOAD_URL_BUCKET_SECONDS, DOWNLOAD_URL_REFRESH_MARGIN_SECONDS
+    return (int(now + margin) // size + 1) * size
+
+
+def _refresh_margin(s3_key: str) -> int:
+    if storage.is_content_addressed(s3_key):
+        return IMMUTABLE_URL_REFRESH_MARGIN_SECONDS
+    return DOWNLOAD_URL_REFRESH_MARGIN_SECONDS
+
+
+# Like S3 URLs, a key's URL is identical across processes within a bucket and is
+# reused until shortly before it expires; RSA signing is the expensive part.
+_signed_url_cache: TLRUCache[str, tuple[str, int]] = TLRUCache(
+    maxsize=10_000,
+    ttu=lambda key, value, _now: value[1] - _refresh_margin(key),
+    timer=lambda: time.time(),
+)
+_signed_url_cache_lock = threading.Lock()
+
+
+def generate_download_urls(s3_keys: Iterable[str]) -> dict[str, dict]:
+    """CloudFront signed URLs, signing only keys not already cached."""
+    now = time.time()
+    signed: dict[str, tuple[str, int]] = {}
+    missing = []
+
+    with _signed_url_cache_lock:
+        for s3_key in set(s3_keys):
+            cached = _signed_url_cache.get(s3_key)
+            if cached is None:
+                missing.append(s3_key)
+            else:
+                signed[s3_key] = cached
+
+    if missing:
+        signer = _get_signer(settings.cdn_private_key, settings.cdn_key_pair_id)
+        fresh = {}
+        for s3_key in missing:
+            expires_at = _url_expiry(s3_key, now)
+            url = signer.generate_presigned_url(
+                _resource_url(s3_key),
+                date_less_than=datetime.fromtimestamp(expires_at, timezone.utc),
+            )
+            fresh[s3_key] = (url, expires_at)
+
+        with _signed_url_cache_lock:
+            _signed_url_cache.update(fresh)
+        signed.update(fresh)
+
+    return {
+        s3_key: {"url": url, "expires_in": expires_at - int(now)}
+        for s3_key, (url, expires_at) in signed.items()
+    }
+
+
+def verify_url(url: str, now: float | None = None) -> bool:
+    """
+    Check a URL signed by the local stand-in, as CloudFront checks real ones.
+
+    The canned policy is rebuilt from the URL minus its signing parameters, so a
+    changed path, query or expiry invalidates the signature.
+    """
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    signing = dict(param for param in params if param[0] in _SIGNED_PARAMS)
+    if set(signing) != set(_SIGNED_PARAMS) or not signing["Expires"].isdigit():
+        return False
+
+    expires_at = int(signing["Expires"])
+    if expires_at <= (time.time() if now is None else now):
+        return False
+
+    resource = urlunsplit(
+        parts._replace(
+            query=urlencode([p for p in params if p[0] not in _SIGNED_PARAMS])
+        )
+    )
+    signer = CloudFrontSigner(LOCAL_KEY_PAIR_ID, _local_sign)
+    policy = signer.build_policy(
+        resource, datetime.fromtimestamp(expires_at, timezone.utc)
+    ).encode()
+    expected = (
+        base64.b64encode(_local_sign(policy))
+        .decode()
+        .translate(str.maketrans("+=/", "-_~"))
+    )
+    return hmac.compare_digest(signing["Signature"], expected) and (
+        signing["Key-Pair-Id"] == LOCAL_KEY_PAIR_ID
+    )
@@ -0,0 +1,255 @@
+"""
+HLS adaptive-bitrate packaging and playback for submission and message videos.
+
+Phone recordings are often 1080p at 10+ Mbit/s, which stalls on cellular. Once a
+video is finalized, the media.transcode_hls job (app.tasks) packages it as an HLS
+ladder under its derived prefix:
+
+    {video key without .mp4}/hls/master.m3u8
+    {video key without .mp4}/hls/{rendition}/index.m3u8, seg_000.ts, ...
+
+Players start on the first variant in the master playlist, so the ladder leads
+with a small rendition and short first segment; startup needs ~100 KB instead of
+the first megabytes of the original.
+
+Segments are private objects, so playlists are served by the API (/hls/{token}/):
+the token grants one video's prefix until it expires, the master playlist's
+relative URIs resolve back to /hls/{token}/, and each media playlist is rewritten
+to point its segments at presigned (or CDN-signed) storage URLs.
+"""
+
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import jwt
+from cachetools import TTLCache
+
+from app import media, storage
+from app.config import settings
+
+MASTER_PLAYLIST = "master.m3u8"
+MEDIA_PLAYLIST = "index.m3u8"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_CONTENT_TYPE = "video/mp2t"
+SEGMENT_SECONDS = 4
+FIRST_SEGMENT_SECONDS = 2
+TOKEN_AUDIENCE = "hls"
+PLAYLIST_MAX_AGE_SECONDS = 300
+
+
+@dataclass(frozen=True)
+class Rendition:
+    name: str
+    height: Optional[int]  # None for the audio-only rendition
+    video_kbps: int
+    audio_kbps: int
+
+
+# Master playlist order: the first entry is where playback starts
+LADDER = (
+    Rendition("480p", 480, 1000, 96),
+    Rendition("240p", 240, 300, 64),
+    Rendition("720p", 720, 2500, 128),
+    Rendition("1080p", 1080, 5000, 128),
+    Rendition("audio", None, 0, 64),
+)
+LOWEST_VIDEO_HEIGHT = 240
+
+
+def select_ladder(info: media.MediaInfo) -> list[Rendition]:
+    """Renditions worth producing: no upscaling, no audio-only without audio."""
+    source_height = info.height or 0
+    ladder = []
+    for rendition in LADDER:
+        if rendition.height is None:
+            if info.audio_codec:
+                ladder.append(rendition)
+        elif info.video_codec and (
+            rendition.height <= source_height or rendition.height == LOWEST_VIDEO_HEIGHT
+        ):
+            ladder.append(rendition)
+    return ladder
+
+
+def ffmpeg_args(
+    input_url: str, out_dir: Path, ladder: list[Rendition], has_audio: bool
+) -> list[str]:
+    """One ffmpeg run that decodes once and encodes every rendition."""
+    videos = [r for r in ladder if r.height is not None]
+    args = ["-i", input_url]
+
+    if videos:
+        splits = "".join(f"[v{i}]" for i in range(len(videos)))
+        scales = ";".join(
+            f"[v{i}]scale=-2:{r.height}[v{i}out]" for i, r in enumerate(videos)
+        )
+        args += ["-filter_complex", f"[0:v]split={len(videos)}{splits};{scales}"]
+
+    stream_map = []
+    audio_index = 0
+    for rendition in ladder:
+        entry = []
+        if rendition.height is not None:
+            v = videos.index(rendition)
+            kbps = rendition.video_kbps
+            args += [
+                "-map",
+                f"[v{v}out]",
+                f"-c:v:{v}",
+                "libx264",
+                f"-b:v:{v}",
+                f"{kbps}k",
+                f"-maxrate:v:{v}",
+                f"{kbps * 11 // 10}k",
+                f"-bufsize:v:{v}",
+                f"{kbps * 2}k",
+            ]
+            entry.append(f"v:{v}")
+        if has_audio:
+            args += [
+                "-map",
+                "0:a:0",
+                f"-c:a:{audio_index}",
+                "aac",
+                f"-b:a:{audio_index}",
+                f"{rendition.audio_kbps}k",
+            ]
+            entry.append(f"a:{audio_index}")
+            audio_index += 1
+        stream_map.append(",".join([*entry, f"name:{rendition.name}"]))
+
+    args += [
+        "-preset",
+        "veryfast",
+        "-profile:v",
+        "main",
+        # Keyframe every 2s so segments (and the short first one) cut cleanly
+        "-force_key_frames",
+        "expr:gte(t,n_forced*2)",
+        "-sc_threshold",
+        "0",
+        "-f",
+        "hls",
+        "-hls_time",
+        str(SEGMENT_SECONDS),
+        "-hls_init_time",
+        str(FIRST_SEGMENT_SECONDS),
+        "-hls_playlist_type",
+        "vod",
+        "-hls_flags",
+        "independent_segments",
+        "-master_pl_name",
+        MASTER_PLAYLIST,
+        "-var_stream_map",
+        " ".join(stream_map),
+        "-hls_segment_filename",
+        str(out_dir / "%v" / "seg_%03d.ts"),
+        str(out_dir / "%v" / MEDIA_PLAYLIST),
+    ]
+    return args
+
+
+def transcode(input_url: str, out_dir: Path, info: media.MediaInfo) -> list[dict]:
+    """
+    Package `input_url` as HLS in `out_dir`. Returns the renditions produced.
+
+    Each rendition is {name, height, bandwidth (bits/s), playlist (relative path)}.
+    """
+    ladder = select_ladder(info)
+    if not ladder:
+        raise Exception("Video has no video or audio stream to transcode")
+
+    media.run_ffmpeg(ffmpeg_args(input_url, out_dir, ladder, bool(info.audio_codec)))
+
+    return [
+        {
+            "name": rendition.name,
+            "height": rendition.height,
+            "bandwidth": (rendition.video_kbps + rendition.audio_kbps) * 1000,
+            "playlist": f"{rendition.name}/{MEDIA_PLAYLIST}",
+        }
+        for rendition in ladder
+    ]
+
+
+def content_type(path: Path) -> str:
+    return PLAYLIST_CONTENT_TYPE if path.suffix == ".m3u8" else SEGMENT_CONTENT_TYPE
+
+
+# MARK: - Playback
+
+
+def playlist_path(hls_prefix: str) -> dict:
+    """
+    Signed path of a video's master playlist, served by /hls/{token}/.
+
+    Expires with the storage URLs of its segments (same hour boundary), so the
+    path is stable within the hour.
+    """
+    expires_in = storage.generate_download_url(f"{hls_prefix}{MASTER_PLAYLIST}")[
+        "expires_in"
+    ]
+    token = jwt.encode(
+        {
+            "prefix": hls_prefix,
+            "aud": TOKEN_AUDIENCE,
+            "exp": int(time.time()) + expires_in,
+        },
+        settings.jwt_secret_key,
+        algorithm=settings.jwt_algorithm,
+    )
+    return {"path": f"/hls/{token}/{MASTER_PLAYLIST}", "expires_in": expires_in}
+
+
+def prefix_from_token(token: str) -> Optional[str]:
+    """The HLS prefix a playlist token grants, or None if invalid or expired."""
+    try:
+        payload = jwt.decode(
+            token,
+            settings.jwt_secret_key,
+            algorithms=[settings.jwt_algorithm],
+            audience=TOKEN_AUDIENCE,
+        )
+    except jwt.InvalidTokenError:
+        return None
+    return payload.get("prefix")
+
+
+# Playlists only change when a re-upload is transcoded; don't GET them per request
+_playlist_cache: TTLCache[str, str] = TTLCache(
+    maxsize=2048, ttl=PLAYLIST_MAX_AGE_SECONDS
+)
+
+
+def read_playlist(s3_key: str) -> str:
+    playlist = _playlist_cache.get(s3_key)
+    if playlist is None:
+        playlist = b"".join(storage.iter_object(s3_key, 64 * 1024)).decode()
+        _playlist_cache[s3_key] = playlist
+    return playlist
+
+
+def sign_media_playlist(playlist: str, rendition_prefix: str) -> tuple[str, int]:
+    """
+    Point every segment URI at a signed storage URL.
+
+    Returns the rewritten playlist and seconds until its URLs expire.
+    """
+    lines = playlist.splitlines()
+    segments = [line for line in lines if line and not line.startswith("#")]
+    urls = storage.generate_download_urls(
+        f"{rendition_prefix}{segment}" for segment in segments
+    )
+    signed = [
+        line
+        if not line or line.startswith("#")
+        else urls[f"{rendition_prefix}{line}"]["url"]
+        for line in lines
+    ]
+    expires_in = min(
+        (url["expires_in"] for url in urls.values()),
+        default=storage.DOWNLOAD_URL_BUCKET_SECONDS,
+    )
+    return "\n".join(signed) + "\n", expires_in
@@ -0,0 +1,199 @@
+"""
+Intonation analysis of submission audio.
+
+A YIN pitch track is computed for the whole recording as array operations over
+all frames: the signal is framed once (a strided view), and the YIN difference
+function comes from one batched FFT autocorrelation per block of frames plus
+cumulative energy sums. There's no per-frame Python, so a 10-minute recording
+takes a couple of seconds on one core.
+
+Each voiced frame's deviation is measured in cents from the nearest
+equal-tempered note, relative to the player's own tuning (the median deviation,
+reported as tuning_offset_cents), so an A tuned to 442 Hz isn't read as
+everything being sharp.
+
+The result stored on the submission (models.SubmissionAnalysis, kind
+"intonation") is:
+
+    summary     voiced_seconds, tuning_offset_cents, mean_abs_cents,
+                within_10_cents (fraction of voiced frames), pitch_range_hz
+    histogram   {bin_cents, counts}: voiced frames per 5-cent bin, -50 to +50
+    per_second  {mean_cents, mean_abs_cents}: one value per second of audio,
+                None where nothing was played
+"""
+
+import numpy as np
+
+from app import audio
+
+VERSION = 1
+
+FRAME_LENGTH = 1024  # 64 ms at 16 kHz: several periods of the lowest pitch
+HOP = 320  # 20 ms
+MIN_HZ = 60.0  # Below cello C (65 Hz)
+MAX_HZ = 2000.0
+YIN_THRESHOLD = 0.15
+# Frames quieter than this (RMS, full scale = 1) are silence, not notes
+SILENCE_RMS = 0.01
+HISTOGRAM_BIN_CENTS = 5
+# Frames per FFT batch: bounds the working set to a few tens of MB
+BLOCK_FRAMES = 4096
+
+
+def _difference(frames: np.ndarray, max_lag: int) -> np.ndarray:
+    """YIN difference function d(tau) for every frame, tau in [0, max_lag)."""
+    window = frames.shape[1] - max_lag
+    # j + tau < frame length for every term, so a frame-length circular
+    # correlation has no wrap-around and needs no zero padding
+    n_fft = 1 << int(np.ceil(np.log2(frames.shape[1])))
+
+    # Cross term sum_j x[j] x[j + tau] over the integration window
+    head = np.fft.rfft(frames[:, :window], n_fft)
+    full = np.fft.rfft(frames, n_fft)
+    cross = np.fft.irfft(np.conj(head) * full, n_fft)[:, :max_lag]
+
+    # Energy of x[tau : tau + window] for every tau, from one cumulative sum
+    energy = np.cumsum(np.square(frames, dtype=np.float64), axis=1)
+    energy = np.pad(energy, ((0, 0), (1, 0)))
+    lagged = energy[:, window : window + max_lag] - energy[:, :max_lag]
+
+    difference = energy[:, window : window + 1] + lagged - 2 * cross
+    difference[:, 0] = 0
+    return np.maximum(difference, 0)
+
+
+def _cumulative_mean_normalized(difference: np.ndarray) -> np.ndarray:
+    lags = np.arange(difference.shape[1])
+    running = np.cumsum(difference[:, 1:], axis=1)
+    normalized = np.ones_like(difference)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normalized[:, 1:] = difference[:, 1:] * lags[1:] / running
+    return np.nan_to_num(normalized, nan=1.0, posinf=1.0)
+
+
+def _pick_lags(normalized: np.ndarray, min_lag: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    YIN's absolute threshold step for all frames at once.
+
+    For each frame, the first dip below the threshold is followed to its
+    minimum. Returns (lag, voiced); lags of unvoiced frames are meaningless.
+    """
+    candidates = normalized[:, min_lag:]
+    below = candidates < YIN_THRESHOLD
+    voiced = below.any(axis=1)
+    first = np.argmax(below, axis=1)
+
+    # The contiguous run of below-threshold lags starting at `first`
+    lags = np.arange(candidates.shape[1])
+    after = lags >= first[:, None]
+    in_dip = np.logical_and.accumulate(below | ~after, axis=1) & after
+    lag = np.argmin(np.where(in_dip, candidates, np.inf), axis=1) + min_lag
+    return lag, voiced
+
+
+def _refine(difference: np.ndarray, lag: np.ndarray) -> np.ndarray:
+    """
+    Sub-sample lags by parabolic interpolation of each frame's dip.
+
+    Interpolates the raw difference function, as the normalized one is skewed
+    at short lags (high notes).
+    """
+    rows = np.arange(len(lag))
+    inner = np.clip(lag, 1, difference.shape[1] - 2)
+    left = difference[rows, inner - 1]
+    center = difference[rows, inner]
+    right = difference[rows, inner + 1]
+    curvature = left - 2 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(curvature > 0, 0.5 * (left - right) / curvature, 0.0)
+    return inner + np.clip(shift, -1, 1)
+
+
+def pitch_track(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Fundamental frequency per HOP samples, NaN where unvoiced or silent."""
+    frames = audio.frame(samples, FRAME_LENGTH, HOP)
+    max_lag = min(int(sample_rate / MIN_HZ) + 2, FRAME_LENGTH // 2)
+    min_lag = max(int(sample_rate / MAX_HZ), 2)
+
+    f0 = np.full(len(frames), np.nan)
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = np.asarray(frames[start : start + BLOCK_FRAMES], dtype=np.float32)
+        difference = _difference(block, max_lag)
+        lag, voiced = _pick_lags(_cumulative_mean_normalized(difference), min_lag)
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float64), axis=1))
+        voiced &= rms >= SILENCE_RMS
+        f0[start : start + len(block)] = np.where(
+            voiced, sample_rate / _refine(difference, lag), np.nan
+        )
+    return f0
+
+
+def _wrap_cents(cents: np.ndarray) -> np.ndarray:
+    """Into [-50, 50): distance from the nearest semitone."""
+    return (cents + 50) % 100 - 50
+
+
+def analyze(samples: np.ndarray, sample_rate: int) -> dict:
+    f0 = pitch_track(samples, sample_rate)
+    voiced = ~np.isnan(f0)
+    frame_seconds = HOP / sample_rate
+
+    # Cents above A440, then relative to the nearest note and the player's tuning
+    cents = 1200 * np.log2(f0[voiced] / 440.0)
+    raw = _wrap_cents(cents)
+    # Circular median: unwrap around the mean direction before taking it
+    angle = np.angle(np.mean(np.exp(1j * np.pi * raw / 50))) if raw.size else 0.0
+    center = 50 * angle / np.pi
+    tuning_offset = (
+        float(center + np.median(_wrap_cents(raw - center))) if raw.size else 0.0
+    )
+    deviation = _wrap_cents(raw - tuning_offset)
+
+    edges = np.arange(-50, 50 + HISTOGRAM_BIN_CENTS, HISTOGRAM_BIN_CENTS)
+    counts, _ = np.histogram(deviation, bins=edges)
+
+    # Per-second means from bincount over each voiced frame's second
+    seconds = int(np.ceil(len(samples) / sample_rate))
+    second_of_frame = (np.nonzero(voiced)[0] * frame_seconds).astype(int)
+    frames_per_second = np.bincount(second_of_frame, minlength=seconds)[:seconds]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (
+            np.bincount(second_of_frame, weights=deviation, minlength=seconds)[:seconds]
+            / frames_per_second
+        )
+        mean_abs = (
+            np.bincount(second_of_frame, weights=np.abs(deviation), minlength=seconds)[
+                :seconds
+            ]
+            / frames_per_second
+        )
+
+    def series(values: np.ndarray) -> list[float | None]:
+        return [None if np.isnan(v) else round(float(v), 1) for v in values]
+
+    return {
+        "summary": {
+            "voiced_seconds": round(float(voiced.sum() * frame_seconds), 1),
+            "tuning_offset_cents": round(tuning_offset, 1),
+            "mean_abs_cents": round(float(np.mean(np.abs(deviation))), 1)
+            if deviation.size
+            else None,
+            "within_10_cents": round(float(np.mean(np.abs(deviation) <= 10)), 3)
+            if deviation.size
+            else None,
+            "pitch_range_hz": [
+                round(float(np.percentile(f0[voiced], 5)), 1),
+                round(float(np.percentile(f0[voiced], 95)), 1),
+            ]
+            if deviation.size
+            else None,
+        },
+        "histogram": {
+            "bin_cents": edges[:-1].tolist(),
+            "counts": counts.tolist(),
+        },
+        "per_second": {
+            "mean_cents": series(mean),
+            "mean_abs_cents": series(mean_abs),
+        },
+    }
@@ -0,0 +1,266 @@
+"""
+Database-backed job queue.
+
+Endpoints enqueue work in their own transaction and return immediately; app.worker
+processes (and app.media_worker, for CPU-heavy media.* and analysis.* jobs) claim
+jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can share
+the table without handing out the same job twice. SQLite (used in tests) has no
+row locks and ignores the clause, which is fine for one worker.
+
+Handlers are plain functions registered by kind:
+
+    @job_handler("storage.delete_objects")
+    def delete_objects(db: Session, payload: dict) -> dict | None: ...
+
+A handler that raises is retried with exponential backoff until max_attempts.
+Handlers run inside the claiming worker's session; whatever they add is
+committed with the job's result.
+"""
+
+import random
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, or_, update
+from sqlmodel import Session, col, func, select
+
+from app import models
+from app.config import settings
+
+JobHandler = Callable[[Session, dict], Optional[dict]]
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Register a function as the handler for jobs of `kind`."""
+
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+
+    return register
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: dict,
+    *,
+    created_by_id: int | None = None,
+    run_at: datetime | None = None,
+    max_attempts: int | None = None,
+) -> models.Job:
+    """Add a job to the caller's transaction. It runs once the caller commits."""
+    job = models.Job(
+        kind=kind,
+        payload=payload,
+        created_by_id=created_by_id,
+        run_at=run_at or datetime.now(timezone.utc),
+        max_attempts=max_attempts or settings.job_max_attempts,
+    )
+    db.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff with jitter, capped at settings.job_retry_max_seconds."""
+    delay = min(
+        settings.job_retry_base_seconds * 2 ** (attempts - 1),
+        settings.job_retry_max_seconds,
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _kind_filter(only: tuple[str, ...] | None, exclude: tuple[str, ...] | None):
+    """Where-clause terms selecting job kinds by prefix ("media.", ...)."""
+    terms = []
+    if only is not None:
+        terms.append(or_(*(col(models.Job.kind).startswith(p) for p in only)))
+    for prefix in exclude or ():
+        terms.append(~col(models.Job.kind).startswith(prefix))
+    return terms
+
+
+def claim(
+    db: Session,
+    worker_id: str,
+    *,
+    only: tuple[str, ...] | None = None,
+    exclude: tuple[str, ...] | None = None,
+) -> models.Job | None:
+    """
+    Lock the next runnable job and mark it running.
+
+    `only`/`exclude` restrict the kinds claimed by prefix. Jobs whose worker died
+    mid-run are claimable again once their lease expires, unless that was their
+    last attempt: a job that kills its worker (out of memory, say) never reaches
+    execute()'s retry limit, so it's failed here instead.
+    """
+    now = datetime.now(timezone.utc)
+    lease_expired = now - timedelta(seconds=settings.job_lease_seconds)
+
+    while True:
+        job = db.exec(
+            select(models.Job)
+            .where(
+                or_(
+                    and_(models.Job.status == "queued", models.Job.run_at <= now),
+                    and_(
+                        models.Job.status == "running",
+                        models.Job.locked_at < lease_expired,
+                    ),
+                ),
+                *_kind_filter(only, exclude),
+            )
+            .order_by(models.Job.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if job is None:
+            db.rollback()
+            return None
+        if job.status == "queued":
+            break
+
+        job.last_error = f"Lease of worker {job.locked_by} expired mid-run"
+        if job.attempts < job.max_attempts:
+            break
+        job.status = "failed"
+        job.finished_at = now
+        job.locked_by = None
+        job.locked_at = None
+        db.add(job)
+        db.commit()
+
+    job.status = "running"
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_at = now
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def renew(db: Session, job_ids: list[UUID], worker_id: str) -> list[UUID]:
+    """
+    Extend the leases of jobs `worker_id` is still running. Returns the ids
+    renewed: the others' leases were lost (the job was claimed again or failed).
+    """
+    if not job_ids:
+        return []
+    renewed = db.exec(
+        update(models.Job)
+        .where(
+            col(models.Job.id).in_(job_ids),
+            models.Job.locked_by == worker_id,
+            models.Job.status == "running",
+        )
+        .values(locked_at=datetime.now(timezone.utc))
+        .returning(models.Job.id)
+    ).scalars()
+    renewed = list(renewed)
+    db.commit()
+    return renewed
+
+
+def runnable_count(
+    db: Session,
+    *,
+    only: tuple[str, ...] | None = None,
+    exclude: tuple[str, ...] | None = None,
+) -> int:
+    """Queued jobs whose run_at has passed: the backlog workers haven't reached."""
+    return db.exec(
+        select(func.count())
+        .select_from(models.Job)
+        .where(
+            models.Job.status == "queued",
+            models.Job.run_at <= datetime.now(timezone.utc),
+            *_kind_filter(only, exclude),
+        )
+    ).one()
+
+
+def execute(db: Session, job: models.Job) -> models.Job:
+    """
+    Run a claimed job's handler and record the outcome, unless the job's lease
+    expired mid-run and it has since been claimed again (or failed): the outcome
+    is then the current holder's to record.
+    """
+    handler = _handlers.get(job.kind)
+    job_id, kind = job.id, job.kind
+    worker_id, attempt = job.locked_by, job.attempts
+
+    error = None
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job kind '{kind}'")
+        result = handler(db, dict(job.payload))
+    except Exception:
+        db.rollback()
+        error = traceback.format_exc(limit=5)
+
+    job = db.get(models.Job, job_id, populate_existing=True, with_for_update=True)
+    if (
+        job is None
+        or job.status != "running"
+        or job.locked_by != worker_id
+        or job.attempts != attempt
+    ):
+        print(f"[JOB] {kind} {job_id}: lease lost mid-run, outcome not recorded")
+        db.rollback()
+        return job
+
+    if error is not None:
+        _record_failure(job, error, retry=handler is not None)
+    else:
+        job.status = "succeeded"
+        job.result = result
+        job.finished_at = datetime.now(timezone.utc)
+
+    job.locked_by = None
+    job.locked_at = None
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _record_failure(job: models.Job, error: str, *, retry: bool) -> None:
+    """Queue a retry with backoff, or fail the job once it's out of attempts."""
+    job.last_error = error
+    if retry and job.attempts < job.max_attempts:
+        job.status = "queued"
+        job.run_at = datetime.now(timezone.utc) + retry_delay(job.attempts)
+    else:
+        job.status = "failed"
+        job.finished_at = datetime.now(timezone.utc)
+
+
+def record_crash(db: Session, job_id: UUID, worker_id: str, error: str) -> None:
+    """
+    Count a failed attempt for a job whose process died mid-run, so it's retried
+    (or failed) now rather than after its lease expires.
+    """
+    job = db.get(models.Job, job_id, populate_existing=True)
+    if job is None or job.status != "running" or job.locked_by != worker_id:
+        return
+    _record_failure(job, error, retry=True)
+    job.locked_by = None
+    job.locked_at = None
+    db.add(job)
+    db.commit()
+
+
+def run_next(
+    db: Session, worker_id: str, *, exclude: tuple[str, ...] | None = None
+) -> models.Job | None:
+    """Claim and run one job. Returns None when nothing is runnable."""
+    job = claim(db, worker_id, exclude=exclude)
+    if job is None:
+        return None
+    return execute(db, job)
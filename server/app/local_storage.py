@@ -0,0 +1,574 @@
+"""
+Local-disk storage backend (STORAGE_BACKEND=local).
+
+Objects are files under settings.local_storage_path, named by their key. Presigned
+URLs point back at this API's /storage routes and carry an HMAC signature and expiry
+in place of SigV4, so clients upload and download exactly as they do against S3:
+PUT to the upload URL with the returned headers, GET the download URL (with Range
+for seeking). Multipart uploads keep their parts under .uploads/ until completed.
+Content-Type and Cache-Control are derived from the key when serving, so the
+metadata arguments the S3 backend stores are accepted and ignored.
+
+Downloads are served from the API process. When an nginx `internal` location is
+configured (local_storage_accel_redirect), the response is an X-Accel-Redirect and
+nginx sends the file with sendfile and handles Range itself; otherwise the file is
+streamed with single-range support.
+"""
+
+import base64
+import hashlib
+import hmac
+import mimetypes
+import os
+import secrets
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, Mapping, Optional
+from urllib.parse import quote, urlencode
+
+import anyio
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from app import storage
+from app.config import settings
+from app.s3 import (
+    DOWNLOAD_URL_BUCKET_SECONDS,
+    DOWNLOAD_URL_REFRESH_MARGIN_SECONDS,
+    UPLOAD_URL_EXPIRES_IN,
+)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+UPLOADS_DIR = ".uploads"
+TEMP_PREFIX = ".tmp-"
+
+
+# MARK: - Paths
+
+
+def _root() -> Path:
+    return Path(settings.local_storage_path).resolve()
+
+
+def _path(s3_key: str) -> Path:
+    """File for a key. Keys can't leave the root or name internal directories."""
+    root = _root()
+    path = (root / s3_key).resolve()
+    if root not in path.parents or s3_key.split("/", 1)[0].startswith("."):
+        raise ValueError(f"Invalid storage key: {s3_key}")
+    return path
+
+
+def _temp_path(directory: Path) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{TEMP_PREFIX}{secrets.token_hex(8)}"
+
+
+def _write_atomically(dest: Path, fileobj: BinaryIO) -> None:
+    """Readers see the old file or the new one, never a partial write."""
+    temp = _temp_path(dest.parent)
+    try:
+        with open(temp, "wb") as out:
+            shutil.copyfileobj(fileobj, out, COPY_CHUNK_SIZE)
+        os.replace(temp, dest)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+def _etag(stat: os.stat_result) -> str:
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+# MARK: - Signing
+
+
+def _signing_key() -> bytes:
+    # Derived so a storage URL signature can never be replayed as a JWT (or back)
+    return hmac.new(
+        settings.jwt_secret_key.encode(), b"cadenza-local-storage", hashlib.sha256
+    ).digest()
+
+
+def _signature(
+    method: str, s3_key: str, params: Mapping[str, str], headers: Mapping[str, str]
+) -> str:
+    canonical = "\n".join(
+        [
+            method,
+            s3_key,
+            urlencode(sorted(params.items())),
+            *(f"{name}:{value.strip()}" for name, value in sorted(headers.items())),
+        ]
+    )
+    return hmac.new(_signing_key(), canonical.encode(), hashlib.sha256).hexdigest()
+
+
+def _sign_url(
+    method: str,
+    s3_key: str,
+    *,
+    expires_at: int,
+    headers: dict[str, str] | None = None,
+    query: dict[str, str] | None = None,
+) -> str:
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    params = {"expires": str(expires_at), **(query or {})}
+    if headers:
+        params["signed_headers"] = ";".join(sorted(headers))
+    params["signature"] = _signature(method, s3_key, params, headers)
+    base_url = settings.local_storage_base_url.rstrip("/")
+    return f"{base_url}/storage/{quote(s3_key)}?{urlencode(params)}"
+
+
+def verify(
+    method: str,
+    s3_key: str,
+    params: Mapping[str, str],
+    headers: Mapping[str, str],
+) -> bool:
+    """
+    Check a /storage request against its URL signature.
+
+    HEAD is allowed wherever GET is. Signed headers must be sent with the values
+    they were signed with.
+    """
+    signature = params.get("signature", "")
+    expires = params.get("expires", "")
+    if not signature or not expires.isdigit() or int(expires) < time.time():
+        return False
+
+    signed_params = {
+        name: value for name, value in params.items() if name != "signature"
+    }
+    signed_headers = {
+        name: headers.get(name, "")
+        for name in params.get("signed_headers", "").split(";")
+        if name
+    }
+    expected = _signature(
+        "GET" if method == "HEAD" else method, s3_key, signed_params, signed_headers
+    )
+    return hmac.compare_digest(signature, expected)
+
+
+# MARK: - Uploads
+
+
+def upload_fileobj(
+    s3_key: str,
+    fileobj: BinaryIO,
+    content_type: str = "application/pdf",
+    cache_control: str | None = None,
+) -> None:
+    """Write a file object to disk. Blocking; call from a worker thread in async code."""
+    _write_atomically(_path(s3_key), fileobj)
+
+
+def generate_put_url(
+    s3_key: str, content_type: str, headers: dict[str, str] | None = None
+) -> dict:
+    """Signed PUT URL; `headers` (and Content-Type) must be sent verbatim."""
+    headers = {"Content-Type": content_type, **(headers or {})}
+    url = _sign_url(
+        "PUT",
+        s3_key,
+        expires_at=int(time.time()) + UPLOAD_URL_EXPIRES_IN,
+        headers=headers,
+    )
+    return {
+        "url": url,
+        "s3_key": s3_key,
+        "headers": headers,
+        "expires_in": UPLOAD_URL_EXPIRES_IN,
+    }
+
+
+async def receive_upload(
+    s3_key: str,
+    chunks: AsyncIterator[bytes],
+    *,
+    upload_id: str | None = None,
+    part_number: int | None = None,
+    checksum: str | None = None,
+) -> str:
+    """
+    Stream a PUT body to disk without holding it in memory. Returns its ETag.
+
+    With upload_id/part_number the body is stored as a multipart part. A base64
+    x-amz-checksum-sha256 `checksum` is verified before anything becomes visible;
+    ValueError on mismatch. FileNotFoundError if the multipart upload doesn't exist.
+    """
+    if upload_id is None:
+        dest_dir = _path(s3_key).parent
+    else:
+        dest_dir = _upload_dir(s3_key, upload_id)
+
+    temp = await anyio.to_thread.run_sync(_temp_path, dest_dir)
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    try:
+        async with await anyio.open_file(temp, "wb") as out:
+            async for chunk in chunks:
+                sha256.update(chunk)
+                md5.update(chunk)
+                await out.write(chunk)
+
+        if checksum is not None and checksum != base64.b64encode(
+            sha256.digest()
+        ).decode("ascii"):
+            raise ValueError("Body does not match x-amz-checksum-sha256")
+
+        if upload_id is None:
+            dest = _path(s3_key)
+        else:
+            for stale in dest_dir.glob(f"{part_number:05d}.*"):
+                stale.unlink(missing_ok=True)
+            dest = dest_dir / f"{part_number:05d}.{md5.hexdigest()}"
+        await anyio.to_thread.run_sync(os.replace, temp, dest)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+    return f'"{md5.hexdigest()}"'
+
+
+# MARK: - Multipart uploads
+
+
+def _upload_dir(s3_key: str, upload_id: str) -> Path:
+    """Directory holding an upload's parts; FileNotFoundError if it isn't `s3_key`'s."""
+    if not upload_id.isalnum():
+        raise FileNotFoundError(upload_id)
+    upload_dir = _root() / UPLOADS_DIR / upload_id
+    try:
+        key = (upload_dir / "key").read_text()
+    except FileNotFoundError:
+        raise FileNotFoundError(upload_id)
+    if key != s3_key:
+        raise FileNotFoundError(upload_id)
+    return upload_dir
+
+
+def create_multipart_upload(
+    s3_key: str, content_type: str, cache_control: str | None = None
+) -> str:
+    """Start a multipart upload and return its upload id."""
+    _path(s3_key)
+    upload_id = secrets.token_hex(16)
+    upload_dir = _root() / UPLOADS_DIR / upload_id
+    upload_dir.mkdir(parents=True)
+    (upload_dir / "key").write_text(s3_key)
+    return upload_id
+
+
+def upload_part(s3_key: str, upload_id: str, part_number: int, body: bytes) -> dict:
+    """Store one part; returns the {PartNumber, ETag} entry needed to complete."""
+    upload_dir = _upload_dir(s3_key, upload_id)
+    etag = hashlib.md5(body).hexdigest()
+    for stale in upload_dir.glob(f"{part_number:05d}.*"):
+        stale.unlink(missing_ok=True)
+    (upload_dir / f"{part_number:05d}.{etag}").write_bytes(body)
+    return {"PartNumber": part_number, "ETag": f'"{etag}"'}
+
+
+def generate_part_upload_urls(
+    s3_key: str, upload_id: str, part_numbers: Iterable[int]
+) -> dict:
+    expires_at = int(time.time()) + UPLOAD_URL_EXPIRES_IN
+    urls = {
+        part_number: _sign_url(
+            "PUT",
+            s3_key,
+            expires_at=expires_at,
+            query={"uploadId": upload_id, "partNumber": str(part_number)},
+        )
+        for part_number in part_numbers
+    }
+    return {"urls": urls, "expires_in": UPLOAD_URL_EXPIRES_IN}
+
+
+def list_uploaded_parts(s3_key: str, upload_id: str) -> list[dict] | None:
+    """Parts received so far, in part-number order; None if the upload doesn't exist."""
+    try:
+        upload_dir = _upload_dir(s3_key, upload_id)
+    except FileNotFoundError:
+        return None
+
+    parts = []
+    for path in sorted(upload_dir.iterdir()):
+        number, _, etag = path.name.partition(".")
+        if not number.isdigit():
+            continue
+        parts.append(
+            {
+                "PartNumber": int(number),
+                "ETag": f'"{etag}"',
+                "Size": path.stat().st_size,
+            }
+        )
+    return parts
+
+
+def complete_multipart_upload(s3_key: str, upload_id: str, parts: list[dict]) -> None:
+    """Concatenate the listed parts into the object and drop the upload."""
+    upload_dir = _upload_dir(s3_key, upload_id)
+    dest = _path(s3_key)
+    temp = _temp_path(dest.parent)
+
+    try:
+        with open(temp, "wb") as out:
+            for part in parts:
+                etag = part["ETag"].strip('"')
+                part_path = upload_dir / f"{part['PartNumber']:05d}.{etag}"
+                try:
+                    with open(part_path, "rb") as body:
+                        shutil.copyfileobj(body, out, COPY_CHUNK_SIZE)
+                except FileNotFoundError:
+                    raise Exception(
+                        f"Failed to complete multipart upload: part "
+                        f"{part['PartNumber']} with ETag {etag} not found"
+                    )
+        os.replace(temp, dest)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+    shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+def abort_multipart_upload(s3_key: str, upload_id: str) -> None:
+    try:
+        upload_dir = _upload_dir(s3_key, upload_id)
+    except FileNotFoundError:
+        return
+    shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+# MARK: - Objects
+
+
+def object_exists(s3_key: str) -> bool:
+    return _path(s3_key).is_file()
+
+
+def head_object(s3_key: str) -> Optional[dict]:
+    """Return size and ETag of a stored object, or None if it doesn't exist."""
+    try:
+        stat = _path(s3_key).stat()
+    except FileNotFoundError:
+        return None
+    return {"size": stat.st_size, "etag": _etag(stat)}
+
+
+def apply_object_tags(s3_key: str) -> None:
+    """No-op: local storage has no lifecycle rules to tag for."""
+
+
+def iter_object(s3_key: str, chunk_size: int) -> Iterator[bytes]:
+    try:
+        with open(_path(s3_key), "rb") as body:
+            while chunk := body.read(chunk_size):
+                yield chunk
+    except FileNotFoundError:
+        raise FileNotFoundError(s3_key)
+
+
+def copy_object(
+    source_key: str,
+    dest_key: str,
+    content_type: str | None = None,
+    cache_control: str | None = None,
+) -> None:
+    """Copy a file; on Linux the kernel moves the bytes (sendfile/copy_file_range)."""
+    dest = _path(dest_key)
+    temp = _temp_path(dest.parent)
+    try:
+        shutil.copyfile(_path(source_key), temp)
+        os.replace(temp, dest)
+    except FileNotFoundError as e:
+        temp.unlink(missing_ok=True)
+        raise Exception(f"Failed to copy file: {e}")
+
+
+def list_objects(prefix: str) -> Iterator[dict]:
+    """Yield every object under `prefix` with key, size and last_modified."""
+    root = _root()
+    # Walk only the deepest directory the prefix names
+    start = root / prefix.rpartition("/")[0]
+    for dirpath, dirnames, filenames in os.walk(start):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for filename in filenames:
+            if filename.startswith(TEMP_PREFIX):
+                continue
+            path = Path(dirpath) / filename
+            key = path.relative_to(root).as_posix()
+            if not key.startswith(prefix):
+                continue
+            stat = path.stat()
+            yield {
+                "key": key,
+                "size": stat.st_size,
+                "last_modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            }
+
+
+def delete_objects(keys: Iterable[str]) -> dict[str, str]:
+    """Delete files. Returns {key: error code} for keys that couldn't be removed."""
+    errors = {}
+    for key in keys:
+        try:
+            _path(key).unlink(missing_ok=True)
+        except ValueError:
+            errors[key] = "InvalidKey"
+        except OSError:
+            errors[key] = "AccessDenied"
+    return errors
+
+
+# MARK: - Downloads
+
+
+def _download_url_expiry(now: float) -> int:
+    """Hour boundaries, as for S3, so an object's URL is stable within the hour."""
+    bucket = (
+        int(now + DOWNLOAD_URL_REFRESH_MARGIN_SECONDS) // DOWNLOAD_URL_BUCKET_SECONDS
+    )
+    return (bucket + 1) * DOWNLOAD_URL_BUCKET_SECONDS
+
+
+def generate_download_url(s3_key: str) -> dict:
+    return generate_download_urls([s3_key])[s3_key]
+
+
+def generate_download_urls(s3_keys: Iterable[str]) -> dict[str, dict]:
+    now = time.time()
+    expires_at = _download_url_expiry(now)
+    return {
+        s3_key: {
+            "url": _sign_url("GET", s3_key, expires_at=expires_at),
+            "expires_in": expires_at - int(now),
+        }
+        for s3_key in set(s3_keys)
+    }
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (first, last) byte of a single `bytes=` range, or None to send the whole file.
+
+    Raises ValueError if the range can't be satisfied. Multi-range requests get the
+    whole file, which RFC 9110 permits.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+class _FileRangeResponse(Response):
+    """206 Partial Content for one byte range of a file."""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: Path, start: int, end: int, headers: dict[str, str]):
+        super().__init__(status_code=206, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, "rb") as body:
+            await body.seek(self.start)
+            while remaining:
+                chunk = await body.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+        if remaining:
+            # File shrank under us; end the response rather than hang
+            await send({"type": "http.response.body", "body": b""})
+
+
+def file_response(s3_key: str, range_header: str | None) -> Response:
+    """
+    Response for a verified /storage GET or HEAD. FileNotFoundError if missing.
+
+    Content-addressed objects are cacheable forever; anything else, which a
+    re-upload may replace, for as long as its URL lasts.
+    """
+    path = _path(s3_key)
+    stat = path.stat()
+    media_type = mimetypes.guess_type(s3_key)[0] or "application/octet-stream"
+    if storage.is_content_addressed(s3_key):
+        cache_control = storage.IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f"private, max-age={DOWNLOAD_URL_BUCKET_SECONDS}"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+        "ETag": f'"{_etag(stat)}"',
+    }
+
+    if settings.local_storage_accel_redirect:
+        prefix = settings.local_storage_accel_redirect.rstrip("/")
+        return Response(
+            media_type=media_type,
+            headers={**headers, "X-Accel-Redirect": f"{prefix}/{quote(s3_key)}"},
+        )
+
+    if range_header:
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={"Content-Range": f"bytes */{stat.st_size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            return _FileRangeResponse(
+                path,
+                start,
+                end,
+                {
+                    **headers,
+                    "Content-Type": media_type,
+                    "Content-Length": str(end - start + 1),
+                    "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                },
+            )
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
@@ -1,17 +1,30 @@
-from typing import Annotated
-from datetime import datetime, timezone
-
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, Form, File, Request
+from typing import Annotated, Literal
+from datetime import datetime, timedelta, timezone
+
+from fastapi import (
+    FastAPI,
+    Depends,
+    Header,
+    HTTPException,
+    UploadFile,
+    Form,
+    File,
+    Query,
+    Request,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from jwt import InvalidTokenError
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
-from sqlmodel import Session, select
+from sqlalchemy import case, or_, tuple_
+from sqlmodel import Session, delete, func, select
 
 from app import models, schemas, auth, apple_auth
 from app.config import settings
-from app.database import get_db, create_db_and_tables
+from app.database import engine, get_db, create_db_and_tables
+from app.migrations import check_schema
 from app.middleware import SecurityHeadersMiddleware, HttpsRedirectMiddleware
 from app.rate_limit import limiter
 
@@ -21,6 +34,7 @@ app = FastAPI(title="Cadenza API")
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    check_schema(engine)
 
 
 app.state.limiter = limiter
@@ -237,10 +251,128 @@ def get_my_students(
     return list(students)
 
 
+@app.get("/teacher/dashboard", response_model=list[schemas.TeacherDashboardStudent])
+def get_teacher_dashboard(
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """Summarize every student's routine, practice and review backlog in one call"""
+    students = db.exec(
+        select(models.User)
+        .where(models.User.teacher_id == current_user.id)
+        .order_by(models.User.id)
+    ).all()
+    if not students:
+        return []
+
+    student_ids = [student.id for student in students]
+
+    routines = db.exec(
+        select(
+            models.RoutineAssignment.student_id, models.Routine.id, models.Routine.title
+        )
+        .join(models.Routine, models.Routine.id == models.RoutineAssignment.routine_id)
+        .where(models.RoutineAssignment.student_id.in_(student_ids))
+    ).all()
+    routine_by_student = {
+        student_id: (routine_id, title) for student_id, routine_id, title in routines
+    }
+
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    practice = db.exec(
+        select(
+            models.PracticeSession.user_id,
+            func.max(models.PracticeSession.started_at),
+            func.sum(
+                case(
+                    (
+                        models.PracticeSession.started_at >= week_ago,
+                        models.PracticeSession.duration_seconds,
+                    ),
+                    else_=0,
+                )
+            ),
+        )
+        .where(models.PracticeSession.user_id.in_(student_ids))
+        .group_by(models.PracticeSession.user_id)
+    ).all()
+    practice_by_student = {
+        user_id: (last_practiced_at, seconds or 0)
+        for user_id, last_practiced_at, seconds in practice
+    }
+
+    pending = db.exec(
+        select(models.VideoSubmission.user_id, func.count())
+        .where(
+            models.VideoSubmission.user_id.in_(student_ids),
+            models.VideoSubmission.reviewed_at.is_(None),
+        )
+        .group_by(models.VideoSubmission.user_id)
+    ).all()
+    pending_by_student = dict(pending)
+
+    dashboard = []
+    for student in students:
+        routine_id, routine_title = routine_by_student.get(student.id, (None, None))
+        last_practiced_at, week_seconds = practice_by_student.get(student.id, (None, 0))
+        dashboard.append(
+            schemas.TeacherDashboardStudent(
+                student=student,
+                current_routine_id=routine_id,
+                current_routine_title=routine_title,
+                last_practiced_at=last_practiced_at,
+                practice_minutes_7d=week_seconds // 60,
+                pending_review_count=pending_by_student.get(student.id, 0),
+            )
+        )
+    return dashboard
+
+
 # MARK: - Piece Management
 
 
-@app.get("/pieces", response_model=list[models.Piece])
+def _copy_piece_for(db: Session, original: models.Piece, owner_id: int) -> models.Piece:
+    """A student's copy of a piece, sharing the original's PDF"""
+    from app import pdf_blobs
+
+    if original.blob_sha256:
+        pdf_blobs.retain(db, original.blob_sha256)
+
+    piece = models.Piece(
+        owner_id=owner_id,
+        title=original.title,
+        pdf_filename=original.pdf_filename,
+        s3_key=original.s3_key,  # Share the same S3 file
+        blob_sha256=original.blob_sha256,
+        shared_from_piece_id=original.id,
+        preview_s3_key=original.preview_s3_key,
+        page_preview_count=original.page_preview_count,
+    )
+    db.add(piece)
+    return piece
+
+
+def _piece_responses(pieces: list[models.Piece]) -> list[schemas.PieceResponse]:
+    """Pieces with their preview URLs, signed in one batch"""
+    from app import storage
+
+    urls = storage.generate_download_urls(
+        {piece.preview_s3_key for piece in pieces if piece.preview_s3_key}
+    )
+    responses = []
+    for piece in pieces:
+        response = schemas.PieceResponse.model_validate(piece)
+        if piece.preview_s3_key:
+            response.preview_url = urls[piece.preview_s3_key]["url"]
+        responses.append(response)
+    return responses
+
+
+def _piece_response(piece: models.Piece) -> schemas.PieceResponse:
+    return _piece_responses([piece])[0]
+
+
+@app.get("/pieces", response_model=list[schemas.PieceResponse])
 @limiter.limit(settings.rate_limit_read)
 def get_my_pieces(
     request: Request,
@@ -256,10 +388,10 @@ def get_my_pieces(
     print(
         f"[DB READ] GET /pieces - User {current_user.id} ({current_user.email}) - Returning {len(pieces_list)} pieces"
     )
-    return pieces_list
+    return _piece_responses(pieces_list)
 
 
-@app.post("/pieces", response_model=models.Piece)
+@app.post("/pieces", response_model=schemas.PieceResponse)
 @limiter.limit(settings.rate_limit_write)
 async def create_piece(
     request: Request,
@@ -272,20 +404,28 @@ async def create_piece(
     Create a new piece for the current user.
 
     The iOS app sends the PDF file content (from bundle, Dropbox, iCloud, etc.).
-    The server handles uploading to S3.
+    The server streams it to S3 in parts from a worker thread, so memory per upload
+    is bounded by the part size and the event loop stays free. PDFs already stored
+    by any user are not uploaded again.
     """
-    from app import s3
+    from app import pdf_blobs, storage, tasks
     from uuid import uuid4
 
     # Generate UUID for the piece
     piece_id = uuid4()
 
-    # Upload file to S3
     pdf_filename = pdf_file.filename or "upload.pdf"
-    file_content = await pdf_file.read()
-
-    s3_key = s3.get_piece_s3_key(piece_id)
-    s3.upload_file_content(s3_key, file_content)
+    sha256, size_bytes = await run_in_threadpool(storage.sha256_fileobj, pdf_file.file)
+    s3_key = storage.get_pdf_blob_s3_key(sha256)
+
+    # Upload file to S3 unless a live piece already stored the same bytes. The key
+    # is content-addressed, so uploading before taking the blob's row lock is safe
+    # even if another request uploads the same PDF meanwhile.
+    blob = db.get(models.PdfBlob, sha256)
+    if blob is None or blob.ref_count <= 0:
+        await run_in_threadpool(storage.upload_fileobj, s3_key, pdf_file.file)
+    db.rollback()  # Don't hold a transaction open across the upload
+    new_blob = pdf_blobs.retain(db, sha256, size_bytes) == 1
 
     # Create database record
     piece = models.Piece(
@@ -294,19 +434,181 @@ async def create_piece(
         title=title,
         pdf_filename=pdf_filename,
         s3_key=s3_key,
+        blob_sha256=sha256,
     )
 
     db.add(piece)
+    tasks.enqueue_pdf_previews(db, s3_key)
     db.commit()
     db.refresh(piece)
 
+    # A blob released since we looked may have been collected by storage GC
+    if new_blob and await run_in_threadpool(storage.head_object, s3_key) is None:
+        pdf_file.file.seek(0)
+        await run_in_threadpool(storage.upload_fileobj, s3_key, pdf_file.file)
+
     print(
         f"[DB WRITE] POST /pieces - User {current_user.id} ({current_user.email}) - Created piece {piece_id} '{title}'"
     )
-    return piece
+    return _piece_response(piece)
+
+
+@app.post("/pieces/upload-url", response_model=schemas.PieceUploadUrlResponse)
+@limiter.limit(settings.rate_limit_write)
+def create_piece_upload_url(
+    request: Request,
+    upload: schemas.PieceUploadUrlRequest,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Start a direct-to-S3 piece upload.
+
+    The client PUTs the PDF to the returned URL with the returned headers, then
+    calls /pieces/finalize. The PDF never passes through the API process. Clients
+    that send the PDF's SHA-256 upload to a staging key, with S3 checking the body
+    against it, and finalizing copies it to its content-addressed key. Only the
+    user who requested the URL can finalize the piece.
+    """
+    from app import storage
+
+    if db.get(models.Piece, upload.piece_id):
+        raise HTTPException(status_code=409, detail="Piece already exists")
+
+    pending = db.get(models.PieceUpload, upload.piece_id)
+    if pending and pending.owner_id != current_user.id:
+        raise HTTPException(status_code=409, detail="Piece already exists")
+    if pending is None:
+        pending = models.PieceUpload(piece_id=upload.piece_id, owner_id=current_user.id)
+    pending.sha256 = upload.sha256
+    pending.created_at = datetime.now(timezone.utc)
+    db.add(pending)
+    db.commit()
+
+    if upload.sha256:
+        presigned = storage.generate_pdf_blob_upload_url(upload.piece_id, upload.sha256)
+    else:
+        presigned = storage.generate_upload_url(upload.piece_id)
+
+    return schemas.PieceUploadUrlResponse(
+        upload_url=presigned["url"],
+        s3_key=presigned["s3_key"],
+        headers=presigned["headers"],
+        expires_in=presigned["expires_in"],
+    )
+
+
+@app.post("/pieces/finalize", response_model=schemas.PieceResponse)
+@limiter.limit(settings.rate_limit_write)
+def finalize_piece_upload(
+    request: Request,
+    piece: schemas.PieceCreate,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """Record a piece once its PDF has been uploaded via /pieces/upload-url"""
+    from app import pdf_blobs, storage, tasks
+
+    existing = db.get(models.Piece, piece.id)
+    if existing:
+        if existing.owner_id != current_user.id:
+            raise HTTPException(status_code=409, detail="Piece already exists")
+        return _piece_response(existing)
+
+    pending = db.get(models.PieceUpload, piece.id)
+    if pending is None:
+        raise HTTPException(status_code=409, detail="Piece upload was not started")
+    if pending.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to finalize this piece"
+        )
+    if piece.sha256 != pending.sha256:
+        raise HTTPException(status_code=400, detail="sha256 does not match upload")
+
+    if piece.sha256:
+        s3_key = storage.get_pdf_blob_s3_key(piece.sha256)
+        upload_key = storage.get_pdf_upload_s3_key(piece.id)
+    else:
+        s3_key = upload_key = storage.get_piece_s3_key(piece.id)
+    if piece.s3_key is not None and piece.s3_key not in (s3_key, upload_key):
+        raise HTTPException(status_code=400, detail="s3_key does not match piece")
+
+    if piece.sha256:
+        # Copy the caller's own checksummed upload rather than trusting that the
+        # blob exists, so knowing a PDF's hash isn't enough to reference it. The
+        # copy happens before the blob's row is locked by retain().
+        head = storage.store_pdf_upload(piece.id, piece.sha256)
+    else:
+        head = storage.head_object(s3_key)
+    if head is None:
+        raise HTTPException(status_code=409, detail="PDF has not been uploaded")
+
+    if piece.sha256:
+        new_blob = pdf_blobs.retain(db, piece.sha256, head["size"]) == 1
+    else:
+        storage.apply_object_tags(s3_key)
+        new_blob = False
+
+    new_piece = models.Piece(
+        id=piece.id,
+        owner_id=current_user.id,
+        title=piece.title,
+        pdf_filename=piece.pdf_filename,
+        s3_key=s3_key,
+        blob_sha256=piece.sha256,
+    )
+    db.add(new_piece)
+    db.delete(pending)
+    tasks.enqueue_pdf_previews(db, s3_key)
+    db.commit()
+    db.refresh(new_piece)
+
+    # A blob released since the copy may have been collected by storage GC
+    if new_blob and storage.head_object(s3_key) is None:
+        storage.store_pdf_upload(piece.id, piece.sha256)
+
+    print(
+        f"[DB WRITE] POST /pieces/finalize - User {current_user.id} ({current_user.email}) - Created piece {piece.id} '{piece.title}'"
+    )
+    return _piece_response(new_piece)
+
+
+@app.post("/pieces/from-bundle", response_model=schemas.JobStatus, status_code=202)
+@limiter.limit(settings.rate_limit_write)
+def create_piece_from_bundle(
+    request: Request,
+    piece: schemas.BundledPieceCreate,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Create a piece from a PDF bundled with the iOS app, without uploading it.
+
+    The copy runs as a background job; poll /jobs/{id} until it succeeds.
+    """
+    from app import jobs
+
+    if db.get(models.Piece, piece.piece_id):
+        raise HTTPException(status_code=409, detail="Piece already exists")
+
+    job = jobs.enqueue(
+        db,
+        "pieces.copy_bundled",
+        {
+            "piece_id": str(piece.piece_id),
+            "owner_id": current_user.id,
+            "title": piece.title,
+            "source_filename": piece.source_filename,
+        },
+        created_by_id=current_user.id,
+    )
+    db.commit()
+    db.refresh(job)
 
+    return _job_status(job)
 
-@app.put("/pieces/{piece_id}", response_model=models.Piece)
+
+@app.put("/pieces/{piece_id}", response_model=schemas.PieceResponse)
 def update_piece(
     piece_id: str,
     title: str,
@@ -335,7 +637,7 @@ def update_piece(
     print(
         f"[DB WRITE] PUT /pieces/{piece_id} - User {current_user.id} ({current_user.email}) - Updated title to '{title}'"
     )
-    return piece
+    return _piece_response(piece)
 
 
 @app.delete("/pieces/{piece_id}")
@@ -344,8 +646,15 @@ def delete_piece(
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
-    """Delete a piece"""
+    """
+    Delete a piece.
+
+    Content-addressed PDFs are released for storage GC. A legacy per-piece PDF
+    (and its previews) is deleted by a background job once no student copy still
+    points at it.
+    """
     from uuid import UUID
+    from app import jobs, pdf_blobs, storage
 
     piece = db.get(models.Piece, UUID(piece_id))
 
@@ -360,13 +669,40 @@ def delete_piece(
     print(
         f"[DB WRITE] DELETE /pieces/{piece_id} - User {current_user.id} ({current_user.email}) - Deleted piece '{piece.title}'"
     )
+    if piece.blob_sha256:
+        pdf_blobs.release(db, piece.blob_sha256)
+    elif piece.s3_key:
+        shared = db.exec(
+            select(models.Piece.id).where(
+                models.Piece.s3_key == piece.s3_key, models.Piece.id != piece.id
+            )
+        ).first()
+        if not shared:
+            keys = [piece.s3_key]
+            if piece.preview_s3_key:
+                keys.append(piece.preview_s3_key)
+                keys += [
+                    storage.get_pdf_page_preview_s3_key(piece.s3_key, page)
+                    for page in range(1, (piece.page_preview_count or 0) + 1)
+                ]
+            jobs.enqueue(
+                db,
+                "storage.delete_objects",
+                {"keys": keys},
+                created_by_id=current_user.id,
+            )
+    db.exec(
+        delete(models.SubmissionMeasure).where(
+            models.SubmissionMeasure.piece_id == piece.id
+        )
+    )
     db.delete(piece)
     db.commit()
 
     return {"message": "Piece deleted successfully"}
 
 
-@app.get("/students/{student_id}/pieces", response_model=list[models.Piece])
+@app.get("/students/{student_id}/pieces", response_model=list[schemas.PieceResponse])
 def get_student_pieces(
     student_id: int,
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
@@ -387,10 +723,10 @@ def get_student_pieces(
         select(models.Piece).where(models.Piece.owner_id == student_id)
     ).all()
 
-    return list(pieces)
+    return _piece_responses(list(pieces))
 
 
-@app.post("/pieces/{piece_id}/share/{student_id}", response_model=models.Piece)
+@app.post("/pieces/{piece_id}/share/{student_id}", response_model=schemas.PieceResponse)
 def share_piece_with_student(
     piece_id: str,
     student_id: int,
@@ -423,18 +759,11 @@ def share_piece_with_student(
         )
 
     # Create a copy for the student
-    new_piece = models.Piece(
-        owner_id=student_id,
-        title=original_piece.title,
-        pdf_filename=original_piece.pdf_filename,
-        shared_from_piece_id=original_piece.id,
-    )
-
-    db.add(new_piece)
+    new_piece = _copy_piece_for(db, original_piece, student_id)
     db.commit()
     db.refresh(new_piece)
 
-    return new_piece
+    return _piece_response(new_piece)
 
 
 @app.get(
@@ -447,7 +776,7 @@ def get_piece_download_url(
 ):
     """Get a presigned URL to download the PDF for a piece"""
     from uuid import UUID
-    from app import s3
+    from app import storage
 
     piece = db.get(models.Piece, UUID(piece_id))
 
@@ -462,13 +791,107 @@ def get_piece_download_url(
     if not piece.s3_key:
         raise HTTPException(status_code=404, detail="PDF not available for this piece")
 
-    download_url = s3.generate_download_url(piece.s3_key)
+    download = storage.generate_download_url(piece.s3_key)
+
+    return schemas.PieceDownloadUrlResponse(
+        download_url=download["url"], expires_in=download["expires_in"]
+    )
+
+
+@app.get(
+    "/pieces/{piece_id}/page-previews",
+    response_model=schemas.PiecePagePreviewsResponse,
+)
+def get_piece_page_previews(
+    piece_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Get presigned URLs of a piece's low-resolution page previews.
+
+    Empty until the piece's media.pdf_previews job has run (or if page previews
+    are disabled); at most the first pdf_previews.MAX_PAGES pages.
+    """
+    from uuid import UUID
+    from app import storage
+
+    piece = db.get(models.Piece, UUID(piece_id))
+
+    if not piece:
+        raise HTTPException(status_code=404, detail="Piece not found")
+
+    if piece.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to access this piece"
+        )
 
-    return schemas.PieceDownloadUrlResponse(download_url=download_url, expires_in=3600)
+    keys = [
+        storage.get_pdf_page_preview_s3_key(piece.s3_key, page)
+        for page in range(1, (piece.page_preview_count or 0) + 1)
+    ]
+    urls = storage.generate_download_urls(keys)
+
+    return schemas.PiecePagePreviewsResponse(
+        page_urls=[urls[key]["url"] for key in keys],
+        expires_in=min(
+            (url["expires_in"] for url in urls.values()),
+            default=storage.DOWNLOAD_URL_BUCKET_SECONDS,
+        ),
+    )
 
 
 # MARK: - Routine Management
 
+RoutineExpansion = Literal["pieces", "download_urls"]
+
+
+def _routine_with_exercises(
+    db: Session, routine: models.Routine, expand: list[RoutineExpansion]
+) -> dict:
+    """
+    Routine payload, optionally embedding pieces (with preview URLs) and their
+    download URLs
+    """
+    from app import storage
+
+    if not expand:
+        exercises = db.exec(
+            select(models.Exercise)
+            .where(models.Exercise.routine_id == routine.id)
+            .order_by(models.Exercise.order_index)
+        ).all()
+        return {"routine": routine, "exercises": list(exercises)}
+
+    rows = db.exec(
+        select(models.Exercise, models.Piece)
+        .join(models.Piece, models.Piece.id == models.Exercise.piece_id, isouter=True)
+        .where(models.Exercise.routine_id == routine.id)
+        .order_by(models.Exercise.order_index)
+    ).all()
+
+    exercises = [exercise for exercise, _ in rows]
+    pieces = list({piece.id: piece for _, piece in rows if piece}.values())
+    payload = {
+        "routine": routine,
+        "exercises": exercises,
+        "pieces": _piece_responses(pieces),
+    }
+
+    if "download_urls" in expand:
+        urls = storage.generate_download_urls(
+            piece.s3_key for piece in pieces if piece.s3_key
+        )
+        payload["download_urls"] = {
+            str(piece.id): urls[piece.s3_key]["url"] for piece in pieces if piece.s3_key
+        }
+        payload["expires_in"] = min(
+            (url["expires_in"] for url in urls.values()),
+            default=storage.DOWNLOAD_URL_BUCKET_SECONDS,
+        )
+
+    return payload
+
 
 @app.get("/routines", response_model=list[models.Routine])
 def get_my_routines(
@@ -503,6 +926,7 @@ def get_routine(
     routine_id: str,
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
+    expand: Annotated[list[RoutineExpansion], Query(default_factory=list)],
 ):
     """Get a routine with its exercises"""
     from uuid import UUID
@@ -516,13 +940,7 @@ def get_routine(
             status_code=403, detail="Not authorized to view this routine"
         )
 
-    exercises = db.exec(
-        select(models.Exercise)
-        .where(models.Exercise.routine_id == routine.id)
-        .order_by(models.Exercise.order_index)
-    ).all()
-
-    return {"routine": routine, "exercises": list(exercises)}
+    return _routine_with_exercises(db, routine, expand)
 
 
 @app.put("/routines/{routine_id}", response_model=models.Routine)
@@ -830,14 +1248,7 @@ def assign_routine_to_student(
                 # Share the piece with the student
                 original_piece = db.get(models.Piece, orig_exercise.piece_id)
                 if original_piece:
-                    new_piece = models.Piece(
-                        owner_id=student_id,
-                        title=original_piece.title,
-                        pdf_filename=original_piece.pdf_filename,
-                        s3_key=original_piece.s3_key,  # Share the same S3 file
-                        shared_from_piece_id=original_piece.id,
-                    )
-                    db.add(new_piece)
+                    new_piece = _copy_piece_for(db, original_piece, student_id)
                     db.flush()
                     piece_mapping[orig_exercise.piece_id] = new_piece.id
                     pieces_newly_shared += 1
@@ -888,6 +1299,7 @@ def get_student_current_routine(
     student_id: int,
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
+    expand: Annotated[list[RoutineExpansion], Query(default_factory=list)],
 ):
     """Get a student's currently assigned routine"""
     student = db.get(models.User, student_id)
@@ -909,19 +1321,14 @@ def get_student_current_routine(
         return None
 
     routine = db.get(models.Routine, assignment.routine_id)
-    exercises = db.exec(
-        select(models.Exercise)
-        .where(models.Exercise.routine_id == routine.id)
-        .order_by(models.Exercise.order_index)
-    ).all()
-
-    return {"assignment": assignment, "routine": routine, "exercises": list(exercises)}
+    return {"assignment": assignment, **_routine_with_exercises(db, routine, expand)}
 
 
 @app.get("/my-current-routine")
 def get_my_current_routine(
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
+    expand: Annotated[list[RoutineExpansion], Query(default_factory=list)],
 ):
     """Get the current user's assigned routine (student view)"""
     assignment = db.exec(
@@ -934,13 +1341,7 @@ def get_my_current_routine(
         return None
 
     routine = db.get(models.Routine, assignment.routine_id)
-    exercises = db.exec(
-        select(models.Exercise)
-        .where(models.Exercise.routine_id == routine.id)
-        .order_by(models.Exercise.order_index)
-    ).all()
-
-    return {"assignment": assignment, "routine": routine, "exercises": list(exercises)}
+    return {"assignment": assignment, **_routine_with_exercises(db, routine, expand)}
 
 
 # MARK: - Practice Sessions
@@ -1233,7 +1634,7 @@ def create_video_submission(
     db: Annotated[Session, Depends(get_db)],
 ):
     from uuid import uuid4
-    from app import s3
+    from app import storage
 
     if (
         submission.exercise_id is None
@@ -1245,8 +1646,10 @@ def create_video_submission(
         )
 
     submission_id = uuid4()
-    s3_key = s3.get_video_s3_key(current_user.id, submission_id)
-    thumbnail_s3_key = s3.get_video_thumbnail_s3_key(current_user.id, submission_id)
+    s3_key = storage.get_video_s3_key(current_user.id, submission_id)
+    thumbnail_s3_key = storage.get_video_thumbnail_s3_key(
+        current_user.id, submission_id
+    )
 
     video_submission = models.VideoSubmission(
         id=submission_id,
@@ -1264,8 +1667,8 @@ def create_video_submission(
     db.commit()
     db.refresh(video_submission)
 
-    upload_url = s3.generate_video_upload_url(current_user.id, submission_id)
-    thumbnail_upload_url = s3.generate_video_thumbnail_upload_url(
+    upload_url = storage.generate_video_upload_url(current_user.id, submission_id)
+    thumbnail_upload_url = storage.generate_video_thumbnail_upload_url(
         current_user.id, submission_id
     )
 
@@ -1287,7 +1690,7 @@ def get_video_submission_upload_url(
     db: Annotated[Session, Depends(get_db)],
 ):
     from uuid import UUID
-    from app import s3
+    from app import storage
 
     submission = db.get(models.VideoSubmission, UUID(submission_id))
     if not submission:
@@ -1298,8 +1701,8 @@ def get_video_submission_upload_url(
             status_code=403, detail="Not authorized to upload this submission"
         )
 
-    upload_url = s3.generate_video_upload_url(current_user.id, submission.id)
-    thumbnail_upload_url = s3.generate_video_thumbnail_upload_url(
+    upload_url = storage.generate_video_upload_url(current_user.id, submission.id)
+    thumbnail_upload_url = storage.generate_video_thumbnail_upload_url(
         current_user.id, submission.id
     )
 
@@ -1316,6 +1719,7 @@ def get_my_video_submissions(
     db: Annotated[Session, Depends(get_db)],
     piece_id: str | None = None,
     exercise_id: str | None = None,
+    uploaded_only: bool = False,
 ):
     from uuid import UUID
 
@@ -1327,6 +1731,8 @@ def get_my_video_submissions(
         query = query.where(models.VideoSubmission.piece_id == UUID(piece_id))
     if exercise_id:
         query = query.where(models.VideoSubmission.exercise_id == UUID(exercise_id))
+    if uploaded_only:
+        query = query.where(models.VideoSubmission.upload_state == "complete")
 
     submissions = db.exec(
         query.order_by(models.VideoSubmission.created_at.desc())
@@ -1345,6 +1751,7 @@ def get_student_video_submissions(
     piece_id: str | None = None,
     exercise_id: str | None = None,
     pending_review: bool = False,
+    uploaded_only: bool = False,
 ):
     student = db.get(models.User, student_id)
     if not student:
@@ -1369,6 +1776,8 @@ def get_student_video_submissions(
         query = query.where(models.VideoSubmission.exercise_id == UUID(exercise_id))
     if pending_review:
         query = query.where(models.VideoSubmission.reviewed_at.is_(None))
+    if uploaded_only:
+        query = query.where(models.VideoSubmission.upload_state == "complete")
 
     submissions = db.exec(
         query.order_by(models.VideoSubmission.created_at.desc())
@@ -1376,6 +1785,56 @@ def get_student_video_submissions(
     return list(submissions)
 
 
+@app.get("/teacher/review-queue", response_model=schemas.ReviewQueuePage)
+def get_review_queue(
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+    uploaded_only: bool = False,
+):
+    """Unreviewed submissions across all of the teacher's students, oldest first"""
+    from uuid import UUID
+
+    query = (
+        select(models.VideoSubmission)
+        .join(models.User, models.User.id == models.VideoSubmission.user_id)
+        .where(
+            models.User.teacher_id == current_user.id,
+            models.VideoSubmission.reviewed_at.is_(None),
+        )
+    )
+    if uploaded_only:
+        query = query.where(models.VideoSubmission.upload_state == "complete")
+
+    if cursor:
+        try:
+            created_at, submission_id = cursor.split("|")
+            position = (datetime.fromisoformat(created_at), UUID(submission_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            tuple_(models.VideoSubmission.created_at, models.VideoSubmission.id)
+            > position
+        )
+
+    submissions = db.exec(
+        query.order_by(
+            models.VideoSubmission.created_at, models.VideoSubmission.id
+        ).limit(limit + 1)
+    ).all()
+
+    next_cursor = None
+    if len(submissions) > limit:
+        submissions = submissions[:limit]
+        last = submissions[-1]
+        next_cursor = f"{last.created_at.isoformat()}|{last.id}"
+
+    return schemas.ReviewQueuePage(
+        submissions=list(submissions), next_cursor=next_cursor
+    )
+
+
 @app.patch(
     "/video-submissions/{submission_id}/reviewed", response_model=models.VideoSubmission
 )
@@ -1414,11 +1873,12 @@ def mark_video_submission_reviewed(
 )
 def get_video_submission_url(
     submission_id: str,
+    request: Request,
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     from uuid import UUID
-    from app import s3
+    from app import storage
 
     submission = db.get(models.VideoSubmission, UUID(submission_id))
     if not submission:
@@ -1431,32 +1891,34 @@ def get_video_submission_url(
                 status_code=403, detail="Not authorized to view this submission"
             )
 
-    video_url = s3.generate_download_url(submission.s3_key)
-    thumbnail_url = (
-        s3.generate_download_url(submission.thumbnail_s3_key)
-        if submission.thumbnail_s3_key
-        else None
-    )
+    keys = [
+        submission.s3_key,
+        submission.thumbnail_s3_key,
+        submission.preview_sprite_s3_key,
+    ]
+    urls = storage.generate_download_urls(key for key in keys if key)
+    thumbnail = urls.get(submission.thumbnail_s3_key)
+    sprite = urls.get(submission.preview_sprite_s3_key)
+    playlist = _hls_playlist_url(request, submission.hls_master_s3_key)
 
     return schemas.VideoSubmissionVideoUrlResponse(
-        video_url=video_url,
-        thumbnail_url=thumbnail_url,
-        expires_in=3600,
+        video_url=urls[keys[0]]["url"],
+        thumbnail_url=thumbnail["url"] if thumbnail else None,
+        playlist_url=playlist["url"] if playlist else None,
+        sprite_url=sprite["url"] if sprite else None,
+        expires_in=min(url["expires_in"] for url in urls.values()),
     )
 
 
-# MARK: - Video Submission Messages
+# MARK: - Video Clips
 
+# Longest range a clip can cover; replies are about passages, not whole takes
+MAX_CLIP_SECONDS = 120
 
-@app.get(
-    "/video-submissions/{submission_id}/messages",
-    response_model=list[models.Message],
-)
-def list_submission_messages(
-    submission_id: str,
-    current_user: Annotated[models.User, Depends(auth.get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
-):
+
+def _get_viewable_submission(
+    db: Session, submission_id: str, current_user: models.User
+) -> models.VideoSubmission:
     from uuid import UUID
 
     submission = db.get(models.VideoSubmission, UUID(submission_id))
@@ -1467,62 +1929,384 @@ def list_submission_messages(
         student = db.get(models.User, submission.user_id)
         if not student or student.teacher_id != current_user.id:
             raise HTTPException(
-                status_code=403, detail="Not authorized to view these messages"
+                status_code=403, detail="Not authorized to view this submission"
             )
-
-    messages = db.exec(
-        select(models.Message)
-        .where(models.Message.submission_id == submission.id)
-        .order_by(models.Message.created_at.asc())
-    ).all()
-    return list(messages)
+    return submission
 
 
 @app.post(
-    "/video-submissions/{submission_id}/messages",
-    response_model=schemas.MessageCreateResponse,
+    "/video-submissions/{submission_id}/clips",
+    response_model=schemas.JobStatus,
+    status_code=202,
 )
-def create_submission_message(
+@limiter.limit(settings.rate_limit_write)
+def create_video_clip(
+    request: Request,
     submission_id: str,
-    message: schemas.MessageCreate,
+    clip: schemas.VideoClipCreate,
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
-    from uuid import UUID, uuid4
-    from app import s3
+    """
+    Cut a passage out of a submission without re-encoding it.
 
-    submission = db.get(models.VideoSubmission, UUID(submission_id))
-    if not submission:
-        raise HTTPException(status_code=404, detail="Video submission not found")
+    The cut runs as a background job; poll /jobs/{id} until it succeeds, then
+    fetch the clip from /video-submissions/{id}/clips/{job_id}/url.
+    """
+    from app import jobs
 
-    if submission.user_id != current_user.id:
-        student = db.get(models.User, submission.user_id)
-        if not student or student.teacher_id != current_user.id:
-            raise HTTPException(
-                status_code=403, detail="Not authorized to message this submission"
-            )
+    submission = _get_viewable_submission(db, submission_id, current_user)
+    if submission.upload_state != "complete":
+        raise HTTPException(status_code=409, detail="Video has not been uploaded")
 
-    text = message.text.strip() if message.text else None
-    include_video = message.include_video
-    if not text and not include_video:
+    if clip.end_seconds <= clip.start_seconds:
+        raise HTTPException(status_code=422, detail="Clip must end after it starts")
+    if clip.end_seconds - clip.start_seconds > MAX_CLIP_SECONDS:
         raise HTTPException(
-            status_code=422, detail="Message must include text or a video"
+            status_code=422,
+            detail=f"Clips can be at most {MAX_CLIP_SECONDS} seconds long",
         )
+    if clip.start_seconds >= submission.duration_seconds:
+        raise HTTPException(status_code=422, detail="Clip starts after the video ends")
+
+    job = jobs.enqueue(
+        db,
+        "media.extract_clip",
+        {
+            "submission_id": str(submission.id),
+            # Whole milliseconds, so repeat requests for a range share one object.
+            # duration_seconds is rounded; the job clamps to the exact duration
+            "start_ms": round(clip.start_seconds * 1000),
+            "end_ms": round(
+                min(clip.end_seconds, submission.duration_seconds + 1) * 1000
+            ),
+        },
+        created_by_id=current_user.id,
+    )
+    db.commit()
+    db.refresh(job)
 
-    if include_video and message.video_duration_seconds is None:
+    return _job_status(job)
+
+
+@app.get(
+    "/video-submissions/{submission_id}/clips/{job_id}/url",
+    response_model=schemas.VideoClipUrlResponse,
+)
+def get_video_clip_url(
+    submission_id: str,
+    job_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    from uuid import UUID
+    from app import storage
+
+    submission = _get_viewable_submission(db, submission_id, current_user)
+
+    job = db.get(models.Job, UUID(job_id))
+    if (
+        not job
+        or job.kind != "media.extract_clip"
+        or job.payload["submission_id"] != str(submission.id)
+    ):
+        raise HTTPException(status_code=404, detail="Clip not found")
+
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail="Clip is not ready")
+    if "skipped" in job.result:
         raise HTTPException(
-            status_code=422,
-            detail="video_duration_seconds is required for video messages",
+            status_code=404, detail=f"Clip not available: {job.result['skipped']}"
         )
 
-    message_id = uuid4()
-    video_s3_key = (
-        s3.get_message_s3_key(current_user.id, message_id) if include_video else None
+    url = storage.generate_download_url(job.result["s3_key"])
+    return schemas.VideoClipUrlResponse(
+        clip_url=url["url"],
+        start_seconds=job.result["start_seconds"],
+        duration_seconds=job.result["duration_seconds"],
+        expires_in=url["expires_in"],
     )
-    thumbnail_s3_key = (
-        s3.get_message_thumbnail_s3_key(current_user.id, message_id)
-        if include_video
-        else None
+
+
+# MARK: - Submission Analysis
+
+
+@app.get(
+    "/video-submissions/{submission_id}/analyses",
+    response_model=list[models.SubmissionAnalysis],
+)
+def list_submission_analyses(
+    submission_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """Audio analyses (intonation, tempo, ...) computed for a submission so far"""
+    submission = _get_viewable_submission(db, submission_id, current_user)
+
+    return db.exec(
+        select(models.SubmissionAnalysis)
+        .where(models.SubmissionAnalysis.submission_id == submission.id)
+        .order_by(models.SubmissionAnalysis.kind)
+    ).all()
+
+
+# MARK: - Score Alignment
+
+MUSICXML_EXTENSIONS = (".musicxml", ".xml", ".mxl")
+
+
+def _get_owned_piece(db: Session, piece_id: str, current_user: models.User):
+    from uuid import UUID
+
+    piece = db.get(models.Piece, UUID(piece_id))
+    if not piece:
+        raise HTTPException(status_code=404, detail="Piece not found")
+    if piece.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to access this piece"
+        )
+    return piece
+
+
+@app.put("/pieces/{piece_id}/reference", response_model=schemas.PieceResponse)
+@limiter.limit(settings.rate_limit_write)
+async def set_piece_reference(
+    request: Request,
+    piece_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+    reference_file: Annotated[UploadFile, File()],
+    measure_times: Annotated[str | None, Form()] = None,
+):
+    """
+    Attach the reference submissions are aligned to (app.alignment).
+
+    Either a MusicXML score (.musicxml, .xml or compressed .mxl), or a recording
+    with `measure_times`: a JSON array of the second each measure starts at.
+    Submissions of this piece and of its shared copies are re-aligned.
+    """
+    import json
+    import os
+    from app import alignment, jobs, storage
+
+    piece = _get_owned_piece(db, piece_id, current_user)
+    filename = reference_file.filename or ""
+    extension = os.path.splitext(filename)[1].lower()
+
+    times = None
+    try:
+        if extension in MUSICXML_EXTENSIONS:
+            kind, content_type = "musicxml", "application/vnd.recordare.musicxml"
+            data = await reference_file.read()
+            await run_in_threadpool(alignment.score_reference, data)
+            await reference_file.seek(0)
+        else:
+            kind = "recording"
+            content_type = reference_file.content_type or "application/octet-stream"
+            if not content_type.startswith(("audio/", "video/")):
+                raise alignment.InvalidReference(
+                    "Reference must be MusicXML or an audio/video recording"
+                )
+            if measure_times is None:
+                raise alignment.InvalidReference("Recordings need measure_times")
+            times = [float(t) for t in json.loads(measure_times)]
+            alignment.validate_measure_times(times)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+    sha256, _ = await run_in_threadpool(storage.sha256_fileobj, reference_file.file)
+    s3_key = storage.get_piece_reference_s3_key(piece.id, sha256, extension)
+    await run_in_threadpool(
+        storage.upload_fileobj, s3_key, reference_file.file, content_type
+    )
+
+    piece.reference_kind = kind
+    piece.reference_s3_key = s3_key
+    piece.reference_measure_times = times
+    piece.updated_at = datetime.now(timezone.utc)
+    db.add(piece)
+
+    copies = select(models.Piece.id).where(
+        models.Piece.shared_from_piece_id == piece.id
+    )
+    submissions = db.exec(
+        select(models.VideoSubmission.id).where(
+            models.VideoSubmission.upload_state == "complete",
+            or_(
+                models.VideoSubmission.piece_id == piece.id,
+                models.VideoSubmission.piece_id.in_(copies),
+            ),
+        )
+    ).all()
+    for submission_id in submissions:
+        jobs.enqueue(
+            db,
+            "analysis.alignment",
+            {"resource": "video_submission", "id": str(submission_id)},
+            created_by_id=current_user.id,
+        )
+    db.commit()
+    db.refresh(piece)
+
+    print(
+        f"[DB WRITE] PUT /pieces/{piece_id}/reference - User {current_user.id} ({current_user.email}) - {kind} reference, re-aligning {len(submissions)} submissions"
+    )
+    return _piece_response(piece)
+
+
+@app.get("/pieces/{piece_id}/attempts", response_model=list[schemas.MeasureAttempt])
+@limiter.limit(settings.rate_limit_read)
+def list_measure_attempts(
+    request: Request,
+    piece_id: str,
+    start_measure: int,
+    end_measure: int,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Every submission the current user can view (their own, and their students')
+    that plays any of measures start_measure..end_measure, newest first, with
+    where in the video those measures are.
+    """
+    from app import alignment
+
+    if end_measure < start_measure:
+        raise HTTPException(
+            status_code=422, detail="end_measure must not be before start_measure"
+        )
+    piece = alignment.reference_piece(db, _get_owned_piece(db, piece_id, current_user))
+    if piece is None:
+        raise HTTPException(status_code=404, detail="Piece has no reference")
+
+    measure = models.SubmissionMeasure
+    submission = models.VideoSubmission
+    rows = db.exec(
+        select(
+            measure.submission_id,
+            submission.user_id,
+            submission.created_at,
+            func.min(measure.measure),
+            func.max(measure.measure),
+            func.min(measure.start_seconds),
+            func.max(measure.end_seconds),
+        )
+        .join(submission, submission.id == measure.submission_id)
+        .join(models.User, models.User.id == submission.user_id)
+        .where(
+            measure.piece_id == piece.id,
+            measure.measure >= start_measure,
+            measure.measure <= end_measure,
+            or_(
+                submission.user_id == current_user.id,
+                models.User.teacher_id == current_user.id,
+            ),
+        )
+        .group_by(measure.submission_id, submission.user_id, submission.created_at)
+        .order_by(submission.created_at.desc())
+    ).all()
+
+    return [
+        schemas.MeasureAttempt(
+            submission_id=submission_id,
+            user_id=user_id,
+            created_at=created_at,
+            first_measure=first,
+            last_measure=last,
+            start_seconds=start,
+            end_seconds=end,
+        )
+        for submission_id, user_id, created_at, first, last, start, end in rows
+    ]
+
+
+# MARK: - Video Submission Messages
+
+
+@app.get(
+    "/video-submissions/{submission_id}/messages",
+    response_model=list[models.Message],
+)
+def list_submission_messages(
+    submission_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+    uploaded_only: bool = False,
+):
+    from uuid import UUID
+
+    submission = db.get(models.VideoSubmission, UUID(submission_id))
+    if not submission:
+        raise HTTPException(status_code=404, detail="Video submission not found")
+
+    if submission.user_id != current_user.id:
+        student = db.get(models.User, submission.user_id)
+        if not student or student.teacher_id != current_user.id:
+            raise HTTPException(
+                status_code=403, detail="Not authorized to view these messages"
+            )
+
+    query = select(models.Message).where(models.Message.submission_id == submission.id)
+    if uploaded_only:
+        # Text-only messages have nothing to wait for
+        query = query.where(
+            or_(
+                models.Message.video_s3_key.is_(None),
+                models.Message.upload_state == "complete",
+            )
+        )
+
+    messages = db.exec(query.order_by(models.Message.created_at.asc())).all()
+    return list(messages)
+
+
+@app.post(
+    "/video-submissions/{submission_id}/messages",
+    response_model=schemas.MessageCreateResponse,
+)
+def create_submission_message(
+    submission_id: str,
+    message: schemas.MessageCreate,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    from uuid import UUID, uuid4
+    from app import storage
+
+    submission = db.get(models.VideoSubmission, UUID(submission_id))
+    if not submission:
+        raise HTTPException(status_code=404, detail="Video submission not found")
+
+    if submission.user_id != current_user.id:
+        student = db.get(models.User, submission.user_id)
+        if not student or student.teacher_id != current_user.id:
+            raise HTTPException(
+                status_code=403, detail="Not authorized to message this submission"
+            )
+
+    text = message.text.strip() if message.text else None
+    include_video = message.include_video
+    if not text and not include_video:
+        raise HTTPException(
+            status_code=422, detail="Message must include text or a video"
+        )
+
+    if include_video and message.video_duration_seconds is None:
+        raise HTTPException(
+            status_code=422,
+            detail="video_duration_seconds is required for video messages",
+        )
+
+    message_id = uuid4()
+    video_s3_key = (
+        storage.get_message_s3_key(current_user.id, message_id)
+        if include_video
+        else None
+    )
+    thumbnail_s3_key = (
+        storage.get_message_thumbnail_s3_key(current_user.id, message_id)
+        if include_video
+        else None
     )
 
     submission_message = models.Message(
@@ -1535,6 +2319,7 @@ def create_submission_message(
         if include_video
         else None,
         thumbnail_s3_key=thumbnail_s3_key,
+        upload_state="pending" if include_video else None,
     )
 
     db.add(submission_message)
@@ -1542,8 +2327,8 @@ def create_submission_message(
     db.refresh(submission_message)
 
     if include_video:
-        upload_url = s3.generate_message_upload_url(current_user.id, message_id)
-        thumbnail_upload_url = s3.generate_message_thumbnail_upload_url(
+        upload_url = storage.generate_message_upload_url(current_user.id, message_id)
+        thumbnail_upload_url = storage.generate_message_thumbnail_upload_url(
             current_user.id, message_id
         )
 
@@ -1563,11 +2348,12 @@ def create_submission_message(
 )
 def get_message_video_url(
     message_id: str,
+    request: Request,
     current_user: Annotated[models.User, Depends(auth.get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     from uuid import UUID
-    from app import s3
+    from app import storage
 
     message = db.get(models.Message, UUID(message_id))
     if not message:
@@ -1587,15 +2373,721 @@ def get_message_video_url(
                 status_code=403, detail="Not authorized to view this message"
             )
 
-    video_url = s3.generate_download_url(message.video_s3_key)
-    thumbnail_url = (
-        s3.generate_download_url(message.thumbnail_s3_key)
-        if message.thumbnail_s3_key
-        else None
-    )
+    keys = [
+        message.video_s3_key,
+        message.thumbnail_s3_key,
+        message.preview_sprite_s3_key,
+    ]
+    urls = storage.generate_download_urls(key for key in keys if key)
+    thumbnail = urls.get(message.thumbnail_s3_key)
+    sprite = urls.get(message.preview_sprite_s3_key)
+    playlist = _hls_playlist_url(request, message.hls_master_s3_key)
 
     return schemas.MessageVideoUrlResponse(
-        video_url=video_url,
-        thumbnail_url=thumbnail_url,
-        expires_in=3600,
+        video_url=urls[keys[0]]["url"],
+        thumbnail_url=thumbnail["url"] if thumbnail else None,
+        playlist_url=playlist["url"] if playlist else None,
+        sprite_url=sprite["url"] if sprite else None,
+        expires_in=min(url["expires_in"] for url in urls.values()),
+    )
+
+
+# MARK: - Resumable Video Uploads
+
+# Submission and message videos can be uploaded in parts so a dropped connection
+# only costs the part in flight. Parts land at the same key as a single PUT would.
+# Each resource gets its own routes; they resolve the owner's video key and share
+# the helpers below.
+
+
+def _submission_upload_s3_key(
+    db: Session, submission_id: str, current_user: models.User
+) -> str:
+    from uuid import UUID
+
+    submission = db.get(models.VideoSubmission, UUID(submission_id))
+    if not submission:
+        raise HTTPException(status_code=404, detail="Video submission not found")
+    if submission.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to upload this submission"
+        )
+    return submission.s3_key
+
+
+def _message_upload_s3_key(
+    db: Session, message_id: str, current_user: models.User
+) -> str:
+    from uuid import UUID
+
+    message = db.get(models.Message, UUID(message_id))
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    if message.sender_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to upload this message"
+        )
+    if not message.video_s3_key:
+        raise HTTPException(status_code=404, detail="Message video not found")
+    return message.video_s3_key
+
+
+def _start_video_multipart_upload(
+    s3_key: str,
+) -> schemas.MultipartUploadStartResponse:
+    from app import storage
+
+    upload_id = storage.create_multipart_upload(s3_key, "video/mp4")
+    return schemas.MultipartUploadStartResponse(
+        upload_id=upload_id, part_size=settings.s3_multipart_part_size
+    )
+
+
+def _video_part_upload_urls(
+    s3_key: str, upload_id: str, parts: schemas.MultipartPartUrlsRequest
+) -> schemas.MultipartPartUrlsResponse:
+    from app import storage
+
+    presigned = storage.generate_part_upload_urls(s3_key, upload_id, parts.part_numbers)
+    return schemas.MultipartPartUrlsResponse(
+        urls=presigned["urls"], expires_in=presigned["expires_in"]
+    )
+
+
+def _video_uploaded_parts(s3_key: str, upload_id: str) -> list[dict]:
+    from app import storage
+
+    parts = storage.list_uploaded_parts(s3_key, upload_id)
+    if parts is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return parts
+
+
+def _list_video_uploaded_parts(
+    s3_key: str, upload_id: str
+) -> list[schemas.UploadedPart]:
+    return [
+        schemas.UploadedPart(
+            part_number=part["PartNumber"], etag=part["ETag"], size=part["Size"]
+        )
+        for part in _video_uploaded_parts(s3_key, upload_id)
+    ]
+
+
+def _complete_video_multipart_upload(s3_key: str, upload_id: str) -> dict:
+    """Assemble every uploaded part; parts must run 1..N without gaps"""
+    from app import storage
+
+    parts = _video_uploaded_parts(s3_key, upload_id)
+    part_numbers = [part["PartNumber"] for part in parts]
+    if not part_numbers or part_numbers != list(range(1, len(part_numbers) + 1)):
+        raise HTTPException(status_code=409, detail="Upload is missing parts")
+
+    storage.complete_multipart_upload(
+        s3_key,
+        upload_id,
+        [{"PartNumber": part["PartNumber"], "ETag": part["ETag"]} for part in parts],
+    )
+    return {"message": "Upload completed successfully"}
+
+
+def _abort_video_multipart_upload(s3_key: str, upload_id: str) -> dict:
+    from app import storage
+
+    storage.abort_multipart_upload(s3_key, upload_id)
+    return {"message": "Upload aborted successfully"}
+
+
+@app.post(
+    "/video-submissions/{submission_id}/multipart-uploads",
+    response_model=schemas.MultipartUploadStartResponse,
+)
+def start_submission_multipart_upload(
+    submission_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _submission_upload_s3_key(db, submission_id, current_user)
+    return _start_video_multipart_upload(s3_key)
+
+
+@app.post(
+    "/video-submissions/{submission_id}/multipart-uploads/{upload_id}/part-urls",
+    response_model=schemas.MultipartPartUrlsResponse,
+)
+def get_submission_part_upload_urls(
+    submission_id: str,
+    upload_id: str,
+    parts: schemas.MultipartPartUrlsRequest,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _submission_upload_s3_key(db, submission_id, current_user)
+    return _video_part_upload_urls(s3_key, upload_id, parts)
+
+
+@app.get(
+    "/video-submissions/{submission_id}/multipart-uploads/{upload_id}/parts",
+    response_model=list[schemas.UploadedPart],
+)
+def list_submission_uploaded_parts(
+    submission_id: str,
+    upload_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """Parts already received, so a client can resume where it left off"""
+    s3_key = _submission_upload_s3_key(db, submission_id, current_user)
+    return _list_video_uploaded_parts(s3_key, upload_id)
+
+
+@app.post("/video-submissions/{submission_id}/multipart-uploads/{upload_id}/complete")
+def complete_submission_multipart_upload(
+    submission_id: str,
+    upload_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _submission_upload_s3_key(db, submission_id, current_user)
+    return _complete_video_multipart_upload(s3_key, upload_id)
+
+
+@app.delete("/video-submissions/{submission_id}/multipart-uploads/{upload_id}")
+def abort_submission_multipart_upload(
+    submission_id: str,
+    upload_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _submission_upload_s3_key(db, submission_id, current_user)
+    return _abort_video_multipart_upload(s3_key, upload_id)
+
+
+@app.post(
+    "/messages/{message_id}/multipart-uploads",
+    response_model=schemas.MultipartUploadStartResponse,
+)
+def start_message_multipart_upload(
+    message_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _message_upload_s3_key(db, message_id, current_user)
+    return _start_video_multipart_upload(s3_key)
+
+
+@app.post(
+    "/messages/{message_id}/multipart-uploads/{upload_id}/part-urls",
+    response_model=schemas.MultipartPartUrlsResponse,
+)
+def get_message_part_upload_urls(
+    message_id: str,
+    upload_id: str,
+    parts: schemas.MultipartPartUrlsRequest,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _message_upload_s3_key(db, message_id, current_user)
+    return _video_part_upload_urls(s3_key, upload_id, parts)
+
+
+@app.get(
+    "/messages/{message_id}/multipart-uploads/{upload_id}/parts",
+    response_model=list[schemas.UploadedPart],
+)
+def list_message_uploaded_parts(
+    message_id: str,
+    upload_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """Parts already received, so a client can resume where it left off"""
+    s3_key = _message_upload_s3_key(db, message_id, current_user)
+    return _list_video_uploaded_parts(s3_key, upload_id)
+
+
+@app.post("/messages/{message_id}/multipart-uploads/{upload_id}/complete")
+def complete_message_multipart_upload(
+    message_id: str,
+    upload_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _message_upload_s3_key(db, message_id, current_user)
+    return _complete_video_multipart_upload(s3_key, upload_id)
+
+
+@app.delete("/messages/{message_id}/multipart-uploads/{upload_id}")
+def abort_message_multipart_upload(
+    message_id: str,
+    upload_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    s3_key = _message_upload_s3_key(db, message_id, current_user)
+    return _abort_video_multipart_upload(s3_key, upload_id)
+
+
+# MARK: - Upload Finalization
+
+# A submission or message video is "pending" until its object is confirmed in S3.
+# Finalizing HEADs the object and records its size and ETag ("uploaded"); an
+# uploads.probe_video job then hashes the file and probes the container so the
+# content hash and duration/resolution come from the file rather than the client
+# ("complete", or "invalid"), and queues its
+# processing. Clients call the finalize endpoints after uploading; S3
+# ObjectCreated events forwarded to /webhooks/s3 cover clients that never get
+# that far.
+
+
+def _finalize_video_upload(
+    db: Session, record: models.VideoSubmission | models.Message, s3_key: str
+) -> bool:
+    """
+    Record upload facts on `record` and queue its probe in the same transaction.
+    Returns False if the object isn't in S3.
+    """
+    from app import storage, tasks
+
+    head = storage.head_object(s3_key)
+    if head is None:
+        return False
+
+    # Duplicate events and client retries for an object we've already recorded.
+    # The ETag only tells versions of the object apart: for multipart uploads it
+    # isn't a hash of the content.
+    if record.upload_state != "pending" and record.etag == head["etag"]:
+        return True
+
+    record.size_bytes = head["size"]
+    record.etag = head["etag"]
+    record.uploaded_at = datetime.now(timezone.utc)
+    record.upload_state = "uploaded"
+    tasks.enqueue_upload_probe(db, record)
+    return True
+
+
+@app.post(
+    "/video-submissions/{submission_id}/finalize",
+    response_model=models.VideoSubmission,
+)
+def finalize_video_submission(
+    submission_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    from uuid import UUID
+
+    submission = db.get(models.VideoSubmission, UUID(submission_id))
+    if not submission:
+        raise HTTPException(status_code=404, detail="Video submission not found")
+
+    if submission.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to finalize this submission"
+        )
+
+    if not _finalize_video_upload(db, submission, submission.s3_key):
+        raise HTTPException(status_code=409, detail="Video has not been uploaded")
+
+    db.add(submission)
+    db.commit()
+    db.refresh(submission)
+    return submission
+
+
+@app.post("/messages/{message_id}/finalize", response_model=models.Message)
+def finalize_message_video(
+    message_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    from uuid import UUID
+
+    message = db.get(models.Message, UUID(message_id))
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    if not message.video_s3_key:
+        raise HTTPException(status_code=404, detail="Message video not found")
+
+    if message.sender_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to finalize this message"
+        )
+
+    if not _finalize_video_upload(db, message, message.video_s3_key):
+        raise HTTPException(status_code=409, detail="Video has not been uploaded")
+
+    db.add(message)
+    db.commit()
+    db.refresh(message)
+    return message
+
+
+@app.post("/webhooks/s3")
+def handle_s3_event(
+    event: dict,
+    db: Annotated[Session, Depends(get_db)],
+    x_webhook_secret: Annotated[str | None, Header()] = None,
+):
+    """
+    Finalize uploads from S3 event notifications.
+
+    Accepts the S3 event notification document ({"Records": [...]}) as delivered
+    by SNS/EventBridge/Lambda forwarders, or by `python dev.py s3-event` locally.
+    """
+    import hmac
+    from urllib.parse import unquote_plus
+
+    if not x_webhook_secret or not hmac.compare_digest(
+        x_webhook_secret, settings.s3_webhook_secret
+    ):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
+
+    keys = {
+        unquote_plus(record["s3"]["object"]["key"])
+        for record in event.get("Records", [])
+        if record.get("eventName", "").startswith("ObjectCreated:")
+    }
+    if not keys:
+        return {"finalized": 0}
+
+    submissions = db.exec(
+        select(models.VideoSubmission).where(models.VideoSubmission.s3_key.in_(keys))
+    ).all()
+    messages = db.exec(
+        select(models.Message).where(models.Message.video_s3_key.in_(keys))
+    ).all()
+
+    finalized = 0
+    for submission in submissions:
+        if _finalize_video_upload(db, submission, submission.s3_key):
+            db.add(submission)
+            finalized += 1
+    for message in messages:
+        if _finalize_video_upload(db, message, message.video_s3_key):
+            db.add(message)
+            finalized += 1
+
+    db.commit()
+    return {"finalized": finalized}
+
+
+# MARK: - Local Storage
+
+# With STORAGE_BACKEND=local, presigned URLs point here instead of at S3. Requests
+# are authorized by the URL signature alone, like S3's, so they carry no bearer token.
+
+
+@app.api_route("/storage/{s3_key:path}", methods=["GET", "HEAD"])
+def download_stored_object(s3_key: str, request: Request):
+    """Serve an object, honoring a single Range (206) for seeking"""
+    from app import local_storage
+
+    if settings.storage_backend != "local":
+        raise HTTPException(status_code=404, detail="Not found")
+    if not local_storage.verify(
+        request.method, s3_key, request.query_params, request.headers
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    try:
+        return local_storage.file_response(s3_key, request.headers.get("range"))
+    except (FileNotFoundError, ValueError):
+        raise HTTPException(status_code=404, detail="Object not found")
+
+
+@app.put("/storage/{s3_key:path}")
+async def upload_stored_object(s3_key: str, request: Request):
+    """Receive an object, or one part of a multipart upload"""
+    from fastapi import Response
+    from app import local_storage
+
+    if settings.storage_backend != "local":
+        raise HTTPException(status_code=404, detail="Not found")
+    if not local_storage.verify("PUT", s3_key, request.query_params, request.headers):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    upload_id = request.query_params.get("uploadId")
+    part_number = request.query_params.get("partNumber")
+    try:
+        etag = await local_storage.receive_upload(
+            s3_key,
+            request.stream(),
+            upload_id=upload_id,
+            part_number=int(part_number) if part_number else None,
+            checksum=request.headers.get("x-amz-checksum-sha256"),
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(headers={"ETag": etag})
+
+
+# MARK: - HLS Playback
+
+# Transcoded videos are played from /hls/{token}/master.m3u8. The token grants one
+# video's HLS prefix until it expires (with the segment URLs, on the hour), so the
+# player needs no Authorization header and relative playlist URIs just work.
+
+
+def _hls_playlist_url(request: Request, hls_master_s3_key: str | None) -> dict | None:
+    """Absolute master playlist URL for a transcoded video, else None"""
+    from app import hls
+
+    if not hls_master_s3_key:
+        return None
+    signed = hls.playlist_path(hls_master_s3_key.removesuffix(hls.MASTER_PLAYLIST))
+    return {
+        "url": f"{str(request.base_url).rstrip('/')}{signed['path']}",
+        "expires_in": signed["expires_in"],
+    }
+
+
+@app.get("/hls/{token}/{playlist:path}")
+def get_hls_playlist(token: str, playlist: str):
+    """Master playlist as stored; media playlists with signed segment URLs"""
+    from fastapi import Response
+    from app import hls
+
+    hls_prefix = hls.prefix_from_token(token)
+    if hls_prefix is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired playlist")
+
+    rendition, _, name = playlist.rpartition("/")
+    if name == hls.MASTER_PLAYLIST and not rendition:
+        key = f"{hls_prefix}{hls.MASTER_PLAYLIST}"
+    elif name == hls.MEDIA_PLAYLIST and rendition.isalnum():
+        key = f"{hls_prefix}{rendition}/{hls.MEDIA_PLAYLIST}"
+    else:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    try:
+        body = hls.read_playlist(key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    # Playlists are good for as long as the URLs in them
+    max_age = hls.PLAYLIST_MAX_AGE_SECONDS
+    if rendition:
+        body, max_age = hls.sign_media_playlist(body, f"{hls_prefix}{rendition}/")
+
+    return Response(
+        content=body,
+        media_type=hls.PLAYLIST_CONTENT_TYPE,
+        headers={"Cache-Control": f"private, max-age={max_age}"},
+    )
+
+
+# MARK: - Waveforms
+
+# Peaks (format in app.waveform) are a few KB, so they're served inline rather
+# than through a presigned URL round trip.
+
+
+def _waveform_response(waveform_s3_key: str | None, request: Request):
+    import hashlib
+    from fastapi import Response
+    from app import waveform
+
+    if not waveform_s3_key:
+        raise HTTPException(status_code=404, detail="Waveform not available")
+
+    try:
+        data = waveform.read_peaks(waveform_s3_key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Waveform not available")
+
+    etag = f'"{hashlib.md5(data).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=waveform.CONTENT_TYPE, headers=headers)
+
+
+@app.get("/video-submissions/{submission_id}/waveform")
+def get_video_submission_waveform(
+    submission_id: str,
+    request: Request,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    submission = _get_viewable_submission(db, submission_id, current_user)
+    return _waveform_response(submission.waveform_s3_key, request)
+
+
+@app.get("/messages/{message_id}/waveform")
+def get_message_waveform(
+    message_id: str,
+    request: Request,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    from uuid import UUID
+
+    message = db.get(models.Message, UUID(message_id))
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    submission = db.get(models.VideoSubmission, message.submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Video submission not found")
+
+    if submission.user_id != current_user.id:
+        student = db.get(models.User, submission.user_id)
+        if not student or student.teacher_id != current_user.id:
+            raise HTTPException(
+                status_code=403, detail="Not authorized to view this message"
+            )
+
+    return _waveform_response(message.waveform_s3_key, request)
+
+
+# MARK: - Jobs
+
+
+def _job_status(job: models.Job) -> schemas.JobStatus:
+    return schemas.JobStatus(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        error=job.last_error.strip().splitlines()[-1] if job.last_error else None,
+        result=job.result,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobStatus)
+def get_job_status(
+    job_id: str,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    from uuid import UUID
+
+    job = db.get(models.Job, UUID(job_id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.created_by_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this job")
+
+    return _job_status(job)
+
+
+# MARK: - Batch Downloads
+
+
+@app.post("/download-urls", response_model=schemas.DownloadUrlBatchResponse)
+def get_download_urls(
+    batch: schemas.DownloadUrlBatchRequest,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Presign downloads for a mix of pieces, submissions and messages.
+
+    Authorization runs as one query per resource type; anything missing or not
+    visible to the caller is reported in `unavailable` instead of failing the batch.
+    """
+    from uuid import UUID
+    from app import storage
+
+    requested: dict[str, set[UUID]] = {
+        "piece": set(),
+        "video_submission": set(),
+        "message": set(),
+    }
+    for resource in batch.resources:
+        requested[resource.type].add(resource.id)
+
+    # (type, id) -> (s3_key, thumbnail_s3_key)
+    found: dict[tuple[str, UUID], tuple[str, str | None]] = {}
+
+    if requested["piece"]:
+        pieces = db.exec(
+            select(models.Piece).where(
+                models.Piece.id.in_(requested["piece"]),
+                models.Piece.owner_id == current_user.id,
+                models.Piece.s3_key.isnot(None),
+            )
+        ).all()
+        for piece in pieces:
+            found[("piece", piece.id)] = (piece.s3_key, None)
+
+    visible_submission = (models.VideoSubmission.user_id == current_user.id) | (
+        models.User.teacher_id == current_user.id
+    )
+
+    if requested["video_submission"]:
+        submissions = db.exec(
+            select(models.VideoSubmission)
+            .join(models.User, models.User.id == models.VideoSubmission.user_id)
+            .where(
+                models.VideoSubmission.id.in_(requested["video_submission"]),
+                visible_submission,
+            )
+        ).all()
+        for submission in submissions:
+            found[("video_submission", submission.id)] = (
+                submission.s3_key,
+                submission.thumbnail_s3_key,
+            )
+
+    if requested["message"]:
+        messages = db.exec(
+            select(models.Message)
+            .join(
+                models.VideoSubmission,
+                models.VideoSubmission.id == models.Message.submission_id,
+            )
+            .join(models.User, models.User.id == models.VideoSubmission.user_id)
+            .where(
+                models.Message.id.in_(requested["message"]),
+                models.Message.video_s3_key.isnot(None),
+                visible_submission,
+            )
+        ).all()
+        for message in messages:
+            found[("message", message.id)] = (
+                message.video_s3_key,
+                message.thumbnail_s3_key,
+            )
+
+    signed = storage.generate_download_urls(
+        key for keys in found.values() for key in keys if key
+    )
+
+    urls = []
+    unavailable = []
+    for resource in batch.resources:
+        keys = found.get((resource.type, resource.id))
+        if keys is None:
+            unavailable.append(resource)
+            continue
+        s3_key, thumbnail_s3_key = keys
+        urls.append(
+            schemas.DownloadUrl(
+                type=resource.type,
+                id=resource.id,
+                url=signed[s3_key]["url"],
+                thumbnail_url=(
+                    signed[thumbnail_s3_key]["url"] if thumbnail_s3_key else None
+                ),
+            )
+        )
+
+    return schemas.DownloadUrlBatchResponse(
+        urls=urls,
+        unavailable=unavailable,
+        expires_in=min(
+            (url["expires_in"] for url in signed.values()),
+            default=storage.DOWNLOAD_URL_BUCKET_SECONDS,
+        ),
     )
@@ -0,0 +1,156 @@
+"""Media inspection and processing for uploaded videos, backed by ffprobe/ffmpeg."""
+
+import json
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+from app.config import settings
+
+
+@dataclass
+class MediaInfo:
+    duration_seconds: float
+    width: int | None
+    height: int | None
+    video_codec: str | None
+    audio_codec: str | None
+
+
+def probe(url: str) -> MediaInfo | None:
+    """
+    Read container metadata from a local path or (presigned) URL.
+
+    ffprobe only fetches the byte ranges it needs, not the whole file. Returns None
+    if the input is not a readable media file or probing times out.
+    """
+    try:
+        result = subprocess.run(
+            [
+                settings.ffprobe_path,
+                "-v",
+                "error",
+                "-print_format",
+                "json",
+                "-show_format",
+                "-show_streams",
+                url,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=settings.media_probe_timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode != 0:
+        return None
+
+    output = json.loads(result.stdout)
+    duration = output.get("format", {}).get("duration")
+    if duration is None:
+        return None
+
+    streams = output.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    return MediaInfo(
+        duration_seconds=float(duration),
+        width=video.get("width"),
+        height=video.get("height"),
+        video_codec=video.get("codec_name"),
+        audio_codec=audio.get("codec_name"),
+    )
+
+
+def run_ffmpeg(args: list[str], timeout: float | None = None) -> None:
+    """
+    Run ffmpeg with `args` (inputs, filters, outputs).
+
+    Inputs may be presigned URLs; ffmpeg streams them rather than downloading
+    the whole file first. Raises with the tail of ffmpeg's log on failure.
+    """
+    timeout = timeout or settings.media_transcode_timeout
+    try:
+        result = subprocess.run(
+            [settings.ffmpeg_path, "-hide_banner", "-nostdin", "-v", "error", *args],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception(f"ffmpeg timed out after {timeout}s")
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.strip()[-2000:]}")
+
+
+def extract_clip(input_url: str, out_path: str, start: float, end: float) -> None:
+    """
+    Copy [start, end) of `input_url` into an MP4 at `out_path` without re-encoding.
+
+    Stream copy can only cut on keyframes, so the clip starts at the last keyframe
+    at or before `start` (at most a couple of seconds early for phone recordings)
+    and runs to `end`. Seeking on the input means only the byte ranges in between
+    are fetched.
+    """
+    run_ffmpeg(
+        [
+            "-ss",
+            f"{start:.3f}",
+            "-to",
+            f"{end:.3f}",
+            "-i",
+            input_url,
+            "-map",
+            "0:v?",
+            "-map",
+            "0:a?",
+            "-c",
+            "copy",
+            "-avoid_negative_ts",
+            "make_zero",
+            "-movflags",
+            "+faststart",
+            "-y",
+            out_path,
+        ]
+    )
+
+
+def stream_ffmpeg(
+    args: list[str], timeout: float | None = None, chunk_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    """
+    Run ffmpeg with output to pipe:1 and yield its stdout as it's produced.
+
+    Nothing is buffered beyond one chunk, however long the input. Raises like
+    run_ffmpeg if ffmpeg fails or runs past `timeout`.
+    """
+    timeout = timeout or settings.media_transcode_timeout
+    deadline = time.monotonic() + timeout
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [settings.ffmpeg_path, "-hide_banner", "-nostdin", "-v", "error", *args],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        )
+        try:
+            while chunk := process.stdout.read(chunk_size):
+                if time.monotonic() > deadline:
+                    raise Exception(f"ffmpeg timed out after {timeout}s")
+                yield chunk
+            returncode = process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+        except subprocess.TimeoutExpired:
+            raise Exception(f"ffmpeg timed out after {timeout}s")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+        if returncode != 0:
+            stderr.seek(0)
+            log = stderr.read().decode(errors="replace").strip()
+            raise Exception(f"ffmpeg failed: {log[-2000:]}")
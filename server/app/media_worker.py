@@ -0,0 +1,323 @@
+"""
+Worker for CPU-heavy media and analysis jobs (media.*, analysis.*).
+
+The API never runs these: endpoints only enqueue them. This process claims them
+and runs each in a concurrent.futures process pool, one process per core by
+default, so a backfill of thousands of videos saturates the box it runs on
+rather than the API's. Pool processes are niced, capped in address space (ffmpeg
+inherits the cap) and recycled every MAX_JOBS_PER_PROCESS jobs; each job has a
+wall-clock limit, and a job over either limit fails (and is retried) like any
+other exception.
+
+Only job ids cross the process boundary: handlers read their inputs by
+streaming from storage (presigned URLs into ffmpeg), never as whole files.
+
+The parent renews the leases of running jobs, so long transcodes aren't handed
+out again, and prints throughput and queue lag (how long runnable jobs waited
+to be claimed) every --report-interval seconds.
+
+Usage:
+    python -m app.media_worker                # Run until SIGTERM/SIGINT
+    python -m app.media_worker --once         # Drain runnable jobs, then exit
+    python -m app.media_worker --processes 4
+
+app.worker leaves these jobs to this process (unless run with --include-media),
+so the light jobs don't queue behind media work.
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import signal
+import socket
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable
+from uuid import UUID
+
+from sqlmodel import Session
+
+from app import jobs, models, tasks  # noqa: F401 - registers job handlers
+from app.config import settings
+
+MEDIA_JOB_PREFIXES = ("media.", "analysis.")
+# Fresh processes now and then hand fragmented heap back to the OS
+MAX_JOBS_PER_PROCESS = 20
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def available_cores() -> int:
+    """Cores this process may run on (container CPU sets included)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS
+        return os.cpu_count() or 1
+
+
+# MARK: - Pool processes
+
+
+def _init_process(memory_limit_mb: int, nice: int) -> None:
+    """Applies the per-process limits in each pool process."""
+    # The parent handles shutdown; a terminal's Ctrl-C shouldn't kill jobs
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if nice:
+        os.nice(nice)
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+@contextmanager
+def time_limit(seconds: float | None):
+    """Raise JobTimeout in the calling (main) thread after `seconds`."""
+    if not seconds:
+        yield
+        return
+
+    def expire(signum, frame):
+        raise JobTimeout(f"Job exceeded its {seconds:g}s time limit")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run_job(job_id: str, worker_id: str, seconds: float | None) -> str:
+    """
+    Run a job `worker_id` claimed in a pool process. Returns its status, or
+    "lost" if another worker holds the job now.
+    """
+    from app.database import engine
+
+    with Session(engine) as db:
+        job = db.get(models.Job, UUID(job_id))
+        if job is None:
+            return "missing"
+        if job.status != "running" or job.locked_by != worker_id:
+            return "lost"
+        with time_limit(seconds):
+            job = jobs.execute(db, job)
+        # execute() leaves a job it no longer holds to its new worker
+        if job is None or job.locked_by not in (None, worker_id):
+            return "lost"
+        return job.status
+
+
+def create_pool(processes: int, memory_limit_mb: int, nice: int) -> ProcessPoolExecutor:
+    # Spawned, not forked: no inherited database connections or locks
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_process,
+        initargs=(memory_limit_mb, nice),
+        max_tasks_per_child=MAX_JOBS_PER_PROCESS,
+    )
+
+
+# MARK: - Dispatch
+
+
+@dataclass
+class WorkerStats:
+    started: float = field(default_factory=time.monotonic)
+    finished: Counter = field(default_factory=Counter)  # By status
+    # Since the last report
+    interval_finished: int = 0
+    queue_lags: list[float] = field(default_factory=list)
+    run_seconds: list[float] = field(default_factory=list)
+
+    def record_claim(self, job: models.Job) -> None:
+        run_at = job.run_at
+        if run_at.tzinfo is None:
+            run_at = run_at.replace(tzinfo=timezone.utc)
+        lag = (datetime.now(timezone.utc) - run_at).total_seconds()
+        self.queue_lags.append(max(lag, 0.0))
+
+    def record_finish(self, status: str, seconds: float) -> None:
+        self.finished[status] += 1
+        self.interval_finished += 1
+        self.run_seconds.append(seconds)
+
+    def report(self, interval: float, busy: int, processes: int, runnable: int) -> str:
+        """One metrics line, resetting the per-interval figures."""
+        lags = self.queue_lags or [0.0]
+        line = (
+            f"[METRICS] {self.interval_finished / interval * 60:.1f} jobs/min, "
+            f"busy {busy}/{processes}, runnable {runnable}, "
+            f"queue lag p50 {statistics.median(lags):.1f}s max {max(lags):.1f}s, "
+            f"run p50 {statistics.median(self.run_seconds or [0.0]):.1f}s, "
+            f"total {dict(self.finished)}"
+        )
+        self.interval_finished = 0
+        self.queue_lags = []
+        self.run_seconds = []
+        return line
+
+
+def dispatch(
+    db: Session,
+    new_executor: Callable[[], Executor],
+    worker_id: str,
+    *,
+    processes: int,
+    job_time_limit: float | None,
+    once: bool = False,
+    poll_interval: float = 1.0,
+    report_interval: float = 60.0,
+    should_stop=lambda: False,
+    stats: WorkerStats | None = None,
+) -> WorkerStats:
+    """
+    Keep `processes` jobs running on an executor from new_executor() until
+    should_stop() (or, with `once`, until nothing is runnable), then wait for the
+    jobs in hand. A pool broken by a dead process is replaced.
+    """
+    stats = stats or WorkerStats()
+    executor = new_executor()
+    in_flight: dict[Future, tuple[UUID, float]] = {}
+    # Running jobs whose lease another worker took over: no longer renewed, but
+    # they keep their pool process until they finish
+    lost: set[UUID] = set()
+    renew_every = settings.job_lease_seconds / 3
+    last_renewal = last_report = time.monotonic()
+
+    while True:
+        stopping = should_stop()
+        while not stopping and len(in_flight) < processes:
+            job = jobs.claim(db, worker_id, only=MEDIA_JOB_PREFIXES)
+            if job is None:
+                break
+            stats.record_claim(job)
+            args = (str(job.id), worker_id, job_time_limit)
+            try:
+                future = executor.submit(run_job, *args)
+            except BrokenExecutor:
+                executor.shutdown(wait=False)
+                executor = new_executor()
+                future = executor.submit(run_job, *args)
+            in_flight[future] = (job.id, time.monotonic())
+
+        if not in_flight:
+            if stopping or once:
+                break
+            time.sleep(poll_interval)
+        else:
+            done, _ = wait(
+                in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                job_id, submitted = in_flight.pop(future)
+                lost.discard(job_id)
+                try:
+                    status = future.result()
+                except Exception as e:
+                    # The job's process died (e.g. killed for memory) before
+                    # recording an outcome. That counts as a failed attempt, so a
+                    # job that always crashes fails rather than crash-looping the
+                    # pool; jobs that shared a broken pool lose an attempt too.
+                    status = "crashed"
+                    print(f"[JOB] {job_id} crashed: {e!r}")
+                    jobs.record_crash(db, job_id, worker_id, f"Worker crashed: {e!r}")
+                stats.record_finish(status, time.monotonic() - submitted)
+
+        now = time.monotonic()
+        if in_flight and now - last_renewal >= renew_every:
+            held = [job_id for job_id, _ in in_flight.values() if job_id not in lost]
+            renewed = set(jobs.renew(db, held, worker_id))
+            for job_id in held:
+                if job_id not in renewed:
+                    print(f"[JOB] {job_id}: lease lost, no longer renewed")
+                    lost.add(job_id)
+            last_renewal = now
+        if now - last_report >= report_interval:
+            runnable = jobs.runnable_count(db, only=MEDIA_JOB_PREFIXES)
+            print(stats.report(now - last_report, len(in_flight), processes, runnable))
+            last_report = now
+
+    executor.shutdown()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--once", action="store_true", help="Exit when no job is runnable"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=settings.media_worker_processes or available_cores(),
+        help="Jobs run at once (default: one per core)",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between metrics lines",
+    )
+    args = parser.parse_args()
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    # Finish the jobs in hand, then exit
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    from app.database import engine
+    from app.migrations import check_schema
+
+    check_schema(engine)
+    print(f"Media worker {worker_id} started with {args.processes} processes")
+    with Session(engine) as db:
+        stats = dispatch(
+            db,
+            lambda: create_pool(
+                args.processes,
+                settings.media_job_memory_limit_mb,
+                settings.media_worker_nice,
+            ),
+            worker_id,
+            processes=args.processes,
+            job_time_limit=settings.media_job_time_limit,
+            once=args.once,
+            poll_interval=settings.worker_poll_interval,
+            report_interval=args.report_interval,
+            should_stop=lambda: stopping,
+        )
+    elapsed = time.monotonic() - stats.started
+    print(
+        f"Media worker {worker_id} stopped after {elapsed:.0f}s: {dict(stats.finished)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Schema upgrades for databases created before a column or index existed.
+
+create_all() (app.database) creates missing tables but never alters existing
+ones, so columns and indexes added to tables that predate them are listed here
+and applied by this script. The API and workers refuse to start while the
+schema is behind; run it before deploying code that needs them:
+
+    python -m app.migrations            # Dry run: list what's missing
+    python -m app.migrations --apply    # Add columns and indexes
+
+Columns are added in one transaction per table, together with any backfill
+their rows need. Indexes are built with CREATE INDEX CONCURRENTLY on Postgres
+so writes aren't blocked while large tables are indexed; an invalid index left
+by an interrupted build is dropped and rebuilt on the next run.
+"""
+
+import argparse
+from functools import cache
+from itertools import islice
+
+from sqlalchemy import Engine, bindparam, inspect, select, text, update
+from sqlmodel import SQLModel
+
+from app import models, storage
+
+# (table, column) added to tables that existed before the column did. Types,
+# nullability and foreign keys come from the models; NOT NULL columns need a
+# server default here.
+COLUMNS = [
+    ("pieces", "blob_sha256"),
+    ("pieces", "reference_kind"),
+    ("pieces", "reference_s3_key"),
+    ("pieces", "reference_measure_times"),
+    ("pieces", "preview_s3_key"),
+    ("pieces", "page_preview_count"),
+    ("video_submissions", "upload_state"),
+    ("video_submissions", "size_bytes"),
+    ("video_submissions", "etag"),
+    ("video_submissions", "sha256"),
+    ("video_submissions", "width"),
+    ("video_submissions", "height"),
+    ("video_submissions", "video_codec"),
+    ("video_submissions", "uploaded_at"),
+    ("video_submissions", "hls_master_s3_key"),
+    ("video_submissions", "hls_renditions"),
+    ("video_submissions", "preview_sprite_s3_key"),
+    ("video_submissions", "preview_sprite"),
+    ("video_submissions", "waveform_s3_key"),
+    ("messages", "upload_state"),
+    ("messages", "size_bytes"),
+    ("messages", "etag"),
+    ("messages", "sha256"),
+    ("messages", "width"),
+    ("messages", "height"),
+    ("messages", "video_codec"),
+    ("messages", "uploaded_at"),
+    ("messages", "hls_master_s3_key"),
+    ("messages", "hls_renditions"),
+    ("messages", "preview_sprite_s3_key"),
+    ("messages", "preview_sprite"),
+    ("messages", "waveform_s3_key"),
+]
+
+SERVER_DEFAULTS = {("video_submissions", "upload_state"): "'pending'"}
+
+# Indexes on tables that existed before them: name -> (table, columns, where)
+INDEXES = {
+    "ix_users_teacher_id": ("users", "teacher_id", None),
+    # Unreviewed submissions in review-queue order
+    "ix_video_submissions_pending_review": (
+        "video_submissions",
+        "created_at, id",
+        "reviewed_at IS NULL",
+    ),
+    "ix_pieces_s3_key": ("pieces", "s3_key", None),
+    "ix_pieces_blob_sha256": ("pieces", "blob_sha256", None),
+    "ix_video_submissions_s3_key": ("video_submissions", "s3_key", None),
+    "ix_video_submissions_upload_state": ("video_submissions", "upload_state", None),
+    "ix_messages_video_s3_key": ("messages", "video_s3_key", None),
+}
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def missing_schema(engine: Engine) -> list[str]:
+    """Columns ("table.column") and indexes the models have but the database lacks."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            missing.append(table.name)
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing += [
+            f"{table.name}.{column.name}"
+            for column in table.columns
+            if column.name not in columns
+        ]
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing += [index.name for index in table.indexes if index.name not in indexes]
+    return missing
+
+
+def check_schema(engine: Engine) -> None:
+    """Raise unless the database has every table, column and index of the models."""
+    missing = missing_schema(engine)
+    if missing:
+        raise RuntimeError(
+            f"Database schema is behind the models (missing {', '.join(missing)}); "
+            "run `python -m app.migrations --apply`"
+        )
+
+
+def _column_ddl(engine: Engine, table_name: str, column_name: str) -> str:
+    column = SQLModel.metadata.tables[table_name].columns[column_name]
+    ddl = f"{column.name} {column.type.compile(dialect=engine.dialect)}"
+    default = SERVER_DEFAULTS.get((table_name, column_name))
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    for foreign_key in column.foreign_keys:
+        target = foreign_key.column
+        ddl += f" REFERENCES {target.table.name} ({target.name})"
+    return ddl
+
+
+def _stored_videos() -> dict[str, dict]:
+    """Objects under the videos prefix, by key."""
+    prefix = storage.get_gc_prefixes()[1]
+    return {obj["key"]: obj for obj in storage.list_objects(prefix)}
+
+
+def _backfill_upload_state(connection, table, key_column, stored: dict) -> int:
+    """Mark rows whose video is already in storage complete. Returns how many."""
+    keys = connection.execute(
+        select(key_column).where(key_column.is_not(None))
+    ).scalars()
+    found = [stored[key] for key in keys if key in stored]
+    statement = (
+        update(table)
+        .where(key_column == bindparam("stored_key"))
+        .values(
+            upload_state="complete",
+            size_bytes=bindparam("stored_size"),
+            uploaded_at=bindparam("stored_at"),
+        )
+    )
+    rows = iter(found)
+    while batch := list(islice(rows, BACKFILL_BATCH_SIZE)):
+        connection.execute(
+            statement,
+            [
+                {
+                    "stored_key": obj["key"],
+                    "stored_size": obj["size"],
+                    "stored_at": obj["last_modified"],
+                }
+                for obj in batch
+            ],
+        )
+    return len(found)
+
+
+def _backfill(connection, table_name: str, added: set[str], stored) -> None:
+    # Videos uploaded before finalization existed never went through it: treat
+    # the ones whose object is in storage as uploaded and processed
+    if "upload_state" not in added:
+        return
+    if table_name == "video_submissions":
+        table = models.VideoSubmission.__table__
+        key_column = table.c.s3_key
+    else:
+        table = models.Message.__table__
+        key_column = table.c.video_s3_key
+        # Message videos still missing their object are waiting for an upload
+        connection.execute(
+            update(table).where(key_column.is_not(None)).values(upload_state="pending")
+        )
+    completed = _backfill_upload_state(connection, table, key_column, stored())
+    print(f"[MIGRATE] {table_name}: {completed} existing videos marked complete")
+
+
+def add_columns(engine: Engine, *, dry_run: bool = True) -> list[str]:
+    """Add missing COLUMNS, one transaction per table. Returns "table.column"s."""
+    inspector = inspect(engine)
+    by_table: dict[str, list[str]] = {}
+    for table_name, column_name in COLUMNS:
+        by_table.setdefault(table_name, []).append(column_name)
+
+    stored = cache(_stored_videos)  # Listed once, and only if a backfill needs it
+    added = []
+    for table_name, column_names in by_table.items():
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        missing = [name for name in column_names if name not in existing]
+        added += [f"{table_name}.{name}" for name in missing]
+        if dry_run or not missing:
+            continue
+        with engine.begin() as connection:
+            for name in missing:
+                ddl = _column_ddl(engine, table_name, name)
+                print(f"[MIGRATE] ALTER TABLE {table_name} ADD COLUMN {ddl}")
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+            _backfill(connection, table_name, set(missing), stored)
+    return added
+
+
+def add_indexes(engine: Engine, *, dry_run: bool = True) -> list[str]:
+    """Build missing INDEXES. Returns their names."""
+    inspector = inspect(engine)
+    postgres = engine.dialect.name == "postgresql"
+    concurrently = "CONCURRENTLY " if postgres else ""
+    added = []
+    # CONCURRENTLY can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for name, (table_name, columns, where) in INDEXES.items():
+            if postgres:
+                valid = _index_is_valid(connection, name)
+                if valid is False and not dry_run:
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+                exists = bool(valid)
+            else:
+                indexes = inspector.get_indexes(table_name)
+                exists = name in {index["name"] for index in indexes}
+            if exists:
+                continue
+            added.append(name)
+            if dry_run:
+                continue
+            ddl = f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table_name} ({columns})"
+            if where:
+                ddl += f" WHERE {where}"
+            print(f"[MIGRATE] {ddl}")
+            connection.execute(text(ddl))
+    return added
+
+
+def _index_is_valid(connection, name: str) -> bool | None:
+    """Whether a Postgres index finished building; None if it doesn't exist."""
+    return connection.execute(
+        text(
+            "SELECT indisvalid FROM pg_index"
+            " JOIN pg_class ON pg_class.oid = pg_index.indexrelid"
+            " WHERE pg_class.relname = :name"
+        ),
+        {"name": name},
+    ).scalar_one_or_none()
+
+
+def migrate(engine: Engine, *, dry_run: bool = True) -> list[str]:
+    """Bring the schema up to the models. Returns what was (or would be) added."""
+    if not dry_run:
+        # New tables first, so added foreign keys have something to point at
+        SQLModel.metadata.create_all(engine)
+    return add_columns(engine, dry_run=dry_run) + add_indexes(engine, dry_run=dry_run)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upgrade the database schema")
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Add missing columns and indexes (default: dry run)",
+    )
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    changes = migrate(engine, dry_run=not args.apply)
+    action = "Added" if args.apply else "Would add"
+    print(f"{action} {len(changes)}: {', '.join(changes) or 'nothing'}")
+    if args.apply:
+        check_schema(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import Optional
 from uuid import UUID, uuid4
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import JSON, Column, Index, UniqueConstraint, text
 from sqlmodel import Field, SQLModel
 from pydantic import field_serializer
 
@@ -14,7 +14,7 @@ class User(SQLModel, table=True):
     email: str
     full_name: Optional[str] = None
     user_type: Optional[str] = None
-    teacher_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    teacher_id: Optional[int] = Field(default=None, foreign_key="users.id", index=True)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
     @field_serializer("created_at")
@@ -25,6 +25,29 @@ class User(SQLModel, table=True):
         return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+class PdfBlob(SQLModel, table=True):
+    """A unique PDF in S3, shared by every piece with the same content"""
+
+    __tablename__ = "pdf_blobs"
+
+    sha256: str = Field(primary_key=True)  # Hex digest of the PDF bytes
+    s3_key: str  # S3 path: cadenza/pieces/sha256/{sha256}.pdf
+    size_bytes: Optional[int] = None
+    ref_count: int = 0  # Pieces pointing at this blob
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class PieceUpload(SQLModel, table=True):
+    """A direct-to-S3 piece upload started by /pieces/upload-url, until finalized"""
+
+    __tablename__ = "piece_uploads"
+
+    piece_id: UUID = Field(primary_key=True)
+    owner_id: int = Field(foreign_key="users.id", index=True)  # Who may finalize it
+    sha256: Optional[str] = None  # Set for uploads to the content-addressed key
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class Piece(SQLModel, table=True):
     __tablename__ = "pieces"
 
@@ -32,8 +55,24 @@ class Piece(SQLModel, table=True):
     owner_id: int = Field(foreign_key="users.id", index=True)
     title: str
     pdf_filename: str  # Original filename for display
-    s3_key: Optional[str] = None  # S3 path: cadenza/pieces/{uuid}.pdf
+    # S3 path: cadenza/pieces/sha256/{sha256}.pdf
+    s3_key: Optional[str] = Field(default=None, index=True)
+    # Set for content-addressed PDFs; older pieces keep cadenza/pieces/{uuid}.pdf
+    blob_sha256: Optional[str] = Field(
+        default=None, foreign_key="pdf_blobs.sha256", index=True
+    )
     shared_from_piece_id: Optional[UUID] = Field(default=None, foreign_key="pieces.id")
+    # Score alignment reference (app.alignment): "musicxml", or "recording" with
+    # the start time in seconds of each of its measures
+    reference_kind: Optional[str] = None
+    reference_s3_key: Optional[str] = None
+    reference_measure_times: Optional[list] = Field(
+        default=None, sa_column=Column(JSON)
+    )
+    # First-page preview (app.pdf_previews), and how many page previews sit
+    # next to it; shared by every piece with the same PDF
+    preview_s3_key: Optional[str] = None
+    page_preview_count: Optional[int] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -161,6 +200,16 @@ class ExerciseSession(SQLModel, table=True):
 
 class VideoSubmission(SQLModel, table=True):
     __tablename__ = "video_submissions"
+    __table_args__ = (
+        # Only unreviewed rows, in review-queue order
+        Index(
+            "ix_video_submissions_pending_review",
+            "created_at",
+            "id",
+            postgresql_where=text("reviewed_at IS NULL"),
+            sqlite_where=text("reviewed_at IS NULL"),
+        ),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: int = Field(foreign_key="users.id", index=True)
@@ -169,10 +218,35 @@ class VideoSubmission(SQLModel, table=True):
     piece_id: Optional[UUID] = Field(default=None, foreign_key="pieces.id")
     session_id: Optional[UUID] = Field(default=None, foreign_key="practice_sessions.id")
 
-    s3_key: str
+    s3_key: str = Field(index=True)
     thumbnail_s3_key: Optional[str] = None
     duration_seconds: int
 
+    # "pending" until the object is confirmed in S3, "uploaded" until probed, then
+    # "complete" or "invalid" (ffprobe couldn't read it)
+    upload_state: str = Field(default="pending", index=True)
+    size_bytes: Optional[int] = None
+    etag: Optional[str] = None  # Identifies the upload; not a content hash
+    sha256: Optional[str] = None  # Hex digest of the video, set when probed
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_codec: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+
+    # HLS ladder written by the media.transcode_hls job; None until transcoded.
+    # Renditions are [{name, height, bandwidth, playlist}] in master-playlist order
+    hls_master_s3_key: Optional[str] = None
+    hls_renditions: Optional[list] = Field(default=None, sa_column=Column(JSON))
+
+    # Scrub-preview sprite written by the media.generate_previews job (see
+    # app.previews): {interval_seconds, count, columns, rows, tile_width,
+    # tile_height}. None until generated
+    preview_sprite_s3_key: Optional[str] = None
+    preview_sprite: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+
+    # Audio peaks written by the media.waveform job (format in app.waveform)
+    waveform_s3_key: Optional[str] = None
+
     notes: Optional[str] = None
 
     reviewed_at: Optional[datetime] = None
@@ -180,7 +254,7 @@ class VideoSubmission(SQLModel, table=True):
 
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-    @field_serializer("created_at", "reviewed_at")
+    @field_serializer("created_at", "reviewed_at", "uploaded_at")
     def serialize_datetime(self, dt: Optional[datetime], _info):
         if dt is None:
             return None
@@ -201,10 +275,59 @@ class Message(SQLModel, table=True):
     sender_id: int = Field(foreign_key="users.id")
 
     text: Optional[str] = None
-    video_s3_key: Optional[str] = None
+    video_s3_key: Optional[str] = Field(default=None, index=True)
     video_duration_seconds: Optional[int] = None
     thumbnail_s3_key: Optional[str] = None
 
+    # Same lifecycle as VideoSubmission.upload_state; None for text-only messages
+    upload_state: Optional[str] = None
+    size_bytes: Optional[int] = None
+    etag: Optional[str] = None  # Identifies the upload; not a content hash
+    sha256: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_codec: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+
+    # Same as VideoSubmission.hls_master_s3_key / hls_renditions
+    hls_master_s3_key: Optional[str] = None
+    hls_renditions: Optional[list] = Field(default=None, sa_column=Column(JSON))
+
+    # Same as VideoSubmission.preview_sprite_s3_key / preview_sprite
+    preview_sprite_s3_key: Optional[str] = None
+    preview_sprite: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+
+    # Same as VideoSubmission.waveform_s3_key
+    waveform_s3_key: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @field_serializer("created_at", "uploaded_at")
+    def serialize_datetime(self, dt: Optional[datetime], _info):
+        if dt is None:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    @field_serializer("id", "submission_id")
+    def serialize_uuid(self, val: UUID, _info):
+        return str(val)
+
+
+class SubmissionAnalysis(SQLModel, table=True):
+    """Result of an audio analysis job (analysis.*) over a video submission"""
+
+    __tablename__ = "submission_analyses"
+    __table_args__ = (UniqueConstraint("submission_id", "kind"),)
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    submission_id: UUID = Field(foreign_key="video_submissions.id", index=True)
+    # "intonation", ...; the job kind without its "analysis." prefix
+    kind: str
+    # Bumped when an algorithm changes, so stale results can be recomputed
+    version: int
+    result: dict = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
     @field_serializer("created_at")
@@ -216,3 +339,55 @@ class Message(SQLModel, table=True):
     @field_serializer("id", "submission_id")
     def serialize_uuid(self, val: UUID, _info):
         return str(val)
+
+
+class SubmissionMeasure(SQLModel, table=True):
+    """
+    Where a submission plays a measure of its piece's reference, from the
+    analysis.alignment job. One row per measure played, so "every attempt at
+    measures 20-28" is a range scan of (piece_id, measure).
+    """
+
+    __tablename__ = "submission_measures"
+    __table_args__ = (
+        Index("ix_submission_measures_piece_measure", "piece_id", "measure"),
+    )
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    submission_id: UUID = Field(foreign_key="video_submissions.id", index=True)
+    # The piece whose reference was aligned to: a shared copy's original
+    piece_id: UUID = Field(foreign_key="pieces.id")
+    measure: int
+    start_seconds: float
+    end_seconds: float
+
+
+class Job(SQLModel, table=True):
+    """Background work, claimed by app.worker processes"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Claim order for runnable jobs
+        Index(
+            "ix_jobs_queued",
+            "run_at",
+            postgresql_where=text("status = 'queued'"),
+            sqlite_where=text("status = 'queued'"),
+        ),
+    )
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    kind: str = Field(index=True)
+    payload: dict = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    # "queued" -> "running" -> "succeeded" | "failed"; retries go back to "queued"
+    status: str = Field(default="queued", index=True)
+    attempts: int = 0
+    max_attempts: int = 5
+    run_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    locked_by: Optional[str] = None
+    locked_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    created_by_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
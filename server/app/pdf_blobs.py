@@ -0,0 +1,46 @@
+"""
+Reference counting for content-addressed piece PDFs.
+
+PDFs are stored once per unique content at cadenza/pieces/sha256/{digest}.pdf
+and shared by every piece with the same bytes. pdf_blobs.ref_count tracks how
+many pieces point at each blob; counts change in single upserts/updates so
+concurrent uploads of the same PDF can't lose an increment. Blobs that drop to
+zero are deleted by app.storage_gc, which holds their row locks while it does.
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session
+
+from app import models, storage
+
+
+def retain(db: Session, sha256: str, size_bytes: int | None = None) -> int:
+    """Add a reference to a PDF blob, creating it if needed. Returns the new count."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return db.exec(
+        dialect.insert(models.PdfBlob)
+        .values(
+            sha256=sha256,
+            s3_key=storage.get_pdf_blob_s3_key(sha256),
+            size_bytes=size_bytes,
+            ref_count=1,
+            created_at=datetime.now(timezone.utc),
+        )
+        .on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={"ref_count": models.PdfBlob.ref_count + 1},
+        )
+        .returning(models.PdfBlob.ref_count)
+    ).scalar_one()
+
+
+def release(db: Session, sha256: str) -> None:
+    """Drop a reference to a PDF blob. Unreferenced blobs are left for GC."""
+    db.exec(
+        update(models.PdfBlob)
+        .where(models.PdfBlob.sha256 == sha256)
+        .values(ref_count=models.PdfBlob.ref_count - 1)
+    )
@@ -0,0 +1,90 @@
+"""
+First-page and page previews of piece PDFs.
+
+The media.pdf_previews job (app.tasks) renders them with poppler's pdftoppm and
+stores them next to the PDF, under its key minus ".pdf":
+
+    {pdf}/preview.jpg       first page, PREVIEW_SIZE px on its long side
+    {pdf}/pages/{n}.jpg     pages 1..MAX_PAGES at PAGE_SIZE px, for page pickers
+
+Library screens show preview.jpg (Piece responses carry a presigned
+`preview_url`) instead of downloading and rendering every PDF on the device.
+Pieces sharing a content-addressed PDF share its previews, so a PDF is rendered
+once however many libraries it's in.
+"""
+
+import re
+import subprocess
+from pathlib import Path
+
+from app.config import settings
+
+# A sharp thumbnail on a 3x display, ~30-60 KB for a page of notation
+PREVIEW_SIZE = 480
+PREVIEW_QUALITY = 80
+# Legible enough to tell pages apart, ~5 KB each
+PAGE_SIZE = 160
+PAGE_QUALITY = 60
+MAX_PAGES = 200
+CONTENT_TYPE = "image/jpeg"
+
+
+def run_pdftoppm(args: list[str], timeout: float | None = None) -> None:
+    """Run pdftoppm with `args`. Raises with the tail of its log on failure."""
+    timeout = timeout or settings.media_transcode_timeout
+    try:
+        result = subprocess.run(
+            [settings.pdftoppm_path, *args],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception(f"pdftoppm timed out after {timeout}s")
+    if result.returncode != 0:
+        raise Exception(f"pdftoppm failed: {result.stderr.strip()[-2000:]}")
+
+
+def render_first_page(pdf_path: Path, out_dir: Path) -> Path:
+    """Write the first page as a JPEG in `out_dir`. Returns its path."""
+    root = out_dir / "preview"
+    run_pdftoppm(
+        [
+            "-f",
+            "1",
+            "-l",
+            "1",
+            "-singlefile",
+            "-jpeg",
+            "-jpegopt",
+            f"quality={PREVIEW_QUALITY}",
+            "-scale-to",
+            str(PREVIEW_SIZE),
+            str(pdf_path),
+            str(root),
+        ]
+    )
+    return root.with_suffix(".jpg")
+
+
+def render_pages(pdf_path: Path, out_dir: Path) -> list[Path]:
+    """Write pages 1..MAX_PAGES as small JPEGs in `out_dir`, in page order."""
+    run_pdftoppm(
+        [
+            "-l",
+            str(MAX_PAGES),
+            "-jpeg",
+            "-jpegopt",
+            f"quality={PAGE_QUALITY}",
+            "-scale-to",
+            str(PAGE_SIZE),
+            str(pdf_path),
+            str(out_dir / "page"),
+        ]
+    )
+    # pdftoppm zero-pads page numbers to the width of the last one
+    return sorted(out_dir.glob("page-*.jpg"), key=page_number)
+
+
+def page_number(path: Path) -> int:
+    return int(re.search(r"-(\d+)$", path.stem).group(1))
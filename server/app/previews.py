@@ -0,0 +1,98 @@
+"""
+Poster frames and scrub-preview sprite sheets for submission and message videos.
+
+The media.generate_previews job (app.tasks) writes both next to the video under
+the _thumb key scheme:
+
+    {id}_thumb.jpg          poster frame, unless the client already uploaded one
+    {id}_thumb_sprite.jpg   grid of small frames sampled every `interval_seconds`
+
+Review screens fetch the single sprite image and show tile
+floor(t / interval_seconds) while scrubbing, instead of seeking video segments.
+Tile n is at column n % columns, row n // columns.
+"""
+
+import math
+from pathlib import Path
+
+from app import media
+
+POSTER_MAX_HEIGHT = 720
+# Skip fade-ins and the tap on the record button, but stay early in short clips
+POSTER_OFFSET_SECONDS = 1.0
+
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_MAX_TILES = 100
+SPRITE_MIN_INTERVAL_SECONDS = 2.0
+# ~5 KB per tile at this quality
+JPEG_QUALITY = 5  # ffmpeg -q:v, 2 (best) to 31
+
+
+def poster_seconds(duration_seconds: float) -> float:
+    return min(POSTER_OFFSET_SECONDS, duration_seconds / 2)
+
+
+def extract_poster(input_url: str, out_path: Path, info: media.MediaInfo) -> None:
+    """Write a JPEG of the frame at poster_seconds() to `out_path`."""
+    args = [
+        # Seeking before -i only fetches the byte ranges around the seek point
+        "-ss",
+        f"{poster_seconds(info.duration_seconds):.3f}",
+        "-i",
+        input_url,
+        "-frames:v",
+        "1",
+    ]
+    if info.height and info.height > POSTER_MAX_HEIGHT:
+        args += ["-vf", f"scale=-2:{POSTER_MAX_HEIGHT}"]
+    media.run_ffmpeg([*args, "-q:v", str(JPEG_QUALITY), "-y", str(out_path)])
+
+
+def sprite_layout(info: media.MediaInfo) -> dict:
+    """
+    Grid for a video's sprite sheet.
+
+    At most SPRITE_MAX_TILES tiles, so long videos sample less often rather than
+    growing the image.
+    """
+    duration = max(info.duration_seconds, 0.0)
+    interval = max(SPRITE_MIN_INTERVAL_SECONDS, duration / SPRITE_MAX_TILES)
+    count = max(1, min(SPRITE_MAX_TILES, math.ceil(duration / interval)))
+    aspect = (info.height / info.width) if info.width and info.height else 9 / 16
+    return {
+        "interval_seconds": interval,
+        "count": count,
+        "columns": min(count, SPRITE_COLUMNS),
+        "rows": math.ceil(count / SPRITE_COLUMNS),
+        "tile_width": SPRITE_TILE_WIDTH,
+        # Even, as the JPEG encoder's chroma subsampling requires
+        "tile_height": max(2, round(SPRITE_TILE_WIDTH * aspect / 2) * 2),
+    }
+
+
+def extract_sprite(input_url: str, out_path: Path, layout: dict) -> None:
+    """Write the sprite sheet described by `layout` to `out_path`."""
+    width, height = layout["tile_width"], layout["tile_height"]
+    media.run_ffmpeg(
+        [
+            # Only keyframes are decoded; scrub previews don't need exact frames,
+            # and this makes the pass several times faster than a full decode
+            "-skip_frame",
+            "nokey",
+            "-i",
+            input_url,
+            "-vf",
+            f"fps=1/{layout['interval_seconds']:.3f},"
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:-1:-1,"
+            f"tile={layout['columns']}x{layout['rows']}",
+            "-an",
+            "-frames:v",
+            "1",
+            "-q:v",
+            str(JPEG_QUALITY),
+            "-y",
+            str(out_path),
+        ]
+    )
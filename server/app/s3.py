@@ -1,22 +1,20 @@
 """S3 service for handling file uploads and downloads."""
 
 import os
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional
-from uuid import UUID
+from typing import BinaryIO, Iterable, Iterator, Optional
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
+from cachetools import TLRUCache
 
+from app import sigv4
 from app.config import settings
 
 
-def _get_path_prefix() -> str:
-    """Get the S3 path prefix based on environment."""
-    return "" if settings.is_production else f"{settings.environment}/"
-
-
 def _get_object_tags() -> Optional[str]:
     """Get S3 object tags based on environment (30-day expiration for non-prod)."""
     if not settings.is_production:
@@ -25,269 +23,534 @@ def _get_object_tags() -> Optional[str]:
     return None
 
 
-def get_s3_client():
-    """Get configured S3 client."""
+_s3_client = None
+_s3_credentials = None
+_s3_client_lock = threading.Lock()
+
+
+def _create_s3_session() -> boto3.Session:
     session_kwargs = {}
     aws_profile = os.getenv("AWS_PROFILE")  # For local development only
     if aws_profile:
         session_kwargs["profile_name"] = aws_profile
 
-    session = boto3.Session(**session_kwargs)
+    return boto3.Session(**session_kwargs)
+
 
+def _create_s3_client(session: boto3.Session):
     return session.client(
         "s3",
         region_name=settings.aws_region,
-        config=Config(signature_version="s3v4"),
+        endpoint_url=settings.s3_endpoint_url,
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=settings.s3_max_pool_connections,
+            connect_timeout=settings.s3_connect_timeout,
+            read_timeout=settings.s3_read_timeout,
+            retries={
+                "mode": settings.s3_retry_mode,
+                "max_attempts": settings.s3_max_attempts,
+            },
+        ),
     )
 
 
-def get_piece_s3_key(piece_id: UUID) -> str:
-    """
-    Generate S3 key for a piece.
-    Format:
-      - dev: dev/cadenza/pieces/{uuid}.pdf
-      - prod: cadenza/pieces/{uuid}.pdf
+def get_s3_client():
     """
-    return f"{_get_path_prefix()}cadenza/pieces/{piece_id}.pdf"
-
+    Get the process-wide S3 client.
 
-def get_video_s3_key(user_id: int, submission_id: UUID) -> str:
-    return f"{_get_path_prefix()}cadenza/videos/{user_id}/{submission_id}.mp4"
+    Created on first use so credential resolution and endpoint loading happen once
+    per process, and the connection pool is shared. boto3 clients are thread-safe.
+    """
+    global _s3_client, _s3_credentials
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                session = _create_s3_session()
+                _s3_credentials = session.get_credentials()
+                _s3_client = _create_s3_client(session)
+    return _s3_client
 
 
-def get_video_thumbnail_s3_key(user_id: int, submission_id: UUID) -> str:
-    return f"{_get_path_prefix()}cadenza/videos/{user_id}/{submission_id}_thumb.jpg"
+def _get_credentials() -> sigv4.Credentials:
+    """Credentials of the shared client, refreshed by botocore when they rotate."""
+    get_s3_client()
+    if _s3_credentials is None:
+        raise Exception("No AWS credentials configured")
+    access_key, secret_key, token = _s3_credentials.get_frozen_credentials()
+    return sigv4.Credentials(access_key, secret_key, token)
 
 
-def get_message_s3_key(user_id: int, message_id: UUID) -> str:
-    return f"{_get_path_prefix()}cadenza/videos/{user_id}/messages/{message_id}.mp4"
+def _reset_s3_client() -> None:
+    """Drop the parent's client (and its sockets) in forked workers."""
+    global _s3_client, _s3_credentials, _s3_client_lock
+    _s3_client = None
+    _s3_credentials = None
+    _s3_client_lock = threading.Lock()
 
 
-def get_message_thumbnail_s3_key(user_id: int, message_id: UUID) -> str:
-    return (
-        f"{_get_path_prefix()}cadenza/videos/{user_id}/messages/{message_id}_thumb.jpg"
-    )
+os.register_at_fork(after_in_child=_reset_s3_client)
 
 
-def upload_file_content(
-    s3_key: str, content: bytes, content_type: str = "application/pdf"
+def upload_fileobj(
+    s3_key: str,
+    fileobj: BinaryIO,
+    content_type: str = "application/pdf",
+    cache_control: str | None = None,
 ) -> None:
     """
-    Upload file content directly to S3.
+    Stream a file object to S3 one part at a time.
 
-    In dev environment, objects are tagged with a 30-day expiration.
+    At most one part (settings.s3_multipart_part_size) is held in memory, however
+    large the file. Files that fit in a single part are sent with one PutObject.
+    Blocking; call from a worker thread when serving async requests.
 
-    Args:
-        s3_key: S3 key where file will be stored
-        content: File content as bytes
-        content_type: MIME type of the file (default: application/pdf)
+    In dev environment, objects are tagged with a 30-day expiration.
     """
+    part_size = settings.s3_multipart_part_size
+    part = fileobj.read(part_size)
+
+    if len(part) < part_size:
+        s3_client = get_s3_client()
+        try:
+            put_params = {
+                "Bucket": settings.s3_bucket,
+                "Key": s3_key,
+                "Body": part,
+                "ContentType": content_type,
+            }
+            if cache_control:
+                put_params["CacheControl"] = cache_control
+
+            tags = _get_object_tags()
+            if tags:
+                put_params["Tagging"] = tags
+
+            s3_client.put_object(**put_params)
+            return
+        except ClientError as e:
+            raise Exception(f"Failed to upload file to S3: {e}")
+
+    upload_id = create_multipart_upload(s3_key, content_type, cache_control)
+    try:
+        parts = []
+        while part:
+            parts.append(upload_part(s3_key, upload_id, len(parts) + 1, part))
+            part = fileobj.read(part_size)
+        complete_multipart_upload(s3_key, upload_id, parts)
+    except Exception:
+        abort_multipart_upload(s3_key, upload_id)
+        raise
+
+
+# MARK: - Multipart uploads
+
+
+def create_multipart_upload(
+    s3_key: str, content_type: str, cache_control: str | None = None
+) -> str:
+    """Start a multipart upload and return its upload id."""
     s3_client = get_s3_client()
 
     try:
-        put_params = {
+        params = {
             "Bucket": settings.s3_bucket,
             "Key": s3_key,
-            "Body": content,
             "ContentType": content_type,
         }
+        if cache_control:
+            params["CacheControl"] = cache_control
 
         tags = _get_object_tags()
         if tags:
-            put_params["Tagging"] = tags
+            params["Tagging"] = tags
 
-        s3_client.put_object(**put_params)
+        return s3_client.create_multipart_upload(**params)["UploadId"]
     except ClientError as e:
-        raise Exception(f"Failed to upload file to S3: {e}")
-
-
-def generate_upload_url(piece_id: UUID, content_type: str = "application/pdf") -> dict:
-    """
-    Generate a presigned URL for uploading a PDF to S3.
+        raise Exception(f"Failed to start multipart upload: {e}")
 
-    Args:
-        piece_id: UUID of the piece
-        content_type: MIME type of the file (default: application/pdf)
 
-    Returns:
-        dict with:
-            - url: Presigned URL for PUT request
-            - s3_key: The S3 key where file will be stored
-            - expires_in: Seconds until URL expires
-    """
+def upload_part(s3_key: str, upload_id: str, part_number: int, body: bytes) -> dict:
+    """Upload one part; returns the {PartNumber, ETag} entry needed to complete."""
     s3_client = get_s3_client()
-    s3_key = get_piece_s3_key(piece_id)
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            "put_object",
-            Params={
-                "Bucket": settings.s3_bucket,
-                "Key": s3_key,
-                "ContentType": content_type,
-            },
-            ExpiresIn=3600,  # 1 hour
+        response = s3_client.upload_part(
+            Bucket=settings.s3_bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
         )
-
-        return {"url": presigned_url, "s3_key": s3_key, "expires_in": 3600}
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
     except ClientError as e:
-        raise Exception(f"Failed to generate presigned URL: {e}")
+        raise Exception(f"Failed to upload part: {e}")
 
 
-def generate_video_upload_url(user_id: int, submission_id: UUID) -> dict:
+def complete_multipart_upload(s3_key: str, upload_id: str, parts: list[dict]) -> None:
     s3_client = get_s3_client()
-    s3_key = get_video_s3_key(user_id, submission_id)
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            "put_object",
-            Params={
-                "Bucket": settings.s3_bucket,
-                "Key": s3_key,
-                "ContentType": "video/mp4",
-            },
-            ExpiresIn=3600,
+        s3_client.complete_multipart_upload(
+            Bucket=settings.s3_bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
         )
+    except ClientError as e:
+        raise Exception(f"Failed to complete multipart upload: {e}")
 
-        return {"url": presigned_url, "s3_key": s3_key, "expires_in": 3600}
+
+def list_uploaded_parts(s3_key: str, upload_id: str) -> list[dict] | None:
+    """
+    Parts S3 has received so far, in part-number order.
+
+    Returns None if the upload does not exist (never started, completed or aborted).
+    """
+    s3_client = get_s3_client()
+    parts = []
+    marker = 0
+
+    try:
+        while True:
+            response = s3_client.list_parts(
+                Bucket=settings.s3_bucket,
+                Key=s3_key,
+                UploadId=upload_id,
+                PartNumberMarker=marker,
+            )
+            parts.extend(response.get("Parts", []))
+            if not response.get("IsTruncated"):
+                return parts
+            marker = response["NextPartNumberMarker"]
     except ClientError as e:
-        raise Exception(f"Failed to generate presigned URL: {e}")
+        if e.response["Error"]["Code"] == "NoSuchUpload":
+            return None
+        raise Exception(f"Failed to list uploaded parts: {e}")
 
 
-def generate_video_thumbnail_upload_url(user_id: int, submission_id: UUID) -> dict:
+def abort_multipart_upload(s3_key: str, upload_id: str) -> None:
     s3_client = get_s3_client()
-    s3_key = get_video_thumbnail_s3_key(user_id, submission_id)
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            "put_object",
-            Params={
-                "Bucket": settings.s3_bucket,
-                "Key": s3_key,
-                "ContentType": "image/jpeg",
-            },
-            ExpiresIn=3600,
+        s3_client.abort_multipart_upload(
+            Bucket=settings.s3_bucket, Key=s3_key, UploadId=upload_id
         )
-
-        return {"url": presigned_url, "s3_key": s3_key, "expires_in": 3600}
     except ClientError as e:
-        raise Exception(f"Failed to generate presigned URL: {e}")
+        raise Exception(f"Failed to abort multipart upload: {e}")
 
 
-def generate_message_upload_url(user_id: int, message_id: UUID) -> dict:
+def object_exists(s3_key: str) -> bool:
+    """Check whether an object has been uploaded."""
     s3_client = get_s3_client()
-    s3_key = get_message_s3_key(user_id, message_id)
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            "put_object",
-            Params={
-                "Bucket": settings.s3_bucket,
-                "Key": s3_key,
-                "ContentType": "video/mp4",
-            },
-            ExpiresIn=3600,
-        )
+        s3_client.head_object(Bucket=settings.s3_bucket, Key=s3_key)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise Exception(f"Failed to check S3 object: {e}")
+
 
-        return {"url": presigned_url, "s3_key": s3_key, "expires_in": 3600}
+def head_object(s3_key: str) -> Optional[dict]:
+    """Return size and ETag of an uploaded object, or None if it doesn't exist."""
+    s3_client = get_s3_client()
+
+    try:
+        response = s3_client.head_object(Bucket=settings.s3_bucket, Key=s3_key)
     except ClientError as e:
-        raise Exception(f"Failed to generate presigned URL: {e}")
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise Exception(f"Failed to read S3 object metadata: {e}")
+
+    return {
+        "size": response["ContentLength"],
+        "etag": response["ETag"].strip('"'),
+    }
 
 
-def generate_message_thumbnail_upload_url(user_id: int, message_id: UUID) -> dict:
+def apply_object_tags(s3_key: str) -> None:
+    """Tag an object uploaded through a presigned URL like a server-side upload."""
+    tags = _get_object_tags()
+    if not tags:
+        return
+
     s3_client = get_s3_client()
-    s3_key = get_message_thumbnail_s3_key(user_id, message_id)
+    key, value = tags.split("=", 1)
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            "put_object",
-            Params={
-                "Bucket": settings.s3_bucket,
-                "Key": s3_key,
-                "ContentType": "image/jpeg",
-            },
-            ExpiresIn=3600,
+        s3_client.put_object_tagging(
+            Bucket=settings.s3_bucket,
+            Key=s3_key,
+            Tagging={"TagSet": [{"Key": key, "Value": value}]},
         )
-
-        return {"url": presigned_url, "s3_key": s3_key, "expires_in": 3600}
     except ClientError as e:
-        raise Exception(f"Failed to generate presigned URL: {e}")
+        raise Exception(f"Failed to tag S3 object: {e}")
+
+
+UPLOAD_URL_EXPIRES_IN = 3600
+
+
+def _presign(
+    method: str,
+    s3_key: str,
+    *,
+    expires_in: int,
+    signed_at: datetime,
+    headers: dict[str, str] | None = None,
+    query: dict[str, str] | None = None,
+    credentials: sigv4.Credentials | None = None,
+) -> str:
+    return sigv4.presign_s3_url(
+        method,
+        settings.s3_bucket,
+        s3_key,
+        credentials=credentials or _get_credentials(),
+        region=settings.aws_region,
+        expires_in=expires_in,
+        signed_at=signed_at,
+        headers=headers,
+        query=query,
+        endpoint_url=settings.s3_endpoint_url,
+    )
 
 
-def generate_download_url(s3_key: str) -> str:
+def generate_put_url(
+    s3_key: str, content_type: str, headers: dict[str, str] | None = None
+) -> dict:
     """
-    Generate a presigned URL for downloading a PDF from S3.
+    Presign a PUT URL. `headers` (and Content-Type) are signed, so the client must
+    send them verbatim; they are returned alongside the URL.
+    """
+    headers = {"Content-Type": content_type, **(headers or {})}
+    presigned_url = _presign(
+        "PUT",
+        s3_key,
+        expires_in=UPLOAD_URL_EXPIRES_IN,
+        signed_at=datetime.now(timezone.utc),
+        headers=headers,
+    )
+    return {
+        "url": presigned_url,
+        "s3_key": s3_key,
+        "headers": headers,
+        "expires_in": UPLOAD_URL_EXPIRES_IN,
+    }
 
-    Args:
-        s3_key: S3 key of the file
 
-    Returns:
-        Presigned URL for GET request
+def generate_part_upload_urls(
+    s3_key: str, upload_id: str, part_numbers: Iterable[int]
+) -> dict:
     """
-    s3_client = get_s3_client()
+    Presign PUT URLs for parts of a multipart upload.
 
-    try:
-        presigned_url = s3_client.generate_presigned_url(
-            "get_object",
-            Params={
-                "Bucket": settings.s3_bucket,
-                "Key": s3_key,
-            },
-            ExpiresIn=3600,  # 1 hour
+    Returns:
+        dict with:
+            - urls: part number -> presigned URL
+            - expires_in: Seconds until URLs expire
+    """
+    signed_at = datetime.now(timezone.utc)
+    urls = {
+        part_number: _presign(
+            "PUT",
+            s3_key,
+            expires_in=UPLOAD_URL_EXPIRES_IN,
+            signed_at=signed_at,
+            query={"uploadId": upload_id, "partNumber": str(part_number)},
         )
+        for part_number in part_numbers
+    }
+    return {"urls": urls, "expires_in": UPLOAD_URL_EXPIRES_IN}
+
+
+# Download URLs expire on an hour boundary and are signed as of a fixed point
+# before it, so every process produces the byte-identical URL for an object within a
+# bucket. Each process also reuses its signed URL until shortly before expiry. Stable
+# URLs let the client's URLCache (or a CDN) hit. Cached URLs are keyed by the
+# credentials that signed them too: temporary (STS) credentials rotate, and a URL
+# stops working when the session token it carries expires.
+DOWNLOAD_URL_BUCKET_SECONDS = 3600
+DOWNLOAD_URL_REFRESH_MARGIN_SECONDS = 600
+# Longest possible remaining lifetime is bucket + margin; sign for twice the bucket
+DOWNLOAD_URL_SIGNED_FOR_SECONDS = 2 * DOWNLOAD_URL_BUCKET_SECONDS
+
+# (access key, session token, s3_key) -> (url, expires_at)
+_download_url_cache: TLRUCache[tuple[str, str | None, str], tuple[str, int]] = (
+    TLRUCache(
+        maxsize=10_000,
+        ttu=lambda _key, value, _now: value[1] - DOWNLOAD_URL_REFRESH_MARGIN_SECONDS,
+        timer=lambda: time.time(),
+    )
+)
+_download_url_cache_lock = threading.Lock()
 
-        return presigned_url
-    except ClientError as e:
-        raise Exception(f"Failed to generate download URL: {e}")
+
+def _download_url_expiry(now: float) -> int:
+    """First bucket boundary that leaves more than the refresh margin."""
+    bucket = (
+        int(now + DOWNLOAD_URL_REFRESH_MARGIN_SECONDS) // DOWNLOAD_URL_BUCKET_SECONDS
+    )
+    return (bucket + 1) * DOWNLOAD_URL_BUCKET_SECONDS
 
 
-def copy_bundled_to_user_piece(source_filename: str, piece_id: UUID) -> str:
+def generate_download_url(s3_key: str) -> dict:
     """
-    Copy a bundled PDF to a user's piece location.
-
-    Args:
-        source_filename: Filename in infra/ios/bundle/
-        piece_id: UUID of the new piece
+    Get a presigned GET URL for an object, reusing a cached one when still fresh.
 
     Returns:
-        S3 key of the copied file
+        dict with:
+            - url: Presigned URL for GET request
+            - expires_in: Seconds until URL expires
     """
+    return generate_download_urls([s3_key])[s3_key]
+
+
+def generate_download_urls(s3_keys: Iterable[str]) -> dict[str, dict]:
+    """Presigned GET URLs for many objects, signing only keys not already cached."""
+    now = time.time()
+    credentials = _get_credentials()
+    signer = (credentials.access_key, credentials.token)
+    signed: dict[str, tuple[str, int]] = {}
+    missing = []
+
+    with _download_url_cache_lock:
+        for s3_key in set(s3_keys):
+            cached = _download_url_cache.get((*signer, s3_key))
+            if cached is None:
+                missing.append(s3_key)
+            else:
+                signed[s3_key] = cached
+
+    if missing:
+        expires_at = _download_url_expiry(now)
+        signed_at = datetime.fromtimestamp(
+            expires_at - DOWNLOAD_URL_SIGNED_FOR_SECONDS, timezone.utc
+        )
+        fresh = {
+            s3_key: (
+                _presign(
+                    "GET",
+                    s3_key,
+                    expires_in=DOWNLOAD_URL_SIGNED_FOR_SECONDS,
+                    signed_at=signed_at,
+                    credentials=credentials,
+                ),
+                expires_at,
+            )
+            for s3_key in missing
+        }
+
+        with _download_url_cache_lock:
+            _download_url_cache.update(
+                {(*signer, s3_key): value for s3_key, value in fresh.items()}
+            )
+        signed.update(fresh)
+
+    return {
+        s3_key: {"url": url, "expires_in": expires_at - int(now)}
+        for s3_key, (url, expires_at) in signed.items()
+    }
+
+
+# MARK: - Reading and copying
+
+
+def iter_object(s3_key: str, chunk_size: int) -> Iterator[bytes]:
+    """Stream an object's bytes. FileNotFoundError if it doesn't exist."""
     s3_client = get_s3_client()
-    source_key = f"infra/ios/bundle/{source_filename}"
-    dest_key = get_piece_s3_key(piece_id)
 
     try:
-        copy_params = {
-            "Bucket": settings.s3_bucket,
-            "CopySource": {"Bucket": settings.s3_bucket, "Key": source_key},
-            "Key": dest_key,
-        }
+        response = s3_client.get_object(Bucket=settings.s3_bucket, Key=s3_key)
+        yield from response["Body"].iter_chunks(chunk_size)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            raise FileNotFoundError(s3_key)
+        raise Exception(f"Failed to read file from S3: {e}")
 
-        tags = _get_object_tags()
-        if tags:
-            copy_params["Tagging"] = tags
-            copy_params["TaggingDirective"] = "REPLACE"
 
-        s3_client.copy_object(**copy_params)
+def copy_object(
+    source_key: str,
+    dest_key: str,
+    content_type: str | None = None,
+    cache_control: str | None = None,
+) -> None:
+    """
+    Server-side copy within the bucket, tagged like a fresh upload.
 
-        return dest_key
+    Metadata is copied from the source unless `content_type`/`cache_control` are
+    given, in which case they replace it.
+    """
+    s3_client = get_s3_client()
+    copy_params = {
+        "Bucket": settings.s3_bucket,
+        "CopySource": {"Bucket": settings.s3_bucket, "Key": source_key},
+        "Key": dest_key,
+    }
+    if content_type or cache_control:
+        copy_params["MetadataDirective"] = "REPLACE"
+        if content_type:
+            copy_params["ContentType"] = content_type
+        if cache_control:
+            copy_params["CacheControl"] = cache_control
+
+    tags = _get_object_tags()
+    if tags:
+        copy_params["Tagging"] = tags
+        copy_params["TaggingDirective"] = "REPLACE"
+
+    try:
+        s3_client.copy_object(**copy_params)
     except ClientError as e:
-        raise Exception(f"Failed to copy bundled file: {e}")
+        raise Exception(f"Failed to copy file: {e}")
+
 
+# MARK: - Listing and bulk deletion
 
-def delete_piece(s3_key: str) -> None:
+DELETE_OBJECTS_BATCH_SIZE = 1000  # S3 DeleteObjects limit
+
+
+def list_objects(prefix: str) -> Iterator[dict]:
     """
-    Delete a piece from S3.
+    Yield every object under `prefix`, one ListObjectsV2 page at a time.
 
-    Args:
-        s3_key: S3 key of the file to delete
+    Each item has key, size and last_modified.
     """
     s3_client = get_s3_client()
+    paginator = s3_client.get_paginator("list_objects_v2")
 
     try:
-        s3_client.delete_object(
-            Bucket=settings.s3_bucket,
-            Key=s3_key,
-        )
+        for page in paginator.paginate(Bucket=settings.s3_bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield {
+                    "key": obj["Key"],
+                    "size": obj["Size"],
+                    "last_modified": obj["LastModified"],
+                }
     except ClientError as e:
-        raise Exception(f"Failed to delete file from S3: {e}")
+        raise Exception(f"Failed to list S3 objects: {e}")
+
+
+def delete_objects(keys: Iterable[str]) -> dict[str, str]:
+    """
+    Delete objects with batched DeleteObjects calls.
+
+    Returns {key: error code} for keys S3 failed to delete.
+    """
+    s3_client = get_s3_client()
+    keys = list(keys)
+    errors = {}
+
+    for start in range(0, len(keys), DELETE_OBJECTS_BATCH_SIZE):
+        batch = keys[start : start + DELETE_OBJECTS_BATCH_SIZE]
+        try:
+            response = s3_client.delete_objects(
+                Bucket=settings.s3_bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to delete files from S3: {e}")
+        for error in response.get("Errors", []):
+            errors[error["Key"]] = error["Code"]
+
+    return errors
@@ -1,7 +1,7 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, Field, field_serializer
+from datetime import datetime, timezone
 from uuid import UUID
-from typing import Optional
+from typing import Annotated, Literal, Optional
 from app import models
 from app.models import User
 
@@ -18,11 +18,15 @@ class AuthResponse(BaseModel):
     user: User
 
 
+Sha256Hex = Annotated[str, Field(pattern=r"^[0-9a-f]{64}$")]
+
+
 class PieceCreate(BaseModel):
     id: UUID
     title: str
     pdf_filename: str
     s3_key: Optional[str] = None
+    sha256: Optional[Sha256Hex] = None  # Set if uploaded to the content-addressed key
 
 
 class PieceUploadUrlRequest(BaseModel):
@@ -30,6 +34,8 @@ class PieceUploadUrlRequest(BaseModel):
 
     piece_id: UUID
     filename: str
+    # Upload to the content-addressed key so identical PDFs are stored once
+    sha256: Optional[Sha256Hex] = None
 
 
 class PieceUploadUrlResponse(BaseModel):
@@ -37,14 +43,75 @@ class PieceUploadUrlResponse(BaseModel):
 
     upload_url: str
     s3_key: str
+    headers: dict[str, str]  # Must be sent with the PUT
     expires_in: int
 
 
+class BundledPieceCreate(BaseModel):
+    """Create a piece from a PDF bundled with the iOS app"""
+
+    piece_id: UUID
+    title: str
+    source_filename: Annotated[str, Field(pattern=r"^\w[\w .-]*\.pdf$")]
+
+
 class SetTeacherResponse(BaseModel):
     message: str
     teacher: User
 
 
+class TeacherDashboardStudent(BaseModel):
+    student: User
+    current_routine_id: Optional[UUID] = None
+    current_routine_title: Optional[str] = None
+    last_practiced_at: Optional[datetime] = None
+    practice_minutes_7d: int
+    pending_review_count: int
+
+    @field_serializer("last_practiced_at")
+    def serialize_datetime(self, dt: Optional[datetime], _info):
+        if dt is None:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class PieceResponse(BaseModel):
+    """A piece, with a presigned URL of its first-page preview once rendered"""
+
+    id: UUID
+    owner_id: int
+    title: str
+    pdf_filename: str
+    s3_key: Optional[str] = None
+    blob_sha256: Optional[str] = None
+    shared_from_piece_id: Optional[UUID] = None
+    reference_kind: Optional[str] = None
+    reference_s3_key: Optional[str] = None
+    reference_measure_times: Optional[list[float]] = None
+    preview_url: Optional[str] = None
+    page_preview_count: Optional[int] = None  # See /pieces/{id}/page-previews
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+    @field_serializer("created_at", "updated_at")
+    def serialize_datetime(self, dt: datetime, _info):
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class PiecePagePreviewsResponse(BaseModel):
+    """Presigned URLs of a piece's page previews, first page first"""
+
+    page_urls: list[str]
+    expires_in: int
+
+
 class PieceDownloadUrlResponse(BaseModel):
     """Response containing presigned download URL"""
 
@@ -73,12 +140,77 @@ class VideoSubmissionUploadUrlsResponse(BaseModel):
     expires_in: int
 
 
+class ReviewQueuePage(BaseModel):
+    submissions: list[models.VideoSubmission]
+    next_cursor: Optional[str] = None
+
+
 class VideoSubmissionVideoUrlResponse(BaseModel):
-    video_url: str
+    video_url: str  # The original upload
     thumbnail_url: Optional[str]
+    playlist_url: Optional[str] = None  # HLS master playlist, once transcoded
+    sprite_url: Optional[str] = None  # Scrub previews, laid out per preview_sprite
+    expires_in: int
+
+
+class VideoClipCreate(BaseModel):
+    start_seconds: float = Field(..., ge=0)
+    end_seconds: float = Field(..., gt=0)
+
+
+class VideoClipUrlResponse(BaseModel):
+    clip_url: str
+    # Where the clip actually starts in the submission (the keyframe at or
+    # before the requested start) and how long it is
+    start_seconds: float
+    duration_seconds: Optional[float]
+    expires_in: int
+
+
+class MeasureAttempt(BaseModel):
+    """A submission's pass over a range of measures (GET /pieces/{id}/attempts)"""
+
+    submission_id: UUID
+    user_id: int
+    # Measures of the requested range the submission plays, and when
+    first_measure: int
+    last_measure: int
+    start_seconds: float
+    end_seconds: float
+    created_at: datetime
+
+    @field_serializer("created_at")
+    def serialize_datetime(self, dt: datetime, _info):
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# Resumable video uploads
+
+
+class MultipartUploadStartResponse(BaseModel):
+    upload_id: str
+    part_size: int
+
+
+class MultipartPartUrlsRequest(BaseModel):
+    part_numbers: list[Annotated[int, Field(ge=1, le=10_000)]] = Field(
+        ..., min_length=1, max_length=100
+    )
+
+
+class MultipartPartUrlsResponse(BaseModel):
+    urls: dict[int, str]
     expires_in: int
 
 
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+    size: int
+
+
 # Messages
 
 
@@ -96,11 +228,61 @@ class MessageCreateResponse(BaseModel):
 
 
 class MessageVideoUrlResponse(BaseModel):
-    video_url: str
+    video_url: str  # The original upload
     thumbnail_url: Optional[str]
+    playlist_url: Optional[str] = None  # HLS master playlist, once transcoded
+    sprite_url: Optional[str] = None  # Scrub previews, laid out per preview_sprite
+    expires_in: int
+
+
+# Batch downloads
+
+
+class DownloadResource(BaseModel):
+    type: Literal["piece", "video_submission", "message"]
+    id: UUID
+
+
+class DownloadUrlBatchRequest(BaseModel):
+    resources: list[DownloadResource] = Field(..., max_length=200)
+
+
+class DownloadUrl(BaseModel):
+    type: Literal["piece", "video_submission", "message"]
+    id: UUID
+    url: str
+    thumbnail_url: Optional[str] = None
+
+
+class DownloadUrlBatchResponse(BaseModel):
+    urls: list[DownloadUrl]
+    unavailable: list[DownloadResource]
     expires_in: int
 
 
+# Jobs
+
+
+class JobStatus(BaseModel):
+    id: UUID
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None  # Last line of the most recent failure
+    result: Optional[dict] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    @field_serializer("created_at", "finished_at")
+    def serialize_datetime(self, dt: Optional[datetime], _info):
+        if dt is None:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
 # Routine schemas
 
 
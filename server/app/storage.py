@@ -0,0 +1,446 @@
+"""
+Object storage for piece PDFs and videos.
+
+The app talks to this module only. Objects live in S3 (app.s3) or on local disk
+(app.local_storage), selected by settings.storage_backend. The local backend lets
+the whole upload/download path run on a laptop for load testing and serves small
+self-hosted deployments. Both backends implement StorageBackend and share the
+key layout below; database columns keep the historical `s3_key` name for either.
+"""
+
+import base64
+import hashlib
+from functools import lru_cache
+from types import ModuleType
+from typing import BinaryIO, Iterable, Iterator, Optional, Protocol
+from uuid import UUID
+
+from app.config import settings
+from app.s3 import DOWNLOAD_URL_BUCKET_SECONDS  # noqa: F401 - shared by both backends
+
+
+class StorageBackend(Protocol):
+    """What app.s3 and app.local_storage provide"""
+
+    def upload_fileobj(
+        self,
+        s3_key: str,
+        fileobj: BinaryIO,
+        content_type: str = ...,
+        cache_control: str | None = None,
+    ) -> None: ...
+
+    def iter_object(self, s3_key: str, chunk_size: int) -> Iterator[bytes]: ...
+
+    def copy_object(
+        self,
+        source_key: str,
+        dest_key: str,
+        content_type: str | None = None,
+        cache_control: str | None = None,
+    ) -> None: ...
+
+    def object_exists(self, s3_key: str) -> bool: ...
+
+    def head_object(self, s3_key: str) -> Optional[dict]: ...
+
+    def apply_object_tags(self, s3_key: str) -> None: ...
+
+    def list_objects(self, prefix: str) -> Iterator[dict]: ...
+
+    def delete_objects(self, keys: Iterable[str]) -> dict[str, str]: ...
+
+    def generate_put_url(
+        self, s3_key: str, content_type: str, headers: dict[str, str] | None = None
+    ) -> dict: ...
+
+    def generate_download_url(self, s3_key: str) -> dict: ...
+
+    def generate_download_urls(self, s3_keys: Iterable[str]) -> dict[str, dict]: ...
+
+    def create_multipart_upload(
+        self, s3_key: str, content_type: str, cache_control: str | None = None
+    ) -> str: ...
+
+    def upload_part(
+        self, s3_key: str, upload_id: str, part_number: int, body: bytes
+    ) -> dict: ...
+
+    def generate_part_upload_urls(
+        self, s3_key: str, upload_id: str, part_numbers: Iterable[int]
+    ) -> dict: ...
+
+    def list_uploaded_parts(self, s3_key: str, upload_id: str) -> list[dict] | None: ...
+
+    def complete_multipart_upload(
+        self, s3_key: str, upload_id: str, parts: list[dict]
+    ) -> None: ...
+
+    def abort_multipart_upload(self, s3_key: str, upload_id: str) -> None: ...
+
+
+def get_backend() -> StorageBackend | ModuleType:
+    if settings.storage_backend == "local":
+        from app import local_storage
+
+        return local_storage
+
+    from app import s3
+
+    return s3
+
+
+# MARK: - Keys
+
+
+def _get_path_prefix() -> str:
+    """Get the key prefix based on environment."""
+    return "" if settings.is_production else f"{settings.environment}/"
+
+
+def get_piece_s3_key(piece_id: UUID) -> str:
+    """
+    Generate S3 key for a piece.
+    Format:
+      - dev: dev/cadenza/pieces/{uuid}.pdf
+      - prod: cadenza/pieces/{uuid}.pdf
+    """
+    return f"{_get_path_prefix()}cadenza/pieces/{piece_id}.pdf"
+
+
+def get_pdf_blob_s3_key(sha256: str) -> str:
+    """
+    Content-addressed S3 key for a PDF, shared by every piece with the same bytes.
+    Format:
+      - dev: dev/cadenza/pieces/sha256/{hex digest}.pdf
+      - prod: cadenza/pieces/sha256/{hex digest}.pdf
+    """
+    return f"{_get_path_prefix()}cadenza/pieces/sha256/{sha256}.pdf"
+
+
+def get_pdf_upload_s3_key(piece_id: UUID) -> str:
+    """
+    Staging key for a direct upload of a content-addressed PDF. Finalizing copies
+    it to its get_pdf_blob_s3_key, so only pieces whose owner uploaded the bytes
+    reference a blob; storage GC collects the staged copy.
+    Format:
+      - dev: dev/cadenza/pieces/uploads/{uuid}.pdf
+      - prod: cadenza/pieces/uploads/{uuid}.pdf
+    """
+    return f"{_get_path_prefix()}cadenza/pieces/uploads/{piece_id}.pdf"
+
+
+def get_piece_reference_s3_key(piece_id: UUID, sha256: str, extension: str) -> str:
+    """
+    Score alignment reference (MusicXML or a recording) of a piece. Named by
+    content, so a replaced reference never shares a key with the old one.
+    """
+    return f"{_get_path_prefix()}cadenza/pieces/{piece_id}/reference-{sha256[:16]}{extension}"
+
+
+def is_content_addressed(s3_key: str) -> bool:
+    """The bytes at a content-addressed key can never change."""
+    return "cadenza/pieces/sha256/" in s3_key
+
+
+# Served with content-addressed objects so browsers and CDN edges keep them
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def get_video_s3_key(user_id: int, submission_id: UUID) -> str:
+    return f"{_get_path_prefix()}cadenza/videos/{user_id}/{submission_id}.mp4"
+
+
+def get_video_thumbnail_s3_key(user_id: int, submission_id: UUID) -> str:
+    return f"{_get_path_prefix()}cadenza/videos/{user_id}/{submission_id}_thumb.jpg"
+
+
+def get_message_s3_key(user_id: int, message_id: UUID) -> str:
+    return f"{_get_path_prefix()}cadenza/videos/{user_id}/messages/{message_id}.mp4"
+
+
+def get_message_thumbnail_s3_key(user_id: int, message_id: UUID) -> str:
+    return (
+        f"{_get_path_prefix()}cadenza/videos/{user_id}/messages/{message_id}_thumb.jpg"
+    )
+
+
+def get_preview_sprite_s3_key(thumbnail_s3_key: str) -> str:
+    """Scrub-preview sprite sheet stored next to a video's thumbnail."""
+    return f"{thumbnail_s3_key.removesuffix('.jpg')}_sprite.jpg"
+
+
+def get_pdf_derived_prefix(pdf_s3_key: str) -> str:
+    """
+    Prefix for objects generated from a piece PDF (page previews), inside its
+    key like a video's, so GC keeps them as long as the PDF.
+    """
+    return f"{pdf_s3_key.removesuffix('.pdf')}/"
+
+
+def get_pdf_preview_s3_key(pdf_s3_key: str) -> str:
+    """First-page preview of a piece PDF."""
+    return f"{get_pdf_derived_prefix(pdf_s3_key)}preview.jpg"
+
+
+def get_pdf_page_preview_s3_key(pdf_s3_key: str, page: int) -> str:
+    """Low-resolution preview of page `page` (from 1) of a piece PDF."""
+    return f"{get_pdf_derived_prefix(pdf_s3_key)}pages/{page}.jpg"
+
+
+def get_video_derived_prefix(video_s3_key: str) -> str:
+    """
+    Prefix for objects generated from a video (HLS renditions and the like).
+
+    They live "inside" the video's key, e.g. .../{submission_id}/hls/..., so GC
+    keeps them exactly as long as the video.
+    """
+    return f"{video_s3_key.removesuffix('.mp4')}/"
+
+
+def get_video_clip_s3_key(video_s3_key: str, start_ms: int, end_ms: int) -> str:
+    """Clip of a video; the same range always maps to the same object."""
+    return f"{get_video_derived_prefix(video_s3_key)}clips/{start_ms}-{end_ms}.mp4"
+
+
+def get_gc_prefixes() -> list[str]:
+    """Prefixes whose objects should all be referenced from the database."""
+    prefix = _get_path_prefix()
+    return [f"{prefix}cadenza/pieces/", f"{prefix}cadenza/videos/"]
+
+
+# MARK: - Uploads
+
+
+def upload_fileobj(
+    s3_key: str, fileobj: BinaryIO, content_type: str = "application/pdf"
+) -> None:
+    """Store a file object. Blocking; call from a worker thread in async code."""
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_content_addressed(s3_key) else None
+    get_backend().upload_fileobj(s3_key, fileobj, content_type, cache_control)
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_fileobj(fileobj: BinaryIO) -> tuple[str, int]:
+    """Hash a seekable file object and rewind it. Returns (hex digest, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := fileobj.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def generate_upload_url(piece_id: UUID, content_type: str = "application/pdf") -> dict:
+    """
+    Generate a presigned URL for uploading a PDF.
+
+    Args:
+        piece_id: UUID of the piece
+        content_type: MIME type of the file (default: application/pdf)
+
+    Returns:
+        dict with:
+            - url: Presigned URL for PUT request
+            - s3_key: The key where file will be stored
+            - headers: Headers the PUT must send
+            - expires_in: Seconds until URL expires
+    """
+    return get_backend().generate_put_url(get_piece_s3_key(piece_id), content_type)
+
+
+def generate_pdf_blob_upload_url(piece_id: UUID, sha256: str) -> dict:
+    """
+    Generate a presigned URL for uploading a PDF to be stored content-addressed.
+
+    The PUT lands at the piece's staging key (see get_pdf_upload_s3_key). The
+    SHA-256 checksum header is part of the signature, so storage rejects any body
+    that doesn't hash to `sha256`. The client must send every returned header.
+    """
+    checksum = base64.b64encode(bytes.fromhex(sha256)).decode("ascii")
+    return get_backend().generate_put_url(
+        get_pdf_upload_s3_key(piece_id),
+        "application/pdf",
+        headers={"x-amz-checksum-sha256": checksum},
+    )
+
+
+def store_pdf_upload(piece_id: UUID, sha256: str) -> Optional[dict]:
+    """
+    Copy a staged upload to its content-addressed key. Returns the staged object's
+    size and ETag, or None if nothing was uploaded.
+
+    The signed checksum made storage verify the staged bytes hash to `sha256`, so
+    the copy is safe even when the blob already exists.
+    """
+    backend = get_backend()
+    staged_key = get_pdf_upload_s3_key(piece_id)
+    head = backend.head_object(staged_key)
+    if head is None:
+        return None
+    backend.copy_object(
+        staged_key,
+        get_pdf_blob_s3_key(sha256),
+        content_type="application/pdf",
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+    )
+    return head
+
+
+def generate_video_upload_url(user_id: int, submission_id: UUID) -> dict:
+    return get_backend().generate_put_url(
+        get_video_s3_key(user_id, submission_id), "video/mp4"
+    )
+
+
+def generate_video_thumbnail_upload_url(user_id: int, submission_id: UUID) -> dict:
+    return get_backend().generate_put_url(
+        get_video_thumbnail_s3_key(user_id, submission_id), "image/jpeg"
+    )
+
+
+def generate_message_upload_url(user_id: int, message_id: UUID) -> dict:
+    return get_backend().generate_put_url(
+        get_message_s3_key(user_id, message_id), "video/mp4"
+    )
+
+
+def generate_message_thumbnail_upload_url(user_id: int, message_id: UUID) -> dict:
+    return get_backend().generate_put_url(
+        get_message_thumbnail_s3_key(user_id, message_id), "image/jpeg"
+    )
+
+
+# MARK: - Multipart uploads
+
+
+def create_multipart_upload(s3_key: str, content_type: str) -> str:
+    return get_backend().create_multipart_upload(s3_key, content_type)
+
+
+def generate_part_upload_urls(
+    s3_key: str, upload_id: str, part_numbers: Iterable[int]
+) -> dict:
+    return get_backend().generate_part_upload_urls(s3_key, upload_id, part_numbers)
+
+
+def list_uploaded_parts(s3_key: str, upload_id: str) -> list[dict] | None:
+    return get_backend().list_uploaded_parts(s3_key, upload_id)
+
+
+def complete_multipart_upload(s3_key: str, upload_id: str, parts: list[dict]) -> None:
+    get_backend().complete_multipart_upload(s3_key, upload_id, parts)
+
+
+def abort_multipart_upload(s3_key: str, upload_id: str) -> None:
+    get_backend().abort_multipart_upload(s3_key, upload_id)
+
+
+# MARK: - Objects
+
+
+def object_exists(s3_key: str) -> bool:
+    return get_backend().object_exists(s3_key)
+
+
+def iter_object(s3_key: str, chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream an object's bytes. FileNotFoundError if it doesn't exist."""
+    return get_backend().iter_object(s3_key, chunk_size)
+
+
+def head_object(s3_key: str) -> Optional[dict]:
+    """Size and ETag of a stored object, or None if it doesn't exist."""
+    return get_backend().head_object(s3_key)
+
+
+def apply_object_tags(s3_key: str) -> None:
+    get_backend().apply_object_tags(s3_key)
+
+
+def generate_download_url(s3_key: str, *, origin: bool = False) -> dict:
+    """
+    Get a presigned GET URL for an object.
+
+    With DOWNLOAD_DELIVERY=cdn the URL is a CDN signed URL, unless `origin` is set
+    for server-side reads that shouldn't fill edge caches.
+
+    Returns:
+        dict with:
+            - url: Presigned URL for GET request
+            - expires_in: Seconds until URL expires
+    """
+    return generate_download_urls([s3_key], origin=origin)[s3_key]
+
+
+def generate_download_urls(
+    s3_keys: Iterable[str], *, origin: bool = False
+) -> dict[str, dict]:
+    if settings.download_delivery == "cdn" and not origin:
+        from app import cdn
+
+        return cdn.generate_download_urls(s3_keys)
+    return get_backend().generate_download_urls(s3_keys)
+
+
+def list_objects(prefix: str) -> Iterator[dict]:
+    return get_backend().list_objects(prefix)
+
+
+def delete_objects(keys: Iterable[str]) -> dict[str, str]:
+    """Delete objects. Returns {key: error code} for keys that failed."""
+    return get_backend().delete_objects(keys)
+
+
+def sha256_object(s3_key: str) -> tuple[str, int]:
+    """Hash a stored object by streaming it. Returns (hex digest, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in get_backend().iter_object(s3_key, HASH_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+@lru_cache(maxsize=256)
+def _bundled_pdf_digest(source_key: str, etag: str) -> tuple[str, int]:
+    """Hash a bundled PDF once per version (keyed by ETag)."""
+    return sha256_object(source_key)
+
+
+def copy_bundled_to_user_piece(source_filename: str) -> dict:
+    """
+    Make a bundled PDF available as a piece.
+
+    Bundled PDFs are copied to their content-addressed key once; later calls for
+    the same file only HEAD it.
+
+    Args:
+        source_filename: Filename in infra/ios/bundle/
+
+    Returns:
+        dict with:
+            - s3_key: Content-addressed key of the PDF
+            - sha256: Hex digest of the PDF
+            - size: Size in bytes
+    """
+    backend = get_backend()
+    source_key = f"infra/ios/bundle/{source_filename}"
+
+    source = backend.head_object(source_key)
+    if source is None:
+        raise Exception(f"Bundled file not found: {source_filename}")
+
+    sha256, size = _bundled_pdf_digest(source_key, source["etag"])
+    dest_key = get_pdf_blob_s3_key(sha256)
+    if not backend.object_exists(dest_key):
+        backend.copy_object(
+            source_key,
+            dest_key,
+            content_type="application/pdf",
+            cache_control=IMMUTABLE_CACHE_CONTROL,
+        )
+
+    return {"s3_key": dest_key, "sha256": sha256, "size": size}
@@ -0,0 +1,174 @@
+"""
+Garbage collection for S3 objects the database no longer references.
+
+Deleting a piece, releasing a shared PDF blob or removing a submission leaves
+its objects in S3. This job lists every object under the pieces/ and videos/
+prefixes, compares the keys against the database and deletes the orphans with
+batched DeleteObjects calls. Objects derived from a video (HLS renditions, ...)
+or a PDF (page previews) live under its key minus ".mp4"/".pdf" and are kept
+while it is.
+
+Objects younger than the grace period are never deleted: presigned uploads land
+in S3 before (or without) their database row, e.g. a direct piece upload that
+hasn't been finalized yet.
+
+Usage:
+    python -m app.storage_gc            # Dry run: report orphans only
+    python -m app.storage_gc --delete   # Delete them
+"""
+
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session, col, delete, select
+
+from app import models, storage
+from app.config import settings
+
+
+@dataclass
+class GcReport:
+    dry_run: bool
+    scanned: int = 0
+    orphans: list[str] = field(default_factory=list)
+    orphan_bytes: int = 0
+    skipped_recent: int = 0
+    deleted: int = 0
+    errors: dict[str, str] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        action = "would delete" if self.dry_run else "deleted"
+        count = len(self.orphans) if self.dry_run else self.deleted
+        lines = [
+            f"Scanned {self.scanned} objects",
+            f"Orphans: {len(self.orphans)} ({self.orphan_bytes} bytes), {action} {count}",
+            f"Kept {self.skipped_recent} unreferenced objects inside the grace period",
+        ]
+        lines += [f"  failed: {key} ({code})" for key, code in self.errors.items()]
+        return "\n".join(lines)
+
+
+def _live_keys(db: Session) -> set[str]:
+    """Every S3 key a database row still points at."""
+    columns = [
+        models.Piece.s3_key,
+        models.Piece.reference_s3_key,
+        models.VideoSubmission.s3_key,
+        models.VideoSubmission.thumbnail_s3_key,
+        models.VideoSubmission.preview_sprite_s3_key,
+        models.Message.video_s3_key,
+        models.Message.thumbnail_s3_key,
+        models.Message.preview_sprite_s3_key,
+    ]
+    keys = set()
+    for column in columns:
+        keys.update(db.exec(select(column).where(column.is_not(None))).all())
+    keys.update(
+        db.exec(select(models.PdfBlob.s3_key).where(models.PdfBlob.ref_count > 0)).all()
+    )
+    return keys
+
+
+def _is_live(key: str, live: set[str]) -> bool:
+    if key in live:
+        return True
+    # Objects derived from a video or PDF live under its key minus the extension
+    return any(
+        f"{key[:i]}{extension}" in live
+        for i, char in enumerate(key)
+        if char == "/"
+        for extension in (".mp4", ".pdf")
+    )
+
+
+def collect_garbage(
+    db: Session,
+    *,
+    dry_run: bool = True,
+    grace: timedelta | None = None,
+) -> GcReport:
+    """
+    Find (and unless `dry_run`, delete) unreferenced objects.
+
+    Released PDF blob rows are locked for the whole run so a concurrent upload of
+    the same PDF waits, then re-creates the blob and uploads it again.
+    """
+    if grace is None:
+        grace = timedelta(hours=settings.storage_gc_grace_hours)
+    cutoff = datetime.now(timezone.utc) - grace
+    report = GcReport(dry_run=dry_run)
+
+    released_blobs = db.exec(
+        select(models.PdfBlob)
+        .where(models.PdfBlob.ref_count <= 0)
+        .with_for_update(skip_locked=True)
+    ).all()
+    released_keys = {blob.s3_key for blob in released_blobs}
+    live = _live_keys(db)
+    listed_released = set()
+
+    for prefix in storage.get_gc_prefixes():
+        for obj in storage.list_objects(prefix):
+            report.scanned += 1
+            if obj["key"] in released_keys:
+                listed_released.add(obj["key"])
+            if _is_live(obj["key"], live):
+                continue
+            if obj["last_modified"] > cutoff:
+                report.skipped_recent += 1
+                continue
+            report.orphans.append(obj["key"])
+            report.orphan_bytes += obj["size"]
+
+    if dry_run:
+        db.rollback()
+        return report
+
+    report.errors = storage.delete_objects(report.orphans)
+    report.deleted = len(report.orphans) - len(report.errors)
+
+    # Blob rows go once their object is gone (or never made it to S3)
+    orphaned = set(report.orphans) - set(report.errors)
+    stale = [
+        blob.sha256
+        for blob in released_blobs
+        if blob.s3_key in orphaned or blob.s3_key not in listed_released
+    ]
+    if stale:
+        db.exec(delete(models.PdfBlob).where(col(models.PdfBlob.sha256).in_(stale)))
+    # Piece uploads not finalized within the grace period are abandoned
+    db.exec(delete(models.PieceUpload).where(models.PieceUpload.created_at < cutoff))
+    db.commit()
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--delete", action="store_true", help="Delete orphans (default: dry run)"
+    )
+    parser.add_argument(
+        "--grace-hours",
+        type=float,
+        default=settings.storage_gc_grace_hours,
+        help="Keep unreferenced objects younger than this",
+    )
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    with Session(engine) as db:
+        report = collect_garbage(
+            db, dry_run=not args.delete, grace=timedelta(hours=args.grace_hours)
+        )
+
+    if report.dry_run:
+        for key in report.orphans:
+            print(key)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""Job handlers. Importing this module registers them with app.jobs."""
+
+import io
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import UUID
+
+from sqlmodel import Session, delete, select
+
+from app import jobs, models, pdf_blobs, storage
+from app.config import settings
+from app.jobs import job_handler
+
+
+@job_handler("storage.delete_objects")
+def delete_objects(db: Session, payload: dict) -> dict:
+    """Delete S3 objects. Retried until every key is gone."""
+    keys = payload["keys"]
+    errors = storage.delete_objects(keys)
+    if errors:
+        raise Exception(f"Failed to delete {len(errors)} of {len(keys)}: {errors}")
+    return {"deleted": len(keys)}
+
+
+@job_handler("storage.gc")
+def collect_storage_garbage(db: Session, payload: dict) -> dict:
+    """Run app.storage_gc; dry run unless the payload says otherwise."""
+    from app.storage_gc import collect_garbage
+
+    report = collect_garbage(db, dry_run=payload.get("dry_run", True))
+    return {
+        "scanned": report.scanned,
+        "orphans": len(report.orphans),
+        "orphan_bytes": report.orphan_bytes,
+        "deleted": report.deleted,
+        "errors": report.errors,
+    }
+
+
+@job_handler("pieces.copy_bundled")
+def copy_bundled_piece(db: Session, payload: dict) -> dict:
+    """Create a piece from a PDF bundled with the iOS app."""
+    piece_id = UUID(payload["piece_id"])
+    if db.get(models.Piece, piece_id):
+        return {"piece_id": str(piece_id)}
+
+    copied = storage.copy_bundled_to_user_piece(payload["source_filename"])
+    pdf_blobs.retain(db, copied["sha256"], copied["size"])
+
+    db.add(
+        models.Piece(
+            id=piece_id,
+            owner_id=payload["owner_id"],
+            title=payload["title"],
+            pdf_filename=payload["source_filename"],
+            s3_key=copied["s3_key"],
+            blob_sha256=copied["sha256"],
+        )
+    )
+    enqueue_pdf_previews(db, copied["s3_key"])
+    return {"piece_id": str(piece_id)}
+
+
+# MARK: - PDF previews
+
+
+def enqueue_pdf_previews(db: Session, s3_key: str) -> None:
+    """
+    Queue previews of a piece's PDF in the caller's transaction. A PDF another
+    piece already has previews of is not rendered again.
+    """
+    rendered = db.exec(
+        select(models.Piece).where(
+            models.Piece.s3_key == s3_key, models.Piece.preview_s3_key.isnot(None)
+        )
+    ).first()
+    if rendered is None:
+        jobs.enqueue(db, "media.pdf_previews", {"s3_key": s3_key})
+        return
+    for piece in db.exec(select(models.Piece).where(models.Piece.s3_key == s3_key)):
+        piece.preview_s3_key = rendered.preview_s3_key
+        piece.page_preview_count = rendered.page_preview_count
+        db.add(piece)
+
+
+@job_handler("media.pdf_previews")
+def generate_pdf_previews(db: Session, payload: dict) -> dict:
+    """First-page and page previews of a PDF, for every piece that has it."""
+    from app import pdf_previews
+
+    s3_key = payload["s3_key"]
+    pieces = db.exec(select(models.Piece).where(models.Piece.s3_key == s3_key)).all()
+    if not pieces:
+        return {"skipped": "no piece"}
+    if storage.head_object(s3_key) is None:
+        return {"skipped": "pdf not uploaded"}
+
+    preview_s3_key = storage.get_pdf_preview_s3_key(s3_key)
+    page_count = None
+    with tempfile.TemporaryDirectory(prefix="pdf-previews-") as workdir:
+        out_dir = Path(workdir)
+        pdf_path = out_dir / "piece.pdf"
+        with open(pdf_path, "wb") as pdf:
+            pdf.writelines(storage.iter_object(s3_key))
+
+        preview = pdf_previews.render_first_page(pdf_path, out_dir)
+        with open(preview, "rb") as body:
+            storage.upload_fileobj(preview_s3_key, body, pdf_previews.CONTENT_TYPE)
+
+        if settings.pdf_page_previews:
+            pages_dir = out_dir / "pages"
+            pages_dir.mkdir()
+            pages = pdf_previews.render_pages(pdf_path, pages_dir)
+            for number, page in enumerate(pages, 1):
+                with open(page, "rb") as body:
+                    storage.upload_fileobj(
+                        storage.get_pdf_page_preview_s3_key(s3_key, number),
+                        body,
+                        pdf_previews.CONTENT_TYPE,
+                    )
+            page_count = len(pages)
+
+    for piece in pieces:
+        piece.preview_s3_key = preview_s3_key
+        piece.page_preview_count = page_count
+        db.add(piece)
+    return {"pieces": len(pieces), "pages": page_count}
+
+
+# MARK: - Video processing
+
+# Jobs run for every submission/message video once its upload is finalized,
+# cheapest first so previews don't queue behind transcodes
+VIDEO_PIPELINE = [
+    "media.generate_previews",
+    "media.waveform",
+    "media.transcode_hls",
+]
+
+# ...and additionally for submissions, whose audio teachers review
+SUBMISSION_ANALYSES = ["analysis.intonation", "analysis.tempo", "analysis.alignment"]
+
+VideoRecord = models.VideoSubmission | models.Message
+
+
+def _resource(record: VideoRecord) -> str:
+    return "message" if isinstance(record, models.Message) else "video_submission"
+
+
+def enqueue_upload_probe(db: Session, record: VideoRecord) -> None:
+    """Queue probing of a video just confirmed in storage, in the caller's transaction."""
+    jobs.enqueue(
+        db,
+        "uploads.probe_video",
+        {"resource": _resource(record), "id": str(record.id), "etag": record.etag},
+    )
+
+
+def enqueue_video_pipeline(db: Session, record: VideoRecord) -> None:
+    """Queue processing of a probed video in the caller's transaction."""
+    kinds = VIDEO_PIPELINE
+    if isinstance(record, models.VideoSubmission):
+        kinds = VIDEO_PIPELINE + SUBMISSION_ANALYSES
+    for kind in kinds:
+        jobs.enqueue(db, kind, {"resource": _resource(record), "id": str(record.id)})
+
+
+def _video_record(db: Session, payload: dict) -> tuple[VideoRecord | None, str | None]:
+    """The record a video job is for and its video key."""
+    model = (
+        models.Message if payload["resource"] == "message" else models.VideoSubmission
+    )
+    record = db.get(model, UUID(payload["id"]))
+    if record is None:
+        return None, None
+    key = record.video_s3_key if isinstance(record, models.Message) else record.s3_key
+    return record, key
+
+
+def _load_video(db: Session, payload: dict) -> tuple[VideoRecord | None, str | None]:
+    """The record a video job is for and its video key, if it's still uploaded."""
+    record, key = _video_record(db, payload)
+    if record is None or record.upload_state != "complete":
+        return None, None
+    return record, key
+
+
+# Not a media.* job: hashing streams the file and ffprobe only reads the
+# container's headers, and uploads shouldn't wait behind a media worker's
+# transcode backlog to become visible
+@job_handler("uploads.probe_video")
+def probe_video(db: Session, payload: dict) -> dict:
+    """
+    Hash a finalized upload and read its duration, resolution and codec, so they
+    come from the file rather than the client, then queue its processing.
+    """
+    from app import media
+
+    record, s3_key = _video_record(db, payload)
+    # A re-upload since this job was queued has its own probe
+    if (
+        record is None
+        or record.upload_state != "uploaded"
+        or record.etag != payload["etag"]
+    ):
+        return {"skipped": "upload changed"}
+
+    # The ETag isn't a content hash for multipart uploads
+    record.sha256, _ = storage.sha256_object(s3_key)
+    info = media.probe(storage.generate_download_url(s3_key, origin=True)["url"])
+    if info is None:
+        record.upload_state = "invalid"
+    else:
+        record.upload_state = "complete"
+        duration_field = (
+            "video_duration_seconds"
+            if isinstance(record, models.Message)
+            else "duration_seconds"
+        )
+        setattr(record, duration_field, round(info.duration_seconds))
+        record.width = info.width
+        record.height = info.height
+        record.video_codec = info.video_codec
+        enqueue_video_pipeline(db, record)
+    db.add(record)
+    return {"upload_state": record.upload_state}
+
+
+@job_handler("media.transcode_hls")
+def transcode_hls(db: Session, payload: dict) -> dict:
+    """Package a finalized video as an HLS ladder next to the original."""
+    from app import hls, media
+
+    record, s3_key = _load_video(db, payload)
+    if record is None:
+        return {"skipped": "video not uploaded"}
+
+    source_url = storage.generate_download_url(s3_key, origin=True)["url"]
+    info = media.probe(source_url)
+    if info is None:
+        return {"skipped": "unreadable video"}
+
+    hls_prefix = f"{storage.get_video_derived_prefix(s3_key)}hls/"
+    with tempfile.TemporaryDirectory(prefix="hls-") as workdir:
+        out_dir = Path(workdir)
+        renditions = hls.transcode(source_url, out_dir, info)
+
+        # Master playlist last: nothing points at renditions before they're stored
+        files = sorted(
+            (path for path in out_dir.rglob("*") if path.is_file()),
+            key=lambda path: path.name == hls.MASTER_PLAYLIST,
+        )
+        for path in files:
+            with open(path, "rb") as body:
+                storage.upload_fileobj(
+                    f"{hls_prefix}{path.relative_to(out_dir).as_posix()}",
+                    body,
+                    hls.content_type(path),
+                )
+
+    record.hls_master_s3_key = f"{hls_prefix}{hls.MASTER_PLAYLIST}"
+    record.hls_renditions = renditions
+    db.add(record)
+    return {"renditions": [rendition["name"] for rendition in renditions]}
+
+
+@job_handler("media.generate_previews")
+def generate_previews(db: Session, payload: dict) -> dict:
+    """Poster frame (unless the client uploaded one) and scrub-preview sprite."""
+    from app import media, previews
+
+    record, s3_key = _load_video(db, payload)
+    if record is None:
+        return {"skipped": "video not uploaded"}
+
+    is_message = isinstance(record, models.Message)
+    info = media.MediaInfo(
+        duration_seconds=(
+            record.video_duration_seconds if is_message else record.duration_seconds
+        )
+        or 0,
+        width=record.width,
+        height=record.height,
+        video_codec=record.video_codec,
+        audio_codec=None,
+    )
+    if not info.video_codec:
+        return {"skipped": "no video stream"}
+
+    source_url = storage.generate_download_url(s3_key, origin=True)["url"]
+    layout = previews.sprite_layout(info)
+    sprite_s3_key = storage.get_preview_sprite_s3_key(record.thumbnail_s3_key)
+    poster_uploaded = False
+
+    with tempfile.TemporaryDirectory(prefix="previews-") as workdir:
+        if storage.head_object(record.thumbnail_s3_key) is None:
+            poster = Path(workdir) / "poster.jpg"
+            previews.extract_poster(source_url, poster, info)
+            with open(poster, "rb") as body:
+                storage.upload_fileobj(record.thumbnail_s3_key, body, "image/jpeg")
+            poster_uploaded = True
+
+        sprite = Path(workdir) / "sprite.jpg"
+        previews.extract_sprite(source_url, sprite, layout)
+        with open(sprite, "rb") as body:
+            storage.upload_fileobj(sprite_s3_key, body, "image/jpeg")
+
+    record.preview_sprite_s3_key = sprite_s3_key
+    record.preview_sprite = layout
+    db.add(record)
+    return {"poster": poster_uploaded, "sprite_tiles": layout["count"]}
+
+
+@job_handler("media.waveform")
+def compute_waveform(db: Session, payload: dict) -> dict:
+    """Min/max peaks of a finalized video's audio track."""
+    from app import media, waveform
+
+    record, s3_key = _load_video(db, payload)
+    if record is None:
+        return {"skipped": "video not uploaded"}
+
+    source_url = storage.generate_download_url(s3_key, origin=True)["url"]
+    info = media.probe(source_url)
+    if info is None or not info.audio_codec:
+        return {"skipped": "no audio"}
+
+    peaks = waveform.generate(source_url, info.duration_seconds)
+    if peaks is None:
+        return {"skipped": "no audio"}
+
+    waveform_s3_key = f"{storage.get_video_derived_prefix(s3_key)}{waveform.FILENAME}"
+    storage.upload_fileobj(waveform_s3_key, io.BytesIO(peaks), waveform.CONTENT_TYPE)
+
+    record.waveform_s3_key = waveform_s3_key
+    db.add(record)
+    return {"bytes": len(peaks)}
+
+
+# MARK: - Audio analysis
+
+
+def _load_submission_audio(db: Session, payload: dict):
+    """
+    A submission job's record and decoded audio (app.audio), or the reason to
+    skip the job.
+    """
+    from app import audio, media
+
+    record, s3_key = _load_video(db, payload)
+    if record is None:
+        return "video not uploaded"
+
+    source_url = storage.generate_download_url(s3_key, origin=True)["url"]
+    info = media.probe(source_url)
+    if info is None or not info.audio_codec:
+        return "no audio"
+    return record, audio.load(source_url)
+
+
+def _store_analysis(
+    db: Session, submission_id: UUID, kind: str, version: int, result: dict
+) -> None:
+    """Insert or replace a submission's analysis of `kind`."""
+    analysis = db.exec(
+        select(models.SubmissionAnalysis).where(
+            models.SubmissionAnalysis.submission_id == submission_id,
+            models.SubmissionAnalysis.kind == kind,
+        )
+    ).first() or models.SubmissionAnalysis(submission_id=submission_id, kind=kind)
+    analysis.version = version
+    analysis.result = result
+    analysis.created_at = datetime.now(timezone.utc)
+    db.add(analysis)
+
+
+@job_handler("analysis.intonation")
+def analyze_intonation(db: Session, payload: dict) -> dict:
+    """Pitch track, cents histogram and per-second deviation of a submission."""
+    from app import audio, intonation
+
+    loaded = _load_submission_audio(db, payload)
+    if isinstance(loaded, str):
+        return {"skipped": loaded}
+    record, samples = loaded
+
+    result = intonation.analyze(samples, audio.ANALYSIS_SAMPLE_RATE)
+    _store_analysis(db, record.id, "intonation", intonation.VERSION, result)
+    return result["summary"]
+
+
+@job_handler("analysis.tempo")
+def analyze_tempo(db: Session, payload: dict) -> dict:
+    """Onsets, local tempo and rushing/dragging segments of a submission."""
+    from app import audio, tempo
+
+    loaded = _load_submission_audio(db, payload)
+    if isinstance(loaded, str):
+        return {"skipped": loaded}
+    record, samples = loaded
+
+    result = tempo.analyze(samples, audio.ANALYSIS_SAMPLE_RATE)
+    _store_analysis(db, record.id, "tempo", tempo.VERSION, result)
+    return {**result["summary"], "segments": len(result["segments"])}
+
+
+def _load_reference(piece: models.Piece):
+    """A piece's alignment reference (app.alignment), cached across jobs."""
+    from app import alignment, audio
+
+    def load():
+        if piece.reference_kind == "musicxml":
+            return alignment.score_reference(
+                b"".join(storage.iter_object(piece.reference_s3_key))
+            )
+        url = storage.generate_download_url(piece.reference_s3_key, origin=True)["url"]
+        return alignment.recording_reference(
+            audio.load(url), audio.ANALYSIS_SAMPLE_RATE, piece.reference_measure_times
+        )
+
+    # Measure times can be corrected without replacing the recording
+    key = f"{piece.reference_s3_key}:{piece.reference_measure_times}"
+    return alignment.cached_reference(key, load)
+
+
+@job_handler("analysis.alignment")
+def align_to_reference(db: Session, payload: dict) -> dict:
+    """Time -> measure map of a submission against its piece's reference."""
+    from app import alignment, audio
+
+    submission = db.get(models.VideoSubmission, UUID(payload["id"]))
+    piece = alignment.reference_piece(
+        db, db.get(models.Piece, submission.piece_id) if submission else None
+    )
+    if piece is None:
+        return {"skipped": "no reference"}
+
+    loaded = _load_submission_audio(db, payload)
+    if isinstance(loaded, str):
+        return {"skipped": loaded}
+    record, samples = loaded
+
+    result = alignment.analyze(
+        samples, audio.ANALYSIS_SAMPLE_RATE, _load_reference(piece)
+    )
+    result["summary"]["piece_id"] = str(piece.id)
+    _store_analysis(db, record.id, "alignment", alignment.VERSION, result)
+
+    db.exec(
+        delete(models.SubmissionMeasure).where(
+            models.SubmissionMeasure.submission_id == record.id
+        )
+    )
+    for span in result["spans"]:
+        db.add(
+            models.SubmissionMeasure(submission_id=record.id, piece_id=piece.id, **span)
+        )
+    return result["summary"]
+
+
+# MARK: - Clips
+
+
+@job_handler("media.extract_clip")
+def extract_clip(db: Session, payload: dict) -> dict:
+    """Cut a range of a submission into its own MP4, once per range."""
+    from app import media
+
+    submission = db.get(models.VideoSubmission, UUID(payload["submission_id"]))
+    if submission is None or submission.upload_state != "complete":
+        return {"skipped": "video not uploaded"}
+
+    source_url = storage.generate_download_url(submission.s3_key, origin=True)["url"]
+    source = media.probe(source_url)
+    if source is None:
+        return {"skipped": "unreadable video"}
+
+    # A range past the end of the video ends where the video does; the start
+    # reported below is counted back from the clip's real end
+    start_ms = payload["start_ms"]
+    end_ms = min(payload["end_ms"], int(source.duration_seconds * 1000))
+    if end_ms <= start_ms:
+        return {"skipped": "clip starts after the video ends"}
+    clip_s3_key = storage.get_video_clip_s3_key(submission.s3_key, start_ms, end_ms)
+
+    if storage.head_object(clip_s3_key) is not None:
+        # Someone already asked for this range
+        info = media.probe(
+            storage.generate_download_url(clip_s3_key, origin=True)["url"]
+        )
+    else:
+        with tempfile.TemporaryDirectory(prefix="clip-") as workdir:
+            clip = Path(workdir) / "clip.mp4"
+            media.extract_clip(source_url, str(clip), start_ms / 1000, end_ms / 1000)
+            info = media.probe(str(clip))
+            with open(clip, "rb") as body:
+                storage.upload_fileobj(clip_s3_key, body, "video/mp4")
+
+    # The clip starts on the keyframe before the requested start and ends on time
+    duration = info.duration_seconds if info else None
+    start = end_ms / 1000 - duration if duration else start_ms / 1000
+    return {
+        "s3_key": clip_s3_key,
+        "start_seconds": round(max(0.0, start), 3),
+        "duration_seconds": duration,
+    }
@@ -0,0 +1,215 @@
+"""
+Onset detection and tempo stability of submission audio.
+
+Onsets come from spectral flux: the half-wave rectified frame-to-frame increase
+of the log-compressed magnitude spectrum, summed over bins, for every frame at
+once. Peaks of that novelty curve above a moving-average threshold are onsets.
+
+Tempo is read from the autocorrelation of the onset pulse train: once over the
+whole recording, then per sliding window, searching only near the whole
+recording's period so a window can't jump an octave. The median window is the
+reference tempo; windows more than DRIFT_PERCENT faster or slower than it are
+merged into rushing and dragging segments, which teachers can jump to (and
+video markers can start from).
+
+analyze() is a pure function of the samples, so backfills can fan it out over
+a process pool. The result (models.SubmissionAnalysis, kind "tempo") is:
+
+    summary     onsets, tempo_bpm (None if no steady pulse), stability
+                (standard deviation of local tempo, as % of tempo_bpm)
+    local_tempo {window_seconds, hop_seconds, bpm}: None where there's no pulse
+    segments    [{kind: "rushing" | "dragging", start_seconds, end_seconds,
+                  drift_percent}]
+"""
+
+import numpy as np
+
+from app import audio
+
+VERSION = 1
+
+N_FFT = 1024
+HOP = 256  # 16 ms at 16 kHz
+# Onsets closer than this are one onset (bow changes can ring twice)
+MIN_ONSET_GAP_SECONDS = 0.05
+THRESHOLD_WINDOW_SECONDS = 0.5
+THRESHOLD_DELTA = 0.05
+MIN_BPM = 40
+MAX_BPM = 200
+WINDOW_SECONDS = 8.0
+WINDOW_HOP_SECONDS = 2.0
+# Local period searched within this factor of the reference period
+LOCAL_SEARCH = 1.3
+# Autocorrelation peaks weaker than this (relative to lag 0) aren't a pulse
+MIN_PULSE_STRENGTH = 0.1
+DRIFT_PERCENT = 6.0
+PULSE_WIDTH = 5  # Frames
+
+
+def novelty(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Spectral flux per HOP, normalized to [0, 1]."""
+    spectrum = np.log1p(100 * audio.spectrogram(samples, N_FFT, HOP))
+    # Against silence before the first frame, so a note at 0 s is an onset
+    flux = np.maximum(np.diff(spectrum, axis=0, prepend=0), 0).sum(axis=1)
+    peak = flux.max(initial=0)
+    return flux / peak if peak > 0 else flux
+
+
+def _moving(values: np.ndarray, width: int, reduce) -> np.ndarray:
+    """Centered moving `reduce` (np.mean, np.max, ...) over `width` frames."""
+    half = width // 2
+    padded = np.pad(values, half, mode="reflect")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1)
+    return reduce(windows, axis=1)
+
+
+def onsets(curve: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Frame indices of onsets: local maxima above the adaptive threshold."""
+    frames_per_second = sample_rate / HOP
+    gap = max(1, int(MIN_ONSET_GAP_SECONDS * frames_per_second))
+    threshold = (
+        _moving(curve, int(THRESHOLD_WINDOW_SECONDS * frames_per_second), np.mean)
+        + THRESHOLD_DELTA
+    )
+    is_peak = (curve == _moving(curve, 2 * gap, np.max)) & (curve > threshold)
+    return np.nonzero(is_peak)[0]
+
+
+def _autocorrelation(frames: np.ndarray) -> np.ndarray:
+    """Autocorrelation of each row (mean removed), normalized by lag 0."""
+    centered = frames - frames.mean(axis=1, keepdims=True)
+    n_fft = 1 << int(np.ceil(np.log2(2 * frames.shape[1])))
+    spectrum = np.fft.rfft(centered, n_fft, axis=1)
+    correlation = np.fft.irfft(np.abs(spectrum) ** 2, n_fft, axis=1)
+    correlation = correlation[:, : frames.shape[1]]
+    energy = correlation[:, :1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(energy > 0, correlation / energy, 0)
+
+
+def _best_lag(
+    correlation: np.ndarray, low: np.ndarray, high: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Strongest (fractional) lag of each row within [low, high], and its strength."""
+    lags = np.arange(correlation.shape[1])
+    allowed = (lags >= low[:, None]) & (lags <= high[:, None])
+    masked = np.where(allowed, correlation, -np.inf)
+    best = np.argmax(masked, axis=1)
+    rows = np.arange(len(best))
+    strength = masked[rows, best]
+
+    # Parabolic interpolation: tempo resolution finer than one frame
+    inner = np.clip(best, 1, correlation.shape[1] - 2)
+    left = correlation[rows, inner - 1]
+    right = correlation[rows, inner + 1]
+    curvature = left - 2 * correlation[rows, inner] + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0.0)
+    return best + np.clip(shift, -0.5, 0.5), strength
+
+
+def analyze(samples: np.ndarray, sample_rate: int) -> dict:
+    curve = novelty(samples, sample_rate)
+    frames_per_second = sample_rate / HOP
+    onset_frames = onsets(curve, sample_rate)
+
+    # Pulse train of the onsets; steadier for autocorrelation than raw flux.
+    # Pulses are spread over a few frames so periods that aren't a whole
+    # number of frames (onsets 41, 42, 42, 41... frames apart) still correlate
+    pulses = np.zeros_like(curve)
+    pulses[onset_frames] = curve[onset_frames]
+    pulses = np.convolve(pulses, np.hanning(PULSE_WIDTH + 2)[1:-1], mode="same")
+
+    min_lag = int(frames_per_second * 60 / MAX_BPM)
+    max_lag = int(frames_per_second * 60 / MIN_BPM)
+
+    reference_bpm = None
+    if len(pulses) > 2 * max_lag:
+        lag, strength = _best_lag(
+            _autocorrelation(pulses[None, :]),
+            np.array([min_lag]),
+            np.array([max_lag]),
+        )
+        if strength[0] >= MIN_PULSE_STRENGTH:
+            reference_bpm = 60 * frames_per_second / lag[0]
+
+    window = int(WINDOW_SECONDS * frames_per_second)
+    window_hop = int(WINDOW_HOP_SECONDS * frames_per_second)
+    local_bpm = np.full(0, np.nan)
+    if reference_bpm is not None and len(pulses) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(pulses, window)[::window_hop]
+        reference_lag = 60 * frames_per_second / reference_bpm
+        bounds = np.full(len(windows), reference_lag)
+        lag, strength = _best_lag(
+            _autocorrelation(windows),
+            np.floor(bounds / LOCAL_SEARCH).astype(int),
+            np.ceil(bounds * LOCAL_SEARCH).astype(int),
+        )
+        # Too few onsets in a window (a pause, a restart) means no tempo there
+        cumulative = np.concatenate(
+            [[0], np.cumsum(np.bincount(onset_frames, minlength=len(pulses)))]
+        )
+        window_starts = np.arange(len(windows)) * window_hop
+        onset_counts = cumulative[window_starts + window] - cumulative[window_starts]
+        steady = (strength >= MIN_PULSE_STRENGTH) & (onset_counts >= 4)
+        with np.errstate(divide="ignore"):
+            local_bpm = np.where(steady, 60 * frames_per_second / lag, np.nan)
+        # The whole recording's period is pulled towards any faster or slower
+        # passages; the typical window's isn't
+        if steady.any():
+            reference_bpm = float(np.median(local_bpm[steady]))
+
+    return {
+        "summary": {
+            "onsets": int(len(onset_frames)),
+            "tempo_bpm": round(float(reference_bpm), 1) if reference_bpm else None,
+            "stability": _stability(local_bpm, reference_bpm),
+        },
+        "local_tempo": {
+            "window_seconds": WINDOW_SECONDS,
+            "hop_seconds": WINDOW_HOP_SECONDS,
+            "bpm": [None if np.isnan(v) else round(float(v), 1) for v in local_bpm],
+        },
+        "segments": _drift_segments(local_bpm, reference_bpm),
+    }
+
+
+def _stability(local_bpm: np.ndarray, reference_bpm: float | None) -> float | None:
+    steady = local_bpm[~np.isnan(local_bpm)]
+    if reference_bpm is None or steady.size < 2:
+        return None
+    return round(float(100 * np.std(steady) / reference_bpm), 1)
+
+
+def _drift_segments(local_bpm: np.ndarray, reference_bpm: float | None) -> list[dict]:
+    """Runs of consecutive windows faster or slower than the reference tempo."""
+    if reference_bpm is None:
+        return []
+    drift = 100 * (local_bpm / reference_bpm - 1)
+    state = np.where(drift > DRIFT_PERCENT, 1, np.where(drift < -DRIFT_PERCENT, -1, 0))
+
+    # Start index of each run of equal states
+    changes = np.flatnonzero(np.diff(state)) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [len(state)]])
+
+    half_hop = WINDOW_HOP_SECONDS / 2
+
+    def center(window: int) -> float:
+        return window * WINDOW_HOP_SECONDS + WINDOW_SECONDS / 2
+
+    segments = []
+    for start, end in zip(starts, ends):
+        if state[start] == 0:
+            continue
+        segments.append(
+            {
+                "kind": "rushing" if state[start] > 0 else "dragging",
+                # Windows straddle the change, so a run spans its window
+                # centers, give or take half a hop
+                "start_seconds": float(max(0.0, center(start) - half_hop)),
+                "end_seconds": float(center(end - 1) + half_hop),
+                "drift_percent": round(float(np.mean(drift[start:end])), 1),
+            }
+        )
+    return segments
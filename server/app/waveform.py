@@ -0,0 +1,157 @@
+"""
+Waveform peaks for submission and message audio.
+
+The media.waveform job (app.tasks) decodes a video's audio track once and stores
+min/max peaks at a few resolutions next to the video ({derived prefix}waveform.bin),
+so review screens can draw a waveform, and find loud or quiet passages, without
+downloading any audio.
+
+Resolutions are fixed bucket counts across the whole recording rather than fixed
+rates, so a 10-minute take is the same ~11 KB as a 30-second one. Each level has
+a quarter of the buckets of the one before (4096, 1024, 256); clients pick the
+coarsest level with at least as many buckets as pixels.
+
+Binary format, little-endian:
+
+    magic       4s   b"CWF1"
+    sample_rate u32  decode rate in Hz
+    samples     u32  decoded samples in the recording
+    levels      u16
+    per level:  u32 bucket count, u32 samples per bucket
+    per level:  bucket count x (i8 min, i8 max), finest level first
+
+Peaks are signed 8-bit: the top byte of the 16-bit samples.
+"""
+
+import struct
+import sys
+from array import array
+from typing import Iterable
+
+from cachetools import TTLCache
+
+from app import media, storage
+
+MAGIC = b"CWF1"
+CONTENT_TYPE = "application/octet-stream"
+FILENAME = "waveform.bin"
+
+# Plenty for drawing peaks; 8 kHz mono keeps the decode pipe at 16 KB/s
+SAMPLE_RATE = 8000
+FINEST_BUCKETS = 4096
+LEVEL_FACTOR = 4
+LEVELS = 3
+
+
+def samples_per_bucket(duration_seconds: float) -> int:
+    return max(1, -(-round(duration_seconds * SAMPLE_RATE) // FINEST_BUCKETS))
+
+
+def _finest_peaks(chunks: Iterable[bytes], per_bucket: int) -> tuple[array, int]:
+    """Interleaved (min, max) per `per_bucket` samples, and the sample count."""
+    peaks = array("b")
+    pending = array("h")
+    total = 0
+    carry = b""
+    for chunk in chunks:
+        # Pipe reads can split a sample
+        data = carry + chunk
+        even = len(data) - len(data) % 2
+        samples, carry = array("h", data[:even]), data[even:]
+        if sys.byteorder == "big":
+            samples.byteswap()
+        total += len(samples)
+        pending.extend(samples)
+        whole = len(pending) - len(pending) % per_bucket
+        for start in range(0, whole, per_bucket):
+            bucket = pending[start : start + per_bucket]
+            peaks.append(min(bucket) >> 8)
+            peaks.append(max(bucket) >> 8)
+        del pending[:whole]
+    if pending:
+        peaks.append(min(pending) >> 8)
+        peaks.append(max(pending) >> 8)
+    return peaks, total
+
+
+def _coarsen(peaks: array, factor: int) -> array:
+    """Merge every `factor` buckets into one."""
+    coarse = array("b")
+    step = 2 * factor
+    for start in range(0, len(peaks), step):
+        group = peaks[start : start + step]
+        coarse.append(min(group[0::2]))
+        coarse.append(max(group[1::2]))
+    return coarse
+
+
+def compute(chunks: Iterable[bytes], duration_seconds: float) -> bytes | None:
+    """
+    Encode peaks for 16-bit mono PCM at SAMPLE_RATE (as `chunks` of bytes).
+
+    `duration_seconds` only sizes the buckets; the actual sample count is stored.
+    Returns None if there were no samples.
+    """
+    per_bucket = samples_per_bucket(duration_seconds)
+    finest, total = _finest_peaks(chunks, per_bucket)
+    if not total:
+        return None
+
+    levels = [(finest, per_bucket)]
+    for _ in range(LEVELS - 1):
+        peaks, per_bucket = levels[-1]
+        levels.append((_coarsen(peaks, LEVEL_FACTOR), per_bucket * LEVEL_FACTOR))
+
+    header = struct.pack("<4sIIH", MAGIC, SAMPLE_RATE, total, len(levels))
+    header += b"".join(
+        struct.pack("<II", len(peaks) // 2, per_bucket) for peaks, per_bucket in levels
+    )
+    return header + b"".join(peaks.tobytes() for peaks, _ in levels)
+
+
+def decode(data: bytes) -> dict:
+    """Inverse of compute(), for tests and tooling."""
+    _, sample_rate, samples, count = struct.unpack_from("<4sIIH", data)
+    offset = struct.calcsize("<4sIIH")
+    shapes = [struct.unpack_from("<II", data, offset + 8 * i) for i in range(count)]
+    offset += 8 * count
+    levels = []
+    for buckets, per_bucket in shapes:
+        peaks = array("b", data[offset : offset + 2 * buckets])
+        levels.append({"samples_per_bucket": per_bucket, "peaks": peaks})
+        offset += 2 * buckets
+    return {"sample_rate": sample_rate, "samples": samples, "levels": levels}
+
+
+def generate(input_url: str, duration_seconds: float) -> bytes | None:
+    """Decode the audio of `input_url` and compute its peaks, streaming."""
+    return compute(
+        media.stream_ffmpeg(
+            [
+                "-i",
+                input_url,
+                "-map",
+                "0:a:0",
+                "-ac",
+                "1",
+                "-ar",
+                str(SAMPLE_RATE),
+                "-f",
+                "s16le",
+                "pipe:1",
+            ]
+        ),
+        duration_seconds,
+    )
+
+
+# Peaks only change when a re-upload is processed; don't GET them per request
+_peaks_cache: TTLCache[str, bytes] = TTLCache(maxsize=1024, ttl=300)
+
+
+def read_peaks(s3_key: str) -> bytes:
+    data = _peaks_cache.get(s3_key)
+    if data is None:
+        data = b"".join(storage.iter_object(s3_key))
+        _peaks_cache[s3_key] = data
+    return data
@@ -0,0 +1,77 @@
+"""
+Background job worker.
+
+Usage:
+    python -m app.worker            # Run until SIGTERM/SIGINT
+    python -m app.worker --once     # Drain runnable jobs, then exit
+    python -m app.worker --include-media    # Also run media/analysis jobs
+
+Media and analysis jobs are left to app.media_worker by default: they can run
+longer than JOB_LEASE_SECONDS, and only the media worker renews leases, so a
+job run here can be claimed again by another worker while it's still running.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import time
+
+from sqlmodel import Session
+
+from app import jobs, tasks  # noqa: F401 - registers job handlers
+from app.config import settings
+from app.database import engine
+from app.media_worker import MEDIA_JOB_PREFIXES
+from app.migrations import check_schema
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run background jobs")
+    parser.add_argument(
+        "--once", action="store_true", help="Exit when no job is runnable"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=settings.worker_poll_interval,
+        help="Seconds to sleep when the queue is empty",
+    )
+    parser.add_argument(
+        "--include-media",
+        action="store_true",
+        help="Also run media.* and analysis.* jobs, without renewing their leases "
+        "(only for a single-worker setup with no app.media_worker)",
+    )
+    args = parser.parse_args()
+    exclude = None if args.include_media else MEDIA_JOB_PREFIXES
+
+    check_schema(engine)
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    # Finish the job in hand, then exit
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Worker {worker_id} started")
+    with Session(engine) as db:
+        while not stopping:
+            job = jobs.run_next(db, worker_id, exclude=exclude)
+            if job is not None:
+                print(
+                    f"[JOB] {job.kind} {job.id} -> {job.status} (attempt {job.attempts})"
+                )
+                continue
+            if args.once:
+                break
+            time.sleep(args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
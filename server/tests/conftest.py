@@ -4,6 +4,7 @@ from sqlmodel import create_engine, Session, SQLModel
 import jwt
 from unittest.mock import patch, MagicMock
 
+from app import jobs, s3, sigv4
 from app.main import app
 from app.database import get_db
 from app.apple_auth import InvalidTokenError
@@ -30,6 +31,24 @@ def client():
     SQLModel.metadata.drop_all(engine)
 
 
+@pytest.fixture
+def db(client):
+    """Direct database session for arranging state the API cannot create"""
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def probe_uploads(db):
+    """Run queued upload probes, as a worker would after finalize"""
+
+    def _run():
+        while (job := jobs.claim(db, "test-worker", only=("uploads.",))) is not None:
+            jobs.execute(db, job)
+
+    return _run
+
+
 @pytest.fixture
 def apple_token():
     """Factory for creating test Apple ID tokens"""
@@ -86,7 +105,14 @@ def mock_s3():
             "https://example.com/presigned"
         )
 
-        yield mock_client
+        s3._download_url_cache.clear()
+        # Presigning happens in-process; give it fixed credentials instead of
+        # resolving the real AWS credential chain
+        with patch(
+            "app.s3._get_credentials",
+            return_value=sigv4.Credentials("AKIDTEST", "test-secret", None),
+        ):
+            yield mock_client
 
 
 @pytest.fixture(autouse=True)
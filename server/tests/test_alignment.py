@@ -0,0 +1,284 @@
+"""
+Score alignment tests.
+
+These tests verify MusicXML references, banded DTW and the analysis.alignment job:
+- MusicXML measures, tempo, chords and voices become chroma and measure times
+- A partial take at another tempo maps onto the right measures
+- The banded DTW finds the same path as a full one
+- Unrelated audio isn't mapped
+- Attaching a reference re-aligns the piece's submissions
+- Aligned measures answer "every attempt at measures a-b"
+"""
+
+import io
+import json
+import subprocess
+import zipfile
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from sqlmodel import select
+
+from app import alignment, audio, jobs, models, tasks  # noqa: F401
+
+SAMPLE_RATE = audio.ANALYSIS_SAMPLE_RATE
+STEPS = "CDEFGAB"
+SEMITONES = [0, 2, 4, 5, 7, 9, 11]
+
+
+def melody(measures, seed=0):
+    """Four random scale degrees (0-23: two octaves up from C4) per measure"""
+    rng = np.random.default_rng(seed)
+    return [[int(d) for d in rng.integers(0, 24, 4)] for _ in range(measures)]
+
+
+def musicxml(tune, tempo=120):
+    measures = []
+    for number, degrees in enumerate(tune, 1):
+        notes = "".join(
+            f"<note><pitch><step>{STEPS[d % 7]}</step><octave>{4 + d // 7}</octave>"
+            "</pitch><duration>2</duration></note>"
+            for d in degrees
+        )
+        header = (
+            "<attributes><divisions>2</divisions></attributes>"
+            f'<direction><sound tempo="{tempo}"/></direction>'
+            if number == 1
+            else ""
+        )
+        measures.append(f'<measure number="{number}">{header}{notes}</measure>')
+    return (
+        '<?xml version="1.0"?><score-partwise><part-list/>'
+        f'<part id="P1">{"".join(measures)}</part></score-partwise>'
+    ).encode()
+
+
+def play(tune, bpm):
+    """A bowed-ish rendition, one note per beat"""
+    t = np.arange(int(60 / bpm * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = np.minimum(1, t * 50) * np.exp(-t * 2)
+    notes = []
+    for degrees in tune:
+        for d in degrees:
+            hz = 261.63 * 2 ** ((SEMITONES[d % 7] + 12 * (d // 7)) / 12)
+            wave = sum(
+                a * np.sin(2 * np.pi * k * hz * t)
+                for k, a in [(1, 1.0), (2, 0.5), (3, 0.3)]
+            )
+            notes.append(0.3 * envelope * wave)
+    return np.concatenate(notes).astype(np.float32)
+
+
+def test_score_reference():
+    score = b"""<?xml version="1.0"?>
+    <score-partwise><part-list/><part id="P1">
+      <measure number="0">
+        <attributes><divisions>1</divisions></attributes>
+        <direction><sound tempo="60"/></direction>
+        <note><pitch><step>G</step><octave>3</octave></pitch><duration>1</duration></note>
+      </measure>
+      <measure number="1">
+        <note><pitch><step>C</step><octave>4</octave></pitch><duration>2</duration></note>
+        <note><chord/><pitch><step>E</step><octave>4</octave></pitch><duration>2</duration></note>
+        <backup><duration>2</duration></backup>
+        <note><pitch><step>F</step><alter>1</alter><octave>2</octave></pitch><duration>1</duration></note>
+        <note><rest/><duration>1</duration></note>
+      </measure>
+    </part></score-partwise>"""
+
+    reference = alignment.score_reference(score)
+
+    # Pickup measure 0 lasts one beat: a second at 60 quarters per minute
+    assert reference.measure_numbers == [0, 1]
+    assert reference.boundaries.tolist() == [0, 1, 3]
+    first, second = reference.chroma[5], reference.chroma[15]
+    assert np.argmax(first) == 7  # G
+    assert set(np.flatnonzero(second > 0.3)) == {0, 4, 6}  # C, E, F#
+
+
+def test_compressed_musicxml():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr(
+            "META-INF/container.xml",
+            '<container><rootfiles><rootfile full-path="score.xml"/></rootfiles>'
+            "</container>",
+        )
+        archive.writestr("score.xml", musicxml(melody(3)))
+
+    reference = alignment.score_reference(data.getvalue())
+
+    assert reference.measure_numbers == [1, 2, 3]
+
+
+def test_invalid_musicxml():
+    with pytest.raises(alignment.InvalidReference):
+        alignment.score_reference(b"<html></html>")
+
+
+def test_partial_take_maps_to_measures():
+    tune = melody(60)
+    reference = alignment.score_reference(musicxml(tune, tempo=120))
+
+    # Measures 20-40, played slower than marked (4 beats = 2.4 s each)
+    result = alignment.analyze(play(tune[19:40], bpm=100), SAMPLE_RATE, reference)
+
+    assert result["summary"]["first_measure"] == 20
+    assert result["summary"]["last_measure"] == 40
+    spans = result["spans"]
+    assert [span["measure"] for span in spans] == list(range(20, 41))
+    for offset, span in enumerate(spans[1:], 1):
+        assert span["start_seconds"] == pytest.approx(2.4 * offset, abs=0.3)
+    positions = result["measure"]["positions"]
+    assert positions[0] == pytest.approx(20, abs=0.2)
+    assert positions[len(positions) // 2] == pytest.approx(30.5, abs=0.5)
+    json.dumps(result)
+
+
+def test_banded_dtw_matches_full():
+    tune = melody(30, seed=1)
+    reference = alignment.score_reference(musicxml(tune))
+    query = alignment.chroma(play(tune[5:25], bpm=90), SAMPLE_RATE)
+    n, m = len(query), len(reference.chroma)
+
+    banded = alignment.align(query, reference.chroma)
+    full = alignment.dtw(query, reference.chroma, np.zeros(n, dtype=int), np.full(n, m))
+
+    assert np.array_equal(banded[0], full[0])
+    assert np.abs(banded[1] - full[1]).max() <= 1
+
+
+def test_unrelated_audio_is_not_mapped():
+    reference = alignment.score_reference(musicxml(melody(20)))
+    noise = np.random.default_rng(0).normal(0, 0.1, 20 * SAMPLE_RATE)
+
+    result = alignment.analyze(noise.astype(np.float32), SAMPLE_RATE, reference)
+
+    assert result["summary"]["first_measure"] is None
+    assert result["spans"] == []
+
+
+# MARK: - API
+
+
+def probe_result():
+    output = {
+        "format": {"duration": "30.0"},
+        "streams": [{"codec_type": "audio", "codec_name": "aac"}],
+    }
+    return subprocess.CompletedProcess([], 0, json.dumps(output), "")
+
+
+@pytest.fixture
+def submitted(authenticated_client, mock_s3, db, probe_uploads):
+    """A piece and a finalized submission of it, with no jobs queued"""
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers=headers,
+    ).json()
+    submission = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 30},
+        headers=headers,
+    ).json()["submission"]
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+    with patch("app.media.subprocess.run", return_value=probe_result()):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+    for job in db.exec(select(models.Job)).all():
+        db.delete(job)
+    db.commit()
+    return client, headers, piece, submission
+
+
+def test_alignment_skipped_without_reference(submitted, db):
+    _, _, _, submission = submitted
+    jobs.enqueue(
+        db,
+        "analysis.alignment",
+        {"resource": "video_submission", "id": submission["id"]},
+    )
+    db.commit()
+
+    job = jobs.run_next(db, "test-worker")
+
+    assert job.result == {"skipped": "no reference"}
+
+
+def test_reference_validation(submitted):
+    client, headers, piece, _ = submitted
+
+    invalid = client.put(
+        f"/pieces/{piece['id']}/reference",
+        files={"reference_file": ("score.musicxml", b"<nope", "application/xml")},
+        headers=headers,
+    )
+    no_times = client.put(
+        f"/pieces/{piece['id']}/reference",
+        files={"reference_file": ("take.m4a", b"audio", "audio/mp4")},
+        headers=headers,
+    )
+    decreasing = client.put(
+        f"/pieces/{piece['id']}/reference",
+        files={"reference_file": ("take.m4a", b"audio", "audio/mp4")},
+        data={"measure_times": "[0, 2.5, 2.0]"},
+        headers=headers,
+    )
+
+    assert invalid.status_code == 422
+    assert no_times.status_code == 422
+    assert decreasing.status_code == 422
+
+
+def test_reference_aligns_submissions(submitted, mock_s3, db):
+    client, headers, piece, submission = submitted
+    alignment._reference_cache.clear()
+    tune = melody(16)
+    score = musicxml(tune, tempo=120)
+
+    response = client.put(
+        f"/pieces/{piece['id']}/reference",
+        files={"reference_file": ("etude.musicxml", score, "application/xml")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["reference_kind"] == "musicxml"
+    [job] = db.exec(select(models.Job)).all()
+    assert job.kind == "analysis.alignment"
+
+    # Measures 3-12 at 96 bpm: 2.5 s per measure
+    decoder = MagicMock()
+    decoder.stdout = io.BytesIO(play(tune[2:12], bpm=96).astype("<f4").tobytes())
+    decoder.wait.return_value = 0
+    decoder.poll.return_value = 0
+    mock_s3.get_object.return_value["Body"].iter_chunks.return_value = [score]
+    with (
+        patch("app.media.subprocess.run", return_value=probe_result()),
+        patch("app.media.subprocess.Popen", return_value=decoder),
+    ):
+        job = jobs.run_next(db, "test-worker")
+    assert job.status == "succeeded"
+    assert (job.result["first_measure"], job.result["last_measure"]) == (3, 12)
+
+    attempts = client.get(
+        f"/pieces/{piece['id']}/attempts",
+        params={"start_measure": 5, "end_measure": 7},
+        headers=headers,
+    ).json()
+    [attempt] = attempts
+    assert attempt["submission_id"] == submission["id"]
+    assert (attempt["first_measure"], attempt["last_measure"]) == (5, 7)
+    assert attempt["start_seconds"] == pytest.approx(5.0, abs=0.3)
+    assert attempt["end_seconds"] == pytest.approx(12.5, abs=0.3)
+
+    elsewhere = client.get(
+        f"/pieces/{piece['id']}/attempts",
+        params={"start_measure": 14, "end_measure": 16},
+        headers=headers,
+    ).json()
+    assert elsewhere == []
@@ -0,0 +1,147 @@
+"""
+CDN delivery tests.
+
+These tests verify DOWNLOAD_DELIVERY=cdn, mostly with the local stand-in signer:
+- Download URLs point at the CDN and carry a valid canned-policy signature
+- Changed paths and expired URLs fail verification
+- Content-addressed PDFs get day-long URLs and immutable Cache-Control
+- URLs are reused, so repeat requests hit client and edge caches
+- Server-side reads (upload probing) still go to the origin
+- A configured CloudFront key signs with RSA-SHA1
+"""
+
+import io
+from unittest.mock import patch
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+import pytest
+
+from app import cdn, storage
+from app.config import settings
+
+PDF_CONTENT = b"%PDF-1.4 Suzuki Violin School, Volume 1"
+CDN_BASE_URL = "https://cdn.example.com"
+
+
+@pytest.fixture(autouse=True)
+def cdn_delivery():
+    cdn._signed_url_cache.clear()
+    with (
+        patch.object(settings, "download_delivery", "cdn"),
+        patch.object(settings, "cdn_base_url", CDN_BASE_URL),
+    ):
+        yield
+
+
+def create_piece(client, token):
+    response = client.post(
+        "/pieces",
+        data={"title": "Suzuki 1"},
+        files={"pdf_file": ("suzuki.pdf", io.BytesIO(PDF_CONTENT), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()
+
+
+def test_piece_download_url_is_cdn_signed(authenticated_client, mock_s3):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    piece = create_piece(client, token)
+
+    response = client.get(
+        f"/pieces/{piece['id']}/download-url",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    url = response.json()["download_url"]
+    assert url.startswith(f"{CDN_BASE_URL}/{piece['s3_key']}?Expires=")
+    assert cdn.verify_url(url)
+    assert response.json()["expires_in"] > cdn.IMMUTABLE_URL_REFRESH_MARGIN_SECONDS
+    assert mock_s3.put_object.call_args.kwargs["CacheControl"] == (
+        storage.IMMUTABLE_CACHE_CONTROL
+    )
+
+
+def test_tampered_and_expired_urls_fail_verification():
+    url = storage.generate_download_url("dev/cadenza/videos/1/a.mp4")["url"]
+    expires_at = int(
+        dict(p.split("=") for p in urlsplit(url).query.split("&"))["Expires"]
+    )
+
+    assert cdn.verify_url(url)
+    assert not cdn.verify_url(url.replace("/1/a.mp4", "/2/a.mp4"))
+    assert not cdn.verify_url(url.replace("Expires=", "Expires=1"))
+    assert not cdn.verify_url(url, now=expires_at)
+
+
+def test_immutable_objects_get_longer_urls():
+    hour = cdn.DOWNLOAD_URL_BUCKET_SECONDS
+    day = cdn.IMMUTABLE_URL_BUCKET_SECONDS
+    start = 1_700_000_000 // day * day
+    blob_key = storage.get_pdf_blob_s3_key("0" * 64)
+
+    with patch("time.time", return_value=start + 60):
+        urls = storage.generate_download_urls([blob_key, "dev/cadenza/videos/1/a.mp4"])
+
+    assert urls[blob_key]["expires_in"] == day - 60
+    assert urls["dev/cadenza/videos/1/a.mp4"]["expires_in"] == hour - 60
+
+
+def test_urls_are_reused_within_a_bucket():
+    hour = cdn.DOWNLOAD_URL_BUCKET_SECONDS
+    start = 1_700_000_000 // hour * hour
+
+    with patch("time.time", return_value=start + 100):
+        first = storage.generate_download_url("dev/cadenza/videos/1/a.mp4")
+    cdn._signed_url_cache.clear()
+    with patch("time.time", return_value=start + 2000):
+        second = storage.generate_download_url("dev/cadenza/videos/1/a.mp4")
+
+    assert second["url"] == first["url"]
+
+
+def test_blob_uploads_are_marked_immutable(authenticated_client, mock_s3):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece = {"piece_id": str(uuid4()), "filename": "a.pdf", "sha256": "0" * 64}
+    client.post("/pieces/upload-url", json=piece, headers=headers)
+    mock_s3.head_object.return_value = {"ContentLength": 10, "ETag": '"abc"'}
+
+    client.post(
+        "/pieces/finalize",
+        json={
+            "id": piece["piece_id"],
+            "title": "A",
+            "pdf_filename": "a.pdf",
+            "sha256": piece["sha256"],
+        },
+        headers=headers,
+    )
+
+    assert mock_s3.copy_object.call_args.kwargs["CacheControl"] == (
+        storage.IMMUTABLE_CACHE_CONTROL
+    )
+
+
+def test_upload_probing_reads_from_origin():
+    url = storage.generate_download_url("dev/cadenza/videos/1/a.mp4", origin=True)
+
+    assert url["url"].startswith(f"https://{settings.s3_bucket}.s3.amazonaws.com/")
+
+
+def test_rsa_signer_signs_with_the_private_key():
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+    signature = cdn._rsa_signer(pem)(b"policy")
+
+    # Raises unless CloudFront's RSA-SHA1 check would pass
+    key.public_key().verify(signature, b"policy", padding.PKCS1v15(), hashes.SHA1())
@@ -0,0 +1,142 @@
+"""
+Batch download URL tests.
+
+These tests verify POST /download-urls:
+- Pieces, submissions and message videos can be signed in one request
+- Teachers can sign their students' media
+- Resources the caller cannot see are reported as unavailable
+"""
+
+import io
+
+
+def create_piece(client, token, title, filename="test.pdf"):
+    pdf_content = b"%PDF-1.4 fake pdf content"
+    pdf_file = io.BytesIO(pdf_content)
+
+    response = client.post(
+        "/pieces",
+        data={"title": title},
+        files={"pdf_file": (filename, pdf_file, "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response
+
+
+def create_video_submission(client, token, piece_id):
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece_id, "duration_seconds": 30},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response
+
+
+def setup_student_submission(authenticated_client):
+    client, teacher_data = authenticated_client(
+        user_id="teacher_1", email="teacher@example.com"
+    )
+    _, student_data = authenticated_client(
+        user_id="student_1", email="student@example.com"
+    )
+    student_token = student_data["access_token"]
+
+    client.post(
+        "/users/set-teacher",
+        params={"teacher_email": "teacher@example.com"},
+        headers={"Authorization": f"Bearer {student_token}"},
+    )
+
+    piece = create_piece(client, student_token, "Etude").json()
+    submission = create_video_submission(client, student_token, piece["id"]).json()
+    message = client.post(
+        f"/video-submissions/{submission['submission']['id']}/messages",
+        json={"include_video": True, "video_duration_seconds": 12},
+        headers={"Authorization": f"Bearer {teacher_data['access_token']}"},
+    ).json()
+
+    return (
+        client,
+        teacher_data["access_token"],
+        student_token,
+        piece,
+        submission["submission"],
+        message["message"],
+    )
+
+
+def test_batch_signs_mixed_resources(authenticated_client):
+    client, _, student_token, piece, submission, message = setup_student_submission(
+        authenticated_client
+    )
+
+    response = client.post(
+        "/download-urls",
+        json={
+            "resources": [
+                {"type": "piece", "id": piece["id"]},
+                {"type": "video_submission", "id": submission["id"]},
+                {"type": "message", "id": message["id"]},
+            ]
+        },
+        headers={"Authorization": f"Bearer {student_token}"},
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [(u["type"], u["id"]) for u in data["urls"]] == [
+        ("piece", piece["id"]),
+        ("video_submission", submission["id"]),
+        ("message", message["id"]),
+    ]
+    assert data["urls"][0]["thumbnail_url"] is None
+    assert data["urls"][1]["thumbnail_url"] is not None
+    assert data["unavailable"] == []
+
+
+def test_batch_reports_unauthorized_resources(authenticated_client):
+    client, teacher_token, _, piece, submission, message = setup_student_submission(
+        authenticated_client
+    )
+    _, stranger_data = authenticated_client(
+        user_id="stranger", email="stranger@example.com"
+    )
+
+    resources = [
+        {"type": "piece", "id": piece["id"]},
+        {"type": "video_submission", "id": submission["id"]},
+        {"type": "message", "id": message["id"]},
+    ]
+
+    teacher_response = client.post(
+        "/download-urls",
+        json={"resources": resources},
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    ).json()
+    # Teachers review student media but do not own the student's pieces
+    assert [u["type"] for u in teacher_response["urls"]] == [
+        "video_submission",
+        "message",
+    ]
+    assert teacher_response["unavailable"] == [resources[0]]
+
+    stranger_response = client.post(
+        "/download-urls",
+        json={"resources": resources},
+        headers={"Authorization": f"Bearer {stranger_data['access_token']}"},
+    ).json()
+    assert stranger_response["urls"] == []
+    assert stranger_response["unavailable"] == resources
+
+
+def test_batch_size_is_limited(authenticated_client):
+    client, user_data = authenticated_client(email="student@example.com")
+    piece = create_piece(client, user_data["access_token"], "Etude").json()
+
+    response = client.post(
+        "/download-urls",
+        json={"resources": [{"type": "piece", "id": piece["id"]}] * 201},
+        headers={"Authorization": f"Bearer {user_data['access_token']}"},
+    )
+
+    assert response.status_code == 422
@@ -0,0 +1,222 @@
+"""
+HLS transcoding and playback tests.
+
+These tests verify adaptive-bitrate delivery of submission and message videos:
+- Finalizing a readable upload queues the HLS transcode
+- The transcode job uploads the ladder under the video's derived prefix
+- The ladder never upscales and leads with a small rendition
+- Video URL responses carry a playlist URL once transcoded
+- Media playlists are served with signed segment URLs; bad tokens are rejected
+- Storage GC keeps derived objects of live videos
+"""
+
+import io
+import json
+import subprocess
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import urlsplit
+from uuid import UUID
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlmodel import select
+
+from app import hls, jobs, media, models, storage, tasks  # noqa: F401
+from app.storage_gc import collect_garbage
+
+MASTER = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1096000\n480p/index.m3u8\n"
+MEDIA = "#EXTM3U\n#EXTINF:2.0,\nseg_000.ts\n#EXTINF:4.0,\nseg_001.ts\n#EXT-X-ENDLIST\n"
+
+
+def create_submission(client, token):
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 60},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()["submission"]
+
+
+def fake_media_tools(args, **kwargs):
+    """ffprobe reports a 720p video; ffmpeg writes a playlist per rendition"""
+    if "-show_streams" in args:
+        output = {
+            "format": {"duration": "61.4"},
+            "streams": [
+                {"codec_type": "video", "codec_name": "h264", "height": 720},
+                {"codec_type": "audio", "codec_name": "aac"},
+            ],
+        }
+        return subprocess.CompletedProcess(args, 0, json.dumps(output), "")
+
+    if "-var_stream_map" not in args:
+        # Preview images
+        Path(args[-1]).write_bytes(b"\xff\xd8\xff")
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+    out_dir = Path(args[-1]).parent.parent
+    names = [
+        entry.split("name:")[1]
+        for entry in args[args.index("-var_stream_map") + 1].split(" ")
+    ]
+    for name in names:
+        (out_dir / name).mkdir()
+        (out_dir / name / hls.MEDIA_PLAYLIST).write_text(MEDIA)
+        (out_dir / name / "seg_000.ts").write_bytes(b"\x47" * 188)
+    (out_dir / hls.MASTER_PLAYLIST).write_text(MASTER)
+    return subprocess.CompletedProcess(args, 0, "", "")
+
+
+@pytest.fixture
+def finalized(authenticated_client, mock_s3, db, probe_uploads):
+    """A student's finalized submission with its queued jobs"""
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    submission = create_submission(client, user_data["access_token"])
+    for job in db.exec(select(models.Job)).all():  # The piece's PDF previews
+        db.delete(job)
+    db.commit()
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+
+    return client, headers, submission
+
+
+def run_pipeline(db):
+    """Run the finalized video's jobs; returns the HLS transcode"""
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools):
+        ran = [jobs.run_next(db, "test-worker") for _ in tasks.VIDEO_PIPELINE]
+    return next(job for job in ran if job.kind == "media.transcode_hls")
+
+
+def test_finalize_queues_transcode(finalized, db):
+    _, _, submission = finalized
+
+    probe, *queued = db.exec(select(models.Job)).all()
+
+    assert probe.kind == "uploads.probe_video"
+    assert [job.kind for job in queued] == (
+        tasks.VIDEO_PIPELINE + tasks.SUBMISSION_ANALYSES
+    )
+    assert "media.transcode_hls" in tasks.VIDEO_PIPELINE
+    assert queued[0].payload == {
+        "resource": "video_submission",
+        "id": submission["id"],
+    }
+
+
+def test_transcode_uploads_ladder(finalized, mock_s3, db):
+    _, _, submission = finalized
+
+    job = run_pipeline(db)
+
+    assert job.status == "succeeded"
+    assert job.result == {"renditions": ["480p", "240p", "720p", "audio"]}
+    prefix = submission["s3_key"].removesuffix(".mp4") + "/hls/"
+    uploaded = [call.kwargs["Key"] for call in mock_s3.put_object.call_args_list]
+    hls_keys = [key for key in uploaded if key.startswith(prefix)]
+    assert len(hls_keys) == 9
+    assert hls_keys[-1] == f"{prefix}{hls.MASTER_PLAYLIST}"
+    db.expire_all()
+    record = db.get(models.VideoSubmission, UUID(submission["id"]))
+    assert record.hls_master_s3_key == f"{prefix}{hls.MASTER_PLAYLIST}"
+    assert record.hls_renditions[0]["name"] == "480p"
+
+
+def test_ladder_does_not_upscale():
+    info = media.MediaInfo(
+        duration_seconds=10, width=640, height=360, video_codec="h264", audio_codec=None
+    )
+
+    assert [r.name for r in hls.select_ladder(info)] == ["240p"]
+
+
+def test_playlist_url_serves_signed_segments(finalized, mock_s3, db):
+    client, headers, submission = finalized
+    run_pipeline(db)
+
+    response = client.get(
+        f"/video-submissions/{submission['id']}/video-url", headers=headers
+    )
+    playlist_url = response.json()["playlist_url"]
+    assert playlist_url.endswith(f"/{hls.MASTER_PLAYLIST}")
+
+    hls._playlist_cache.clear()
+    mock_s3.get_object.return_value["Body"].iter_chunks.side_effect = [
+        [MASTER.encode()],
+        [MEDIA.encode()],
+    ]
+    path = urlsplit(playlist_url).path
+    master = client.get(path)
+    rendition = client.get(path.replace(hls.MASTER_PLAYLIST, "480p/index.m3u8"))
+
+    assert master.status_code == 200
+    assert master.text == MASTER
+    assert master.headers["content-type"] == hls.PLAYLIST_CONTENT_TYPE
+    segments = [line for line in rendition.text.splitlines() if line[0] != "#"]
+    assert len(segments) == 2
+    assert all(segment.startswith("https://") for segment in segments)
+    assert "/hls/480p/seg_000.ts" in segments[0]
+
+
+def test_missing_playlist_is_not_found(finalized, mock_s3, db):
+    client, headers, submission = finalized
+    run_pipeline(db)
+    playlist_url = client.get(
+        f"/video-submissions/{submission['id']}/video-url", headers=headers
+    ).json()["playlist_url"]
+    hls._playlist_cache.clear()
+    path = urlsplit(playlist_url).path
+
+    mock_s3.get_object.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+    )
+    assert client.get(path).status_code == 404
+
+    # Anything else is a server error, not a missing playlist
+    mock_s3.get_object.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied"}}, "GetObject"
+    )
+    with pytest.raises(Exception, match="AccessDenied"):
+        client.get(path)
+
+
+def test_bad_token_is_rejected(client):
+    response = client.get(f"/hls/not-a-token/{hls.MASTER_PLAYLIST}")
+
+    assert response.status_code == 403
+
+
+def test_gc_keeps_derived_objects(finalized, mock_s3, db):
+    _, _, submission = finalized
+    prefix = submission["s3_key"].removesuffix(".mp4")
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    keys = [
+        submission["s3_key"],
+        f"{prefix}/hls/480p/seg_000.ts",
+        f"{prefix}0/hls/480p/seg_000.ts",
+    ]
+    mock_s3.get_paginator.return_value.paginate.side_effect = lambda Bucket, Prefix: [
+        {
+            "Contents": [
+                {"Key": key, "Size": 1, "LastModified": old}
+                for key in keys
+                if key.startswith(Prefix)
+            ]
+        }
+    ]
+
+    report = collect_garbage(db, dry_run=True)
+
+    assert report.orphans == [f"{prefix}0/hls/480p/seg_000.ts"]
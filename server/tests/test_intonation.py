@@ -0,0 +1,139 @@
+"""
+Intonation analysis tests.
+
+These tests verify the batched YIN pitch track and the analysis.intonation job:
+- Pitches across the string range are tracked within a couple of cents
+- Silence is unvoiced
+- Deviations are per second and relative to the player's tuning
+- Ten minutes of audio analyse in seconds
+- The job stores its result where /analyses returns it
+"""
+
+import io
+import json
+import subprocess
+import time
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from sqlmodel import select
+
+from app import audio, intonation, jobs, models, tasks  # noqa: F401
+
+SAMPLE_RATE = audio.ANALYSIS_SAMPLE_RATE
+
+
+def tone(hz, seconds, amplitude=0.3):
+    """A bowed-ish tone: fundamental plus a weaker octave"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    wave = np.sin(2 * np.pi * hz * t) + 0.3 * np.sin(4 * np.pi * hz * t)
+    return (amplitude * wave).astype(np.float32)
+
+
+def cents(hz, reference):
+    return 1200 * np.log2(hz / reference)
+
+
+@pytest.mark.parametrize("hz", [65.4, 196.0, 440.0, 1318.5])
+def test_pitch_track_is_accurate(hz):
+    f0 = intonation.pitch_track(tone(hz, 1.0), SAMPLE_RATE)
+
+    assert abs(cents(np.nanmedian(f0), hz)) < 2
+    assert np.mean(np.isnan(f0)) < 0.1
+
+
+def test_silence_is_unvoiced():
+    f0 = intonation.pitch_track(np.zeros(SAMPLE_RATE, np.float32), SAMPLE_RATE)
+
+    assert np.isnan(f0).all()
+
+
+def test_deviation_is_relative_to_players_tuning():
+    # Tuned to A=443 (~12 cents sharp); the second second is 30 cents sharper
+    a = 443.0
+    samples = np.concatenate(
+        [
+            tone(a, 1.0),
+            tone(a * 2 ** (30 / 1200), 1.0),
+            tone(a * 2 ** (2 / 12), 1.0),
+            tone(a * 2 ** (3 / 12), 1.0),
+            np.zeros(SAMPLE_RATE, np.float32),
+        ]
+    )
+
+    result = intonation.analyze(samples, SAMPLE_RATE)
+
+    assert result["summary"]["tuning_offset_cents"] == pytest.approx(11.8, abs=1)
+    mean = result["per_second"]["mean_cents"]
+    assert len(mean) == 5
+    assert abs(mean[0]) < 3
+    assert mean[1] == pytest.approx(30, abs=5)
+    assert mean[4] is None
+    assert sum(result["histogram"]["counts"]) > 3 * 45
+
+
+def test_ten_minutes_analyse_in_seconds():
+    rng = np.random.default_rng(0)
+    samples = np.tile(tone(220.0, 10.0), 60)
+    samples += rng.normal(0, 0.01, samples.size).astype(np.float32)
+
+    start = time.perf_counter()
+    result = intonation.analyze(samples, SAMPLE_RATE)
+
+    assert time.perf_counter() - start < 10
+    assert len(result["per_second"]["mean_cents"]) == 600
+
+
+def test_job_stores_analysis(authenticated_client, mock_s3, db, probe_uploads):
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers=headers,
+    ).json()
+    submission = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 2},
+        headers=headers,
+    ).json()["submission"]
+    probe = subprocess.CompletedProcess(
+        [],
+        0,
+        json.dumps(
+            {
+                "format": {"duration": "2.0"},
+                "streams": [{"codec_type": "audio", "codec_name": "aac"}],
+            }
+        ),
+        "",
+    )
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+    with patch("app.media.subprocess.run", return_value=probe):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+    for job in db.exec(select(models.Job)).all():
+        if job.kind != "analysis.intonation":
+            db.delete(job)
+    db.commit()
+
+    decoder = MagicMock()
+    decoder.stdout = io.BytesIO(tone(440.0, 2.0).astype("<f4").tobytes())
+    decoder.wait.return_value = 0
+    decoder.poll.return_value = 0
+    with (
+        patch("app.media.subprocess.run", return_value=probe),
+        patch("app.media.subprocess.Popen", return_value=decoder),
+    ):
+        job = jobs.run_next(db, "test-worker")
+
+    assert job.status == "succeeded"
+    assert job.result["voiced_seconds"] > 1.5
+    analyses = client.get(
+        f"/video-submissions/{submission['id']}/analyses", headers=headers
+    ).json()
+    assert [a["kind"] for a in analyses] == ["intonation"]
+    assert analyses[0]["version"] == intonation.VERSION
+    assert len(analyses[0]["result"]["per_second"]["mean_cents"]) == 2
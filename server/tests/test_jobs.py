@@ -0,0 +1,228 @@
+"""
+Background job queue tests.
+
+These tests verify the job lifecycle on the same interface workers use:
+- Endpoints enqueue work and return immediately; /jobs/{id} reports progress
+- Failed jobs are retried with backoff, then marked failed
+- Jobs whose worker died are handed out again after their lease expires,
+  until they run out of attempts
+- A worker whose lease expired mid-run doesn't overwrite the new holder's job
+- Bundled-PDF copies and S3 deletions run as jobs
+"""
+
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from sqlmodel import select
+
+from app import jobs, models, tasks  # noqa: F401 - registers job handlers
+
+attempts_seen = []
+
+
+@jobs.job_handler("test.flaky")
+def flaky(db, payload):
+    attempts_seen.append(payload["n"])
+    if len(attempts_seen) < payload["fail_times"] + 1:
+        raise RuntimeError("transient failure")
+    return {"ok": True}
+
+
+@jobs.job_handler("test.outlives_lease")
+def outlives_lease(db, payload):
+    # Runs past its lease, and another worker claims the job meanwhile
+    job = db.exec(
+        select(models.Job).where(models.Job.kind == "test.outlives_lease")
+    ).one()
+    job.locked_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    db.add(job)
+    db.commit()
+    jobs.claim(db, "other-worker")
+    return {"ok": True}
+
+
+def make_runnable(db, job):
+    db.refresh(job)
+    job.run_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.add(job)
+    db.commit()
+
+
+def test_bundled_piece_is_created_by_job(authenticated_client, mock_s3, db):
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    mock_s3.head_object.return_value = {"ETag": '"bundle-v1"', "ContentLength": 9}
+    mock_s3.get_object.return_value["Body"].iter_chunks.return_value = [b"%PDF-1.4 "]
+    piece_id = str(uuid4())
+
+    response = client.post(
+        "/pieces/from-bundle",
+        json={
+            "piece_id": piece_id,
+            "title": "Twinkle Variations",
+            "source_filename": "twinkle.pdf",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert client.get("/pieces", headers=headers).json() == []
+
+    job = jobs.run_next(db, "test-worker")
+
+    assert job.status == "succeeded"
+    status = client.get(f"/jobs/{response.json()['id']}", headers=headers).json()
+    assert status["status"] == "succeeded"
+    assert status["result"] == {"piece_id": piece_id}
+    pieces = client.get("/pieces", headers=headers).json()
+    assert [p["title"] for p in pieces] == ["Twinkle Variations"]
+
+
+def test_bundled_filename_cannot_escape_bundle(authenticated_client):
+    client, user_data = authenticated_client(email="student@example.com")
+
+    response = client.post(
+        "/pieces/from-bundle",
+        json={
+            "piece_id": str(uuid4()),
+            "title": "Secrets",
+            "source_filename": "../../cadenza/pieces/other.pdf",
+        },
+        headers={"Authorization": f"Bearer {user_data['access_token']}"},
+    )
+
+    assert response.status_code == 422
+
+
+def test_failed_job_is_retried_with_backoff(client, db):
+    attempts_seen.clear()
+    job = jobs.enqueue(db, "test.flaky", {"n": 1, "fail_times": 1})
+    db.commit()
+
+    failed = jobs.run_next(db, "test-worker")
+    assert failed.status == "queued"
+    assert failed.attempts == 1
+    assert "transient failure" in failed.last_error
+    assert failed.run_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    # Not runnable until the backoff passes
+    assert jobs.run_next(db, "test-worker") is None
+
+    make_runnable(db, job)
+    succeeded = jobs.run_next(db, "test-worker")
+
+    assert succeeded.status == "succeeded"
+    assert succeeded.attempts == 2
+    assert succeeded.result == {"ok": True}
+
+
+def test_job_fails_after_max_attempts(client, db):
+    attempts_seen.clear()
+    job = jobs.enqueue(db, "test.flaky", {"n": 1, "fail_times": 5}, max_attempts=2)
+    db.commit()
+
+    jobs.run_next(db, "test-worker")
+    make_runnable(db, job)
+    failed = jobs.run_next(db, "test-worker")
+
+    assert failed.status == "failed"
+    assert failed.attempts == 2
+    assert failed.finished_at is not None
+
+
+def test_backoff_grows_and_is_capped():
+    assert jobs.retry_delay(1) <= timedelta(seconds=10)
+    assert jobs.retry_delay(4) >= timedelta(seconds=40)
+    assert jobs.retry_delay(30) <= timedelta(hours=1)
+
+
+def test_abandoned_job_is_reclaimed_after_lease(client, db):
+    attempts_seen.clear()
+    job = jobs.enqueue(db, "test.flaky", {"n": 1, "fail_times": 0})
+    db.commit()
+    claimed = jobs.claim(db, "worker-that-dies")
+    assert claimed.id == job.id
+    assert jobs.claim(db, "other-worker") is None
+
+    claimed.locked_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    db.add(claimed)
+    db.commit()
+
+    reclaimed = jobs.run_next(db, "other-worker")
+    assert reclaimed.id == job.id
+    assert reclaimed.status == "succeeded"
+    assert reclaimed.attempts == 2
+
+
+def test_outcome_is_not_recorded_after_lease_is_lost(client, db):
+    jobs.enqueue(db, "test.outlives_lease", {})
+    db.commit()
+
+    job = jobs.run_next(db, "slow-worker")
+
+    assert job.status == "running"
+    assert job.locked_by == "other-worker"
+    assert job.attempts == 2
+    assert job.result is None
+
+
+def test_job_that_keeps_killing_its_worker_fails(client, db):
+    job = jobs.enqueue(db, "test.flaky", {"n": 1, "fail_times": 0}, max_attempts=2)
+    db.commit()
+    for _ in range(2):
+        claimed = jobs.claim(db, "worker-that-dies")
+        assert claimed.id == job.id
+        claimed.locked_at = datetime.now(timezone.utc) - timedelta(hours=1)
+        db.add(claimed)
+        db.commit()
+
+    assert jobs.claim(db, "other-worker") is None
+    db.refresh(job)
+    assert job.status == "failed"
+    assert job.attempts == 2
+    assert "expired" in job.last_error
+
+
+def test_deleting_legacy_piece_enqueues_s3_deletion(authenticated_client, mock_s3, db):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece_id = str(uuid4())
+    client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "old.pdf"},
+        headers=headers,
+    )
+    piece = client.post(
+        "/pieces/finalize",
+        json={"id": piece_id, "title": "Old", "pdf_filename": "old.pdf"},
+        headers=headers,
+    ).json()
+    mock_s3.delete_objects.return_value = {}
+
+    client.delete(f"/pieces/{piece_id}", headers=headers)
+    mock_s3.delete_objects.assert_not_called()
+    job = jobs.run_next(db, "test-worker", exclude=("media.",))
+
+    assert job.kind == "storage.delete_objects"
+    assert job.status == "succeeded"
+    deleted = mock_s3.delete_objects.call_args.kwargs["Delete"]["Objects"]
+    assert deleted == [{"Key": piece["s3_key"]}]
+
+
+def test_only_creator_can_view_job(authenticated_client, db):
+    client, owner_data = authenticated_client(user_id="owner", email="o@example.com")
+    _, other_data = authenticated_client(user_id="other", email="x@example.com")
+    job = jobs.enqueue(
+        db,
+        "test.flaky",
+        {"n": 1, "fail_times": 0},
+        created_by_id=owner_data["user"]["id"],
+    )
+    db.commit()
+
+    response = client.get(
+        f"/jobs/{job.id}",
+        headers={"Authorization": f"Bearer {other_data['access_token']}"},
+    )
+
+    assert response.status_code == 403
+    assert db.get(models.Job, job.id).status == "queued"
@@ -0,0 +1,202 @@
+"""
+Local-disk storage backend tests.
+
+These tests verify that STORAGE_BACKEND=local serves the same upload/download flow
+clients use against S3:
+- Server-side uploads land on disk and download through signed /storage URLs
+- Downloads honor Range requests (206) and reject unsatisfiable ranges (416)
+- Expired, tampered or missing signatures are rejected
+- Presigned PUTs enforce their signed headers, including the SHA-256 checksum
+- Multipart uploads assemble parts in order
+- Keys can't escape the storage directory
+"""
+
+import base64
+import hashlib
+import io
+import time
+from unittest.mock import patch
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+import pytest
+
+from app import local_storage, storage
+from app.config import settings
+
+PDF_CONTENT = b"%PDF-1.4 " + bytes(range(256)) * 16
+
+
+@pytest.fixture(autouse=True)
+def local_backend(tmp_path):
+    with (
+        patch.object(settings, "storage_backend", "local"),
+        patch.object(settings, "local_storage_path", str(tmp_path)),
+        patch.object(settings, "local_storage_base_url", "http://testserver"),
+    ):
+        yield tmp_path
+
+
+def path_of(url):
+    """TestClient-relative path and query of a presigned URL"""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}"
+
+
+def create_piece(client, token, content=PDF_CONTENT):
+    response = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(content), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()
+
+
+def test_uploaded_piece_downloads_from_disk(
+    authenticated_client, mock_s3, local_backend
+):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    piece = create_piece(client, token)
+
+    assert (local_backend / piece["s3_key"]).read_bytes() == PDF_CONTENT
+    mock_s3.put_object.assert_not_called()
+
+    download = client.get(
+        f"/pieces/{piece['id']}/download-url",
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.get(path_of(download["download_url"]))
+
+    assert response.status_code == 200
+    assert response.content == PDF_CONTENT
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_range_requests(client, local_backend):
+    storage.upload_fileobj("dev/range.pdf", io.BytesIO(PDF_CONTENT))
+    url = path_of(storage.generate_download_url("dev/range.pdf")["url"])
+    size = len(PDF_CONTENT)
+
+    middle = client.get(url, headers={"Range": "bytes=10-19"})
+    suffix = client.get(url, headers={"Range": "bytes=-5"})
+    open_ended = client.get(url, headers={"Range": f"bytes={size - 3}-"})
+    too_far = client.get(url, headers={"Range": f"bytes={size}-"})
+
+    assert middle.status_code == 206
+    assert middle.content == PDF_CONTENT[10:20]
+    assert middle.headers["content-range"] == f"bytes 10-19/{size}"
+    assert suffix.content == PDF_CONTENT[-5:]
+    assert open_ended.content == PDF_CONTENT[-3:]
+    assert too_far.status_code == 416
+    assert too_far.headers["content-range"] == f"bytes */{size}"
+
+
+def test_download_urls_are_stable_within_the_hour(local_backend):
+    first = storage.generate_download_url("dev/a.pdf")
+    second = storage.generate_download_url("dev/a.pdf")
+
+    assert first["url"] == second["url"]
+    assert first["expires_in"] > 0
+
+
+def test_bad_signatures_are_rejected(client, local_backend):
+    storage.upload_fileobj("dev/secret.pdf", io.BytesIO(PDF_CONTENT))
+    url = path_of(storage.generate_download_url("dev/secret.pdf")["url"])
+
+    other_key = client.get(url.replace("secret.pdf", "other.pdf"))
+    tampered = client.get(url[:-4] + "0000")
+    unsigned = client.get("/storage/dev/secret.pdf")
+    with patch("app.local_storage.time.time", return_value=time.time() + 3 * 3600):
+        expired = client.get(url)
+
+    assert other_key.status_code == 403
+    assert tampered.status_code == 403
+    assert unsigned.status_code == 403
+    assert expired.status_code == 403
+
+
+def test_storage_routes_are_disabled_for_s3(client, local_backend):
+    url = path_of(storage.generate_download_url("dev/a.pdf")["url"])
+
+    with patch.object(settings, "storage_backend", "s3"):
+        response = client.get(url)
+
+    assert response.status_code == 404
+
+
+def test_presigned_put_enforces_checksum(authenticated_client, local_backend):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    sha256 = hashlib.sha256(PDF_CONTENT).hexdigest()
+    upload = client.post(
+        "/pieces/upload-url",
+        json={"piece_id": str(uuid4()), "filename": "a.pdf", "sha256": sha256},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    url = path_of(upload["upload_url"])
+
+    wrong_body = client.put(url, content=b"%PDF-1.4 other", headers=upload["headers"])
+    wrong_type = client.put(
+        url,
+        content=PDF_CONTENT,
+        headers={**upload["headers"], "Content-Type": "text/plain"},
+    )
+    assert wrong_body.status_code == 400
+    assert wrong_type.status_code == 403
+    assert not (local_backend / upload["s3_key"]).exists()
+
+    response = client.put(url, content=PDF_CONTENT, headers=upload["headers"])
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{hashlib.md5(PDF_CONTENT).hexdigest()}"'
+    assert (local_backend / upload["s3_key"]).read_bytes() == PDF_CONTENT
+    assert storage.head_object(upload["s3_key"])["size"] == len(PDF_CONTENT)
+
+
+def test_multipart_upload(client, local_backend):
+    key = "dev/cadenza/videos/1/take.mp4"
+    parts = [b"a" * 100, b"b" * 100, b"c" * 10]
+    upload_id = storage.create_multipart_upload(key, "video/mp4")
+    urls = storage.generate_part_upload_urls(key, upload_id, [3, 1, 2])["urls"]
+
+    for number in (3, 1, 2):
+        response = client.put(path_of(urls[number]), content=parts[number - 1])
+        assert response.status_code == 200
+
+    uploaded = storage.list_uploaded_parts(key, upload_id)
+    assert [part["PartNumber"] for part in uploaded] == [1, 2, 3]
+    assert [part["Size"] for part in uploaded] == [100, 100, 10]
+
+    storage.complete_multipart_upload(
+        key,
+        upload_id,
+        [{"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in uploaded],
+    )
+
+    assert (local_backend / key).read_bytes() == b"".join(parts)
+    assert storage.list_uploaded_parts(key, upload_id) is None
+    assert [obj["key"] for obj in storage.list_objects("dev/cadenza/videos/")] == [key]
+
+
+def test_keys_cannot_escape_storage(client, local_backend):
+    with pytest.raises(ValueError):
+        storage.upload_fileobj("../outside.pdf", io.BytesIO(PDF_CONTENT))
+    with pytest.raises(ValueError):
+        storage.upload_fileobj(".uploads/x/00001.abc", io.BytesIO(PDF_CONTENT))
+
+    url = local_storage._sign_url("GET", ".uploads/x/key", expires_at=2**40)
+
+    assert client.get(path_of(url)).status_code == 404
+
+
+def test_checksum_header_matches_s3_format():
+    sha256 = hashlib.sha256(PDF_CONTENT).hexdigest()
+    upload = storage.generate_pdf_blob_upload_url(uuid4(), sha256)
+
+    assert (
+        upload["headers"]["x-amz-checksum-sha256"]
+        == base64.b64encode(hashlib.sha256(PDF_CONTENT).digest()).decode()
+    )
@@ -0,0 +1,176 @@
+"""
+Media worker tests.
+
+These tests verify app.media_worker and the queue features it relies on:
+- Workers can claim only, or all but, media/analysis jobs
+- Dispatch runs media jobs on the pool and leaves the rest queued
+- Jobs over their time limit fail and are retried like any other error
+- Jobs whose process crashed use up an attempt instead of crash-looping
+- Pool processes can't allocate past their memory limit
+- Leases of running jobs are renewed, and jobs another worker took over aren't
+  run or recorded; metrics report throughput and lag
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from sqlmodel import select
+
+from app import jobs, media_worker, models
+from tests.conftest import engine
+
+
+@jobs.job_handler("media.test_sleep")
+def sleep(db, payload):
+    time.sleep(payload["seconds"])
+    return {"slept": payload["seconds"]}
+
+
+def allocate(megabytes):
+    """Run in a pool process: whether `megabytes` could be allocated"""
+    try:
+        bytearray(megabytes * 1024 * 1024)
+    except MemoryError:
+        return "MemoryError"
+    return "ok"
+
+
+def queue(db, *kinds):
+    queued = [jobs.enqueue(db, kind, {"seconds": 0}) for kind in kinds]
+    db.commit()
+    return queued
+
+
+def test_claim_by_kind_prefix(db):
+    queue(db, "storage.delete_objects", "media.test_sleep")
+
+    media = jobs.claim(db, "w", only=media_worker.MEDIA_JOB_PREFIXES)
+    other = jobs.claim(db, "w", exclude=media_worker.MEDIA_JOB_PREFIXES)
+
+    assert media.kind == "media.test_sleep"
+    assert other.kind == "storage.delete_objects"
+    assert jobs.claim(db, "w") is None
+
+
+def test_dispatch_runs_media_jobs(db):
+    queue(db, "media.test_sleep", "media.test_sleep", "storage.gc")
+
+    with patch("app.database.engine", engine):
+        stats = media_worker.dispatch(
+            db,
+            lambda: ThreadPoolExecutor(2),
+            "test-worker",
+            processes=2,
+            job_time_limit=None,  # Signals only reach the main thread
+            once=True,
+            poll_interval=0.01,
+        )
+
+    assert stats.finished == {"succeeded": 2}
+    assert len(stats.queue_lags) == 2
+    statuses = {
+        job.kind: job.status
+        for job in db.exec(select(models.Job).execution_options(populate_existing=True))
+    }
+    assert statuses == {"media.test_sleep": "succeeded", "storage.gc": "queued"}
+
+
+def test_job_over_time_limit_is_retried(db):
+    job = jobs.enqueue(db, "media.test_sleep", {"seconds": 2})
+    db.commit()
+    claimed = jobs.claim(db, "test-worker")
+
+    start = time.monotonic()
+    with patch("app.database.engine", engine):
+        status = media_worker.run_job(str(claimed.id), "test-worker", 0.1)
+
+    assert time.monotonic() - start < 1
+    assert status == "queued"
+    db.refresh(job)
+    assert "JobTimeout" in job.last_error
+
+
+def test_crashed_job_fails_when_out_of_attempts(db):
+    job = jobs.enqueue(db, "media.test_sleep", {"seconds": 0}, max_attempts=1)
+    db.commit()
+
+    def crash(job_id, worker_id, seconds):
+        raise BrokenProcessPool("A process in the pool was terminated abruptly")
+
+    with patch.object(media_worker, "run_job", crash):
+        stats = media_worker.dispatch(
+            db,
+            lambda: ThreadPoolExecutor(1),
+            "test-worker",
+            processes=1,
+            job_time_limit=None,
+            once=True,
+            poll_interval=0.01,
+        )
+
+    assert stats.finished == {"crashed": 1}
+    db.refresh(job)
+    assert job.status == "failed"
+    assert "BrokenProcessPool" in job.last_error
+
+
+def test_job_taken_over_by_another_worker_is_not_run(db):
+    job = jobs.enqueue(db, "media.test_sleep", {"seconds": 0})
+    db.commit()
+    claimed = jobs.claim(db, "test-worker")
+    claimed.locked_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    db.add(claimed)
+    db.commit()
+    jobs.claim(db, "other-worker")
+
+    with patch("app.database.engine", engine):
+        status = media_worker.run_job(str(job.id), "test-worker", None)
+
+    assert status == "lost"
+    assert jobs.renew(db, [job.id], "test-worker") == []
+    db.refresh(job)
+    assert (job.status, job.locked_by, job.result) == ("running", "other-worker", None)
+
+
+def test_time_limit_is_cleared():
+    with media_worker.time_limit(0.2):
+        pass
+    time.sleep(0.3)  # No late alarm
+
+
+def test_pool_memory_limit():
+    with media_worker.create_pool(1, memory_limit_mb=256, nice=0) as pool:
+        assert pool.submit(allocate, 16).result(timeout=60) == "ok"
+        assert pool.submit(allocate, 512).result(timeout=60) == "MemoryError"
+
+
+def test_renew_extends_own_leases(db):
+    mine, theirs = queue(db, "media.test_sleep", "media.test_sleep")
+    stale = datetime.now(timezone.utc) - timedelta(hours=1)
+    for job, worker in [(mine, "me"), (theirs, "them")]:
+        job.status, job.locked_by, job.locked_at = "running", worker, stale
+        db.add(job)
+    db.commit()
+
+    assert jobs.renew(db, [mine.id, theirs.id], "me") == [mine.id]
+
+    db.refresh(mine)
+    db.refresh(theirs)
+    assert mine.locked_at.replace(tzinfo=timezone.utc) > stale + timedelta(minutes=59)
+    assert theirs.locked_at.replace(tzinfo=timezone.utc) == stale
+
+
+def test_metrics_report():
+    stats = media_worker.WorkerStats()
+    stats.queue_lags = [1.0, 3.0, 30.0]
+    for _ in range(6):
+        stats.record_finish("succeeded", 2.0)
+
+    line = stats.report(60.0, busy=3, processes=4, runnable=120)
+
+    assert line.startswith("[METRICS] 6.0 jobs/min, busy 3/4, runnable 120")
+    assert "queue lag p50 3.0s max 30.0s" in line
+    assert stats.queue_lags == [] and stats.interval_finished == 0
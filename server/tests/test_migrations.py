@@ -0,0 +1,164 @@
+"""
+Schema migration tests.
+
+These tests verify upgrading a database created before columns/indexes existed:
+- The schema check fails until the migration has run
+- Missing columns and indexes are added, and running again changes nothing
+- Existing videos whose object is in storage are marked complete
+"""
+
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import Index, MetaData, Table, create_engine, inspect, select
+from sqlmodel import SQLModel
+
+from app import migrations, storage
+
+NOW = datetime(2026, 1, 5, tzinfo=timezone.utc)
+
+
+def legacy_metadata() -> MetaData:
+    """The tables as they were before migrations.COLUMNS and INDEXES existed"""
+    metadata = MetaData()
+    dropped = set(migrations.COLUMNS)
+    changed = {name for name, _ in dropped} | {
+        table for table, _, _ in migrations.INDEXES.values()
+    }
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in changed:
+            table.to_metadata(metadata)
+            continue
+        columns = []
+        for column in table.columns:
+            if (table.name, column.name) in dropped:
+                continue
+            copy = column._copy()
+            copy.index = None
+            columns.append(copy)
+        legacy = Table(table.name, metadata, *columns)
+        for index in table.indexes:
+            names = [column.name for column in index.columns]
+            if index.name in migrations.INDEXES or not all(
+                name in legacy.c for name in names
+            ):
+                continue
+            Index(index.name, *(legacy.c[name] for name in names), **index.kwargs)
+    return metadata
+
+
+@pytest.fixture
+def legacy(tmp_path, mock_s3):
+    """A database with the old schema, one user and some stored videos"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    metadata = legacy_metadata()
+    metadata.create_all(engine)
+    videos = storage.get_gc_prefixes()[1]
+    stored_submission, missing_submission = uuid4(), uuid4()
+    stored_message, text_message = uuid4(), uuid4()
+    with engine.begin() as connection:
+        connection.execute(
+            metadata.tables["users"].insert(),
+            {"id": 1, "email": "student@example.com", "created_at": NOW},
+        )
+        connection.execute(
+            metadata.tables["video_submissions"].insert(),
+            [
+                {
+                    "id": submission_id,
+                    "user_id": 1,
+                    "s3_key": f"{videos}1/{submission_id}.mp4",
+                    "duration_seconds": 30,
+                    "created_at": NOW,
+                }
+                for submission_id in (stored_submission, missing_submission)
+            ],
+        )
+        connection.execute(
+            metadata.tables["messages"].insert(),
+            [
+                {
+                    "id": stored_message,
+                    "submission_id": stored_submission,
+                    "sender_id": 1,
+                    "video_s3_key": f"{videos}1/messages/{stored_message}.mp4",
+                    "created_at": NOW,
+                },
+                {
+                    "id": text_message,
+                    "submission_id": stored_submission,
+                    "sender_id": 1,
+                    "video_s3_key": None,
+                    "created_at": NOW,
+                },
+            ],
+        )
+    stored = [
+        f"{videos}1/{stored_submission}.mp4",
+        f"{videos}1/messages/{stored_message}.mp4",
+    ]
+    mock_s3.get_paginator.return_value.paginate.return_value = [
+        {
+            "Contents": [
+                {"Key": key, "Size": 2048, "LastModified": NOW} for key in stored
+            ]
+        }
+    ]
+    return engine, {
+        "stored_submission": stored_submission,
+        "missing_submission": missing_submission,
+        "stored_message": stored_message,
+        "text_message": text_message,
+    }
+
+
+def upload_states(engine, table_name):
+    table = SQLModel.metadata.tables[table_name]
+    with engine.connect() as connection:
+        rows = connection.execute(select(table.c.id, table.c.upload_state))
+        return {row.id: row.upload_state for row in rows}
+
+
+def test_schema_check_fails_until_migrated(legacy):
+    engine, _ = legacy
+
+    with pytest.raises(RuntimeError, match="video_submissions.upload_state"):
+        migrations.check_schema(engine)
+
+    assert migrations.migrate(engine, dry_run=True)
+    with pytest.raises(RuntimeError):
+        migrations.check_schema(engine)
+
+
+def test_migration_adds_columns_and_indexes(legacy):
+    engine, _ = legacy
+
+    changes = migrations.migrate(engine, dry_run=False)
+
+    assert set(changes) == {
+        f"{table}.{column}" for table, column in migrations.COLUMNS
+    } | set(migrations.INDEXES)
+    migrations.check_schema(engine)
+    indexes = {
+        index["name"]: index
+        for index in inspect(engine).get_indexes("video_submissions")
+    }
+    pending_review = indexes["ix_video_submissions_pending_review"]
+    assert pending_review["column_names"] == ["created_at", "id"]
+    assert migrations.migrate(engine, dry_run=False) == []
+
+
+def test_stored_videos_are_marked_complete(legacy):
+    engine, ids = legacy
+
+    migrations.migrate(engine, dry_run=False)
+
+    assert upload_states(engine, "video_submissions") == {
+        ids["stored_submission"]: "complete",
+        ids["missing_submission"]: "pending",
+    }
+    assert upload_states(engine, "messages") == {
+        ids["stored_message"]: "complete",
+        ids["text_message"]: None,
+    }
@@ -0,0 +1,260 @@
+"""
+Content-addressed PDF storage tests.
+
+These tests verify that identical PDFs are stored once:
+- Pieces with the same bytes share one S3 object, keyed by SHA-256
+- Blob reference counts follow piece creation, sharing and deletion
+- PDFs are uploaded before their blob row is locked, and again if GC took them
+- Direct uploads are staged, verified by S3 checksum, then copied to the
+  content-addressed key; knowing a PDF's hash isn't enough to reference it
+- Bundled PDFs are copied to their content-addressed key once
+"""
+
+import base64
+import hashlib
+import io
+from unittest.mock import patch
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+from app import models, pdf_blobs, storage
+
+PDF_CONTENT = b"%PDF-1.4 Suzuki Violin School, Volume 1"
+PDF_SHA256 = hashlib.sha256(PDF_CONTENT).hexdigest()
+
+
+def create_piece(client, token, title, content=PDF_CONTENT):
+    """Helper to create a piece with file upload"""
+    response = client.post(
+        "/pieces",
+        data={"title": title},
+        files={"pdf_file": ("suzuki.pdf", io.BytesIO(content), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()
+
+
+def test_identical_pdfs_are_stored_once(authenticated_client, mock_s3, db):
+    client, first_data = authenticated_client(user_id="t1", email="t1@example.com")
+    _, second_data = authenticated_client(user_id="t2", email="t2@example.com")
+
+    first = create_piece(client, first_data["access_token"], "Suzuki 1")
+    second = create_piece(client, second_data["access_token"], "Suzuki Book 1")
+    other = create_piece(
+        client, second_data["access_token"], "Etude", content=b"%PDF-1.4 etude"
+    )
+
+    assert (
+        first["s3_key"] == second["s3_key"] == storage.get_pdf_blob_s3_key(PDF_SHA256)
+    )
+    assert first["blob_sha256"] == PDF_SHA256
+    assert other["s3_key"] != first["s3_key"]
+    assert mock_s3.put_object.call_count == 2
+
+    blob = db.get(models.PdfBlob, PDF_SHA256)
+    assert blob.ref_count == 2
+    assert blob.size_bytes == len(PDF_CONTENT)
+
+
+def test_pdf_is_uploaded_before_blob_is_retained(authenticated_client, mock_s3):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    order = []
+    retain = pdf_blobs.retain
+
+    def _retain(*args, **kwargs):
+        order.append("retain")
+        return retain(*args, **kwargs)
+
+    mock_s3.put_object.side_effect = lambda **kwargs: order.append("upload")
+    with patch("app.pdf_blobs.retain", side_effect=_retain):
+        create_piece(client, user_data["access_token"], "Suzuki 1")
+
+    assert order == ["upload", "retain"]
+
+
+def test_staged_pdf_is_copied_before_blob_is_retained(authenticated_client, mock_s3):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece_id = str(uuid4())
+    client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "suzuki.pdf", "sha256": PDF_SHA256},
+        headers=headers,
+    )
+    mock_s3.head_object.return_value = {"ContentLength": 10, "ETag": '"abc"'}
+    order = []
+    retain = pdf_blobs.retain
+
+    def _retain(*args, **kwargs):
+        order.append("retain")
+        return retain(*args, **kwargs)
+
+    mock_s3.copy_object.side_effect = lambda **kwargs: order.append("copy")
+    with patch("app.pdf_blobs.retain", side_effect=_retain):
+        client.post(
+            "/pieces/finalize",
+            json={
+                "id": piece_id,
+                "title": "Suzuki 1",
+                "pdf_filename": "suzuki.pdf",
+                "sha256": PDF_SHA256,
+            },
+            headers=headers,
+        )
+
+    assert order == ["copy", "retain"]
+
+
+def test_collected_upload_is_stored_again(authenticated_client, mock_s3):
+    """Storage GC deleting the object mid-request doesn't leave the piece empty"""
+    client, user_data = authenticated_client(email="teacher@example.com")
+    mock_s3.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404"}}, "HeadObject"
+    )
+
+    piece = create_piece(client, user_data["access_token"], "Suzuki 1")
+
+    assert piece["blob_sha256"] == PDF_SHA256
+    assert mock_s3.put_object.call_count == 2
+    assert mock_s3.put_object.call_args.kwargs["Body"] == PDF_CONTENT
+
+
+def test_deleting_piece_releases_blob(authenticated_client, mock_s3, db):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    keep = create_piece(client, token, "Keep")
+    remove = create_piece(client, token, "Remove")
+
+    client.delete(
+        f"/pieces/{remove['id']}", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert db.get(models.PdfBlob, PDF_SHA256).ref_count == 1
+    mock_s3.delete_object.assert_not_called()
+    download = client.get(
+        f"/pieces/{keep['id']}/download-url",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert download.status_code == 200
+
+
+def test_shared_piece_points_at_same_blob(authenticated_client, db):
+    client, teacher_data = authenticated_client(
+        user_id="teacher", email="teacher@example.com"
+    )
+    _, student_data = authenticated_client(
+        user_id="student", email="student@example.com"
+    )
+    client.post(
+        "/users/set-teacher",
+        params={"teacher_email": "teacher@example.com"},
+        headers={"Authorization": f"Bearer {student_data['access_token']}"},
+    )
+    piece = create_piece(client, teacher_data["access_token"], "Suzuki 1")
+
+    shared = client.post(
+        f"/pieces/{piece['id']}/share/{student_data['user']['id']}",
+        headers={"Authorization": f"Bearer {teacher_data['access_token']}"},
+    ).json()
+
+    assert shared["s3_key"] == piece["s3_key"]
+    assert shared["blob_sha256"] == PDF_SHA256
+    assert db.get(models.PdfBlob, PDF_SHA256).ref_count == 2
+
+
+def test_direct_upload_to_content_addressed_key(authenticated_client, mock_s3, db):
+    client, user_data = authenticated_client(email="user@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece_id = str(uuid4())
+
+    upload = client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "suzuki.pdf", "sha256": PDF_SHA256},
+        headers=headers,
+    ).json()
+
+    checksum = base64.b64encode(hashlib.sha256(PDF_CONTENT).digest()).decode()
+    assert upload["s3_key"] == storage.get_pdf_upload_s3_key(piece_id)
+    assert upload["headers"]["x-amz-checksum-sha256"] == checksum
+    assert "x-amz-checksum-sha256" in upload["upload_url"]
+
+    mock_s3.head_object.return_value = {
+        "ContentLength": len(PDF_CONTENT),
+        "ETag": '"abc"',
+    }
+    piece = client.post(
+        "/pieces/finalize",
+        json={
+            "id": piece_id,
+            "title": "Suzuki 1",
+            "pdf_filename": "suzuki.pdf",
+            "sha256": PDF_SHA256,
+        },
+        headers=headers,
+    ).json()
+
+    assert piece["s3_key"] == storage.get_pdf_blob_s3_key(PDF_SHA256)
+    copy = mock_s3.copy_object.call_args.kwargs
+    assert copy["CopySource"]["Key"] == upload["s3_key"]
+    assert copy["Key"] == piece["s3_key"]
+    assert db.get(models.PdfBlob, PDF_SHA256).ref_count == 1
+
+
+def test_known_hash_without_upload_is_rejected(authenticated_client, mock_s3, db):
+    """Someone else's blob can't be claimed by finalizing with its hash"""
+    client, owner_data = authenticated_client(user_id="owner", email="o@example.com")
+    owned = create_piece(client, owner_data["access_token"], "Suzuki 1")
+    _, other_data = authenticated_client(user_id="other", email="x@example.com")
+    headers = {"Authorization": f"Bearer {other_data['access_token']}"}
+    piece_id = str(uuid4())
+    client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "x.pdf", "sha256": PDF_SHA256},
+        headers=headers,
+    )
+    blob_key = storage.get_pdf_blob_s3_key(PDF_SHA256)
+
+    def _head_object(Bucket, Key):
+        if Key != blob_key:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ContentLength": len(PDF_CONTENT), "ETag": '"abc"'}
+
+    mock_s3.head_object.side_effect = _head_object
+    response = client.post(
+        "/pieces/finalize",
+        json={
+            "id": piece_id,
+            "title": "Mine now",
+            "pdf_filename": "x.pdf",
+            "sha256": PDF_SHA256,
+        },
+        headers=headers,
+    )
+
+    assert response.status_code == 409
+    assert client.get("/pieces", headers=headers).json() == []
+    assert db.get(models.PdfBlob, owned["blob_sha256"]).ref_count == 1
+
+
+def test_bundled_pdf_is_copied_once(mock_s3):
+    body = mock_s3.get_object.return_value["Body"]
+    body.iter_chunks.return_value = [PDF_CONTENT]
+    stored = {"infra/ios/bundle/suzuki-1.pdf"}
+
+    def _head_object(Bucket, Key):
+        if Key not in stored:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ETag": '"bundled-v1"', "ContentLength": len(PDF_CONTENT)}
+
+    mock_s3.head_object.side_effect = _head_object
+    mock_s3.copy_object.side_effect = lambda **kwargs: stored.add(kwargs["Key"])
+
+    first = storage.copy_bundled_to_user_piece("suzuki-1.pdf")
+    second = storage.copy_bundled_to_user_piece("suzuki-1.pdf")
+
+    assert first == second
+    assert first["s3_key"] == storage.get_pdf_blob_s3_key(PDF_SHA256)
+    assert first["sha256"] == PDF_SHA256
+    assert first["size"] == len(PDF_CONTENT)
+    assert mock_s3.copy_object.call_count == 1
@@ -0,0 +1,136 @@
+"""
+PDF preview tests.
+
+These tests verify the media.pdf_previews job and how pieces expose its output:
+- Uploading a piece queues previews; the job stores them next to the PDF
+- Piece responses carry a preview URL, and /page-previews the page URLs
+- Pieces with the same PDF share its previews without rendering it again
+- Storage GC keeps previews while their PDF is live
+"""
+
+import io
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import select
+
+from app import jobs, models, pdf_previews, storage, tasks  # noqa: F401
+from app.storage_gc import _is_live
+
+PAGES = 12
+
+
+def fake_pdftoppm(args, **kwargs):
+    """Writes a stub JPEG per page, zero-padded like pdftoppm"""
+    root = args[-1]
+    if "-singlefile" in args:
+        Path(f"{root}.jpg").write_bytes(b"\xff\xd8\xff")
+    else:
+        for page in range(1, PAGES + 1):
+            Path(f"{root}-{page:02d}.jpg").write_bytes(bytes([page]))
+    return subprocess.CompletedProcess(args, 0, "", "")
+
+
+def upload_piece(client, token, pdf=b"%PDF-1.4 etude"):
+    return client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(pdf), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+
+
+def run_previews(db):
+    with patch("app.pdf_previews.subprocess.run", side_effect=fake_pdftoppm) as tool:
+        job = jobs.run_next(db, "test-worker")
+    assert job.kind == "media.pdf_previews"
+    return job, tool
+
+
+@pytest.fixture
+def uploaded(authenticated_client, mock_s3):
+    """A teacher's piece, uploaded but not yet previewed"""
+    client, user_data = authenticated_client(email="teacher@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece = upload_piece(client, user_data["access_token"])
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+    mock_s3.get_object.return_value["Body"].iter_chunks.return_value = [b"%PDF"]
+    return client, headers, piece
+
+
+def test_upload_queues_previews(uploaded, db):
+    _, _, piece = uploaded
+
+    [job] = db.exec(select(models.Job)).all()
+
+    assert job.kind == "media.pdf_previews"
+    assert job.payload == {"s3_key": piece["s3_key"]}
+    assert piece["preview_url"] is None
+
+
+def test_previews_are_stored_next_to_pdf(uploaded, mock_s3, db):
+    client, headers, piece = uploaded
+
+    job, tool = run_previews(db)
+
+    assert job.status == "succeeded"
+    assert job.result == {"pieces": 1, "pages": PAGES}
+    first_page, pages = (call.args[0] for call in tool.call_args_list)
+    assert first_page[first_page.index("-scale-to") + 1] == "480"
+    assert pages[pages.index("-scale-to") + 1] == "160"
+    prefix = piece["s3_key"].removesuffix(".pdf")
+    uploaded_bodies = {
+        call.kwargs["Key"]: call.kwargs["Body"]
+        for call in mock_s3.put_object.call_args_list
+        if call.kwargs["Key"].startswith(prefix + "/")
+    }
+    assert set(uploaded_bodies) == {f"{prefix}/preview.jpg"} | {
+        f"{prefix}/pages/{page}.jpg" for page in range(1, PAGES + 1)
+    }
+    # Page 10 sorts after page 9, not after page 1
+    assert uploaded_bodies[f"{prefix}/pages/10.jpg"] == bytes([10])
+
+    [listed] = client.get("/pieces", headers=headers).json()
+    assert listed["preview_url"]
+    assert listed["page_preview_count"] == PAGES
+    page_previews = client.get(
+        f"/pieces/{piece['id']}/page-previews", headers=headers
+    ).json()
+    assert len(page_previews["page_urls"]) == PAGES
+
+
+def test_page_previews_can_be_disabled(uploaded, db):
+    client, headers, piece = uploaded
+
+    with patch("app.tasks.settings.pdf_page_previews", False):
+        job, tool = run_previews(db)
+
+    assert job.result == {"pieces": 1, "pages": None}
+    assert tool.call_count == 1
+    page_previews = client.get(
+        f"/pieces/{piece['id']}/page-previews", headers=headers
+    ).json()
+    assert page_previews["page_urls"] == []
+
+
+def test_same_pdf_reuses_previews(uploaded, authenticated_client, db):
+    client, _, piece = uploaded
+    run_previews(db)
+
+    _, other_data = authenticated_client(user_id="other", email="other@example.com")
+    other = upload_piece(client, other_data["access_token"])
+
+    assert other["s3_key"] == piece["s3_key"]
+    assert other["preview_url"]
+    assert other["page_preview_count"] == PAGES
+    assert jobs.run_next(db, "test-worker") is None
+
+
+def test_gc_keeps_previews_of_live_pdf():
+    pdf = storage.get_pdf_blob_s3_key("ab" * 32)
+
+    assert _is_live(storage.get_pdf_preview_s3_key(pdf), {pdf})
+    assert _is_live(storage.get_pdf_page_preview_s3_key(pdf, 3), {pdf})
+    assert not _is_live(storage.get_pdf_preview_s3_key(pdf), set())
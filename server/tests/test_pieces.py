@@ -9,6 +9,12 @@ These tests verify the piece workflow:
 """
 
 import io
+from unittest.mock import patch
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+from app.config import settings
 
 
 def create_piece(client, token, title, filename="test.pdf"):
@@ -280,3 +286,137 @@ def test_teacher_cannot_share_with_non_student(authenticated_client):
 
     assert response.status_code == 403
     assert "not authorized" in response.json()["detail"].lower()
+
+
+def test_direct_upload_flow_creates_piece(authenticated_client):
+    """Client uploads the PDF straight to S3, then finalizes the piece"""
+    client, user_data = authenticated_client(email="user@example.com")
+    token = user_data["access_token"]
+    piece_id = str(uuid4())
+
+    upload = client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "suite.pdf"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert upload.status_code == 200
+    assert upload.json()["s3_key"].endswith(f"{piece_id}.pdf")
+
+    response = client.post(
+        "/pieces/finalize",
+        json={"id": piece_id, "title": "Cello Suite", "pdf_filename": "suite.pdf"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+    piece = response.json()
+    assert piece["id"] == piece_id
+    assert piece["s3_key"] == upload.json()["s3_key"]
+
+    pieces = client.get("/pieces", headers={"Authorization": f"Bearer {token}"})
+    assert [p["id"] for p in pieces.json()] == [piece_id]
+
+
+def test_finalize_requires_uploaded_pdf(authenticated_client, mock_s3):
+    """Finalizing before the PDF reaches S3 does not create a piece"""
+    client, user_data = authenticated_client(email="user@example.com")
+    token = user_data["access_token"]
+    piece_id = str(uuid4())
+    client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "missing.pdf"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    mock_s3.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404"}}, "HeadObject"
+    )
+
+    response = client.post(
+        "/pieces/finalize",
+        json={"id": piece_id, "title": "Missing", "pdf_filename": "missing.pdf"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 409
+    pieces = client.get("/pieces", headers={"Authorization": f"Bearer {token}"})
+    assert pieces.json() == []
+
+
+def test_cannot_request_upload_url_for_existing_piece(authenticated_client):
+    """Upload URLs cannot be used to overwrite another piece's PDF"""
+    client, owner_data = authenticated_client(
+        user_id="owner", email="owner@example.com"
+    )
+    piece = create_piece(client, owner_data["access_token"], "Owned").json()
+
+    _, other_data = authenticated_client(user_id="other", email="other@example.com")
+    response = client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece["id"], "filename": "evil.pdf"},
+        headers={"Authorization": f"Bearer {other_data['access_token']}"},
+    )
+
+    assert response.status_code == 409
+
+
+def test_only_requester_can_finalize_upload(authenticated_client):
+    """Another user can neither finalize a started upload nor take over its key"""
+    client, owner_data = authenticated_client(
+        user_id="owner", email="owner@example.com"
+    )
+    _, other_data = authenticated_client(user_id="other", email="other@example.com")
+    other_headers = {"Authorization": f"Bearer {other_data['access_token']}"}
+    piece_id = str(uuid4())
+    client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "suite.pdf"},
+        headers={"Authorization": f"Bearer {owner_data['access_token']}"},
+    )
+
+    upload = client.post(
+        "/pieces/upload-url",
+        json={"piece_id": piece_id, "filename": "evil.pdf"},
+        headers=other_headers,
+    )
+    finalize = client.post(
+        "/pieces/finalize",
+        json={"id": piece_id, "title": "Stolen", "pdf_filename": "suite.pdf"},
+        headers=other_headers,
+    )
+    unstarted = client.post(
+        "/pieces/finalize",
+        json={"id": str(uuid4()), "title": "Stolen", "pdf_filename": "suite.pdf"},
+        headers=other_headers,
+    )
+
+    assert upload.status_code == 409
+    assert finalize.status_code == 403
+    assert unstarted.status_code == 409
+    assert client.get("/pieces", headers=other_headers).json() == []
+
+
+def test_large_pdf_is_streamed_in_bounded_parts(authenticated_client, mock_s3):
+    """PDFs larger than one part reach S3 intact as a multipart upload"""
+    client, user_data = authenticated_client(email="user@example.com")
+    stored_parts = {}
+
+    def _upload_part(**kwargs):
+        stored_parts[kwargs["PartNumber"]] = kwargs["Body"]
+        return {"ETag": f"etag-{kwargs['PartNumber']}"}
+
+    mock_s3.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+    mock_s3.upload_part.side_effect = _upload_part
+    pdf_content = b"%PDF-1.4 " + bytes(range(256)) * 40
+
+    with patch.object(settings, "s3_multipart_part_size", 4096):
+        response = client.post(
+            "/pieces",
+            data={"title": "Big Score"},
+            files={"pdf_file": ("big.pdf", io.BytesIO(pdf_content), "application/pdf")},
+            headers={"Authorization": f"Bearer {user_data['access_token']}"},
+        )
+
+    assert response.status_code == 200
+    assert len(stored_parts) == 3
+    assert all(len(part) <= 4096 for part in stored_parts.values())
+    assert b"".join(stored_parts[n] for n in sorted(stored_parts)) == pdf_content
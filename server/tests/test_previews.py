@@ -0,0 +1,165 @@
+"""
+Poster frame and scrub-preview sprite tests.
+
+These tests verify the media.generate_previews job:
+- The sprite sheet is stored next to the thumbnail and its layout is recorded
+- A missing thumbnail is replaced by a server-extracted poster frame
+- Client-uploaded thumbnails are left alone
+- Video URL responses carry the sprite URL
+- Long videos sample less often instead of growing the sprite
+"""
+
+import io
+import json
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlmodel import select
+
+from app import jobs, media, models, previews, tasks  # noqa: F401
+
+
+def create_submission(client, token):
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 60},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()["submission"]
+
+
+def fake_media_tools(args, **kwargs):
+    """ffprobe reports a 90s 1080p video; ffmpeg writes a stub JPEG"""
+    if "-show_streams" in args:
+        output = {
+            "format": {"duration": "90.0"},
+            "streams": [
+                {
+                    "codec_type": "video",
+                    "codec_name": "h264",
+                    "width": 1920,
+                    "height": 1080,
+                }
+            ],
+        }
+        return subprocess.CompletedProcess(args, 0, json.dumps(output), "")
+    Path(args[-1]).write_bytes(b"\xff\xd8\xff")
+    return subprocess.CompletedProcess(args, 0, "", "")
+
+
+@pytest.fixture
+def finalized(authenticated_client, mock_s3, db, probe_uploads):
+    """A student's finalized submission"""
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    submission = create_submission(client, user_data["access_token"])
+    for job in db.exec(select(models.Job)).all():  # The piece's PDF previews
+        db.delete(job)
+    db.commit()
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+
+    return client, headers, submission
+
+
+def run_previews(db):
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools) as ffmpeg:
+        job = jobs.run_next(db, "test-worker")
+    assert job.kind == "media.generate_previews"
+    return job, ffmpeg
+
+
+def test_sprite_is_stored_with_layout(finalized, mock_s3, db):
+    client, headers, submission = finalized
+
+    job, _ = run_previews(db)
+
+    assert job.status == "succeeded"
+    sprite_key = submission["thumbnail_s3_key"].replace("_thumb", "_thumb_sprite")
+    uploaded = {
+        call.kwargs["Key"]: call.kwargs["ContentType"]
+        for call in mock_s3.put_object.call_args_list
+    }
+    assert uploaded[sprite_key] == "image/jpeg"
+    [data] = client.get("/video-submissions", headers=headers).json()
+    assert data["preview_sprite_s3_key"] == sprite_key
+    assert data["preview_sprite"] == {
+        "interval_seconds": 2.0,
+        "count": 45,
+        "columns": 10,
+        "rows": 5,
+        "tile_width": 160,
+        "tile_height": 90,
+    }
+
+
+def test_missing_thumbnail_gets_poster(finalized, mock_s3, db):
+    _, _, submission = finalized
+    thumbnail_key = submission["thumbnail_s3_key"]
+
+    def head_object(Bucket, Key):
+        if Key == thumbnail_key:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ContentLength": 1024, "ETag": '"abc"'}
+
+    mock_s3.head_object.side_effect = head_object
+
+    job, ffmpeg = run_previews(db)
+
+    assert job.result["poster"] is True
+    uploaded = [call.kwargs["Key"] for call in mock_s3.put_object.call_args_list]
+    assert thumbnail_key in uploaded
+    poster_args = ffmpeg.call_args_list[0].args[0]
+    assert poster_args[poster_args.index("-ss") + 1] == "1.000"
+    assert "scale=-2:720" in poster_args
+
+
+def test_uploaded_thumbnail_is_kept(finalized, mock_s3, db):
+    _, _, submission = finalized
+
+    job, ffmpeg = run_previews(db)
+
+    assert job.result == {"poster": False, "sprite_tiles": 45}
+    assert ffmpeg.call_count == 1
+    uploaded = [call.kwargs["Key"] for call in mock_s3.put_object.call_args_list]
+    assert submission["thumbnail_s3_key"] not in uploaded
+
+
+def test_video_url_includes_sprite(finalized, db):
+    client, headers, submission = finalized
+    run_previews(db)
+
+    response = client.get(
+        f"/video-submissions/{submission['id']}/video-url", headers=headers
+    )
+
+    assert response.json()["sprite_url"].startswith("https://")
+
+
+def test_long_videos_keep_sprite_size():
+    info = media.MediaInfo(
+        duration_seconds=3600,
+        width=1080,
+        height=1920,
+        video_codec="h264",
+        audio_codec=None,
+    )
+
+    layout = previews.sprite_layout(info)
+
+    assert layout["count"] == previews.SPRITE_MAX_TILES
+    assert layout["interval_seconds"] == 36
+    assert (layout["columns"], layout["rows"]) == (10, 10)
+    assert layout["tile_height"] == 284
@@ -413,3 +413,61 @@ def test_shared_pieces_are_not_duplicated(authenticated_client):
     ).json()
 
     assert len(student_pieces) == 1
+
+
+def test_current_routine_expands_pieces_and_download_urls(authenticated_client):
+    """Student gets everything the practice screen needs in one request"""
+    client, teacher_data = authenticated_client(
+        user_id="t1", email="teacher@example.com"
+    )
+    teacher_token = teacher_data["access_token"]
+
+    routine, _ = create_routine_with_exercises(
+        client, teacher_token, "Weekly Practice", ["Scales", "Bach Prelude"]
+    )
+
+    _, student_data = authenticated_client(user_id="s1", email="student@example.com")
+    student_token = student_data["access_token"]
+    student_id = student_data["user"]["id"]
+
+    client.post(
+        "/users/set-teacher",
+        params={"teacher_email": "teacher@example.com"},
+        headers={"Authorization": f"Bearer {student_token}"},
+    )
+    client.post(
+        f"/students/{student_id}/assign-routine",
+        params={"routine_id": routine["id"]},
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    )
+
+    plain = client.get(
+        "/my-current-routine", headers={"Authorization": f"Bearer {student_token}"}
+    ).json()
+    assert "pieces" not in plain
+
+    expanded = client.get(
+        "/my-current-routine",
+        params={"expand": ["pieces", "download_urls"]},
+        headers={"Authorization": f"Bearer {student_token}"},
+    ).json()
+
+    exercise_piece_ids = {e["piece_id"] for e in expanded["exercises"]}
+    assert {p["id"] for p in expanded["pieces"]} == exercise_piece_ids
+    assert {p["title"] for p in expanded["pieces"]} == {"Scales", "Bach Prelude"}
+    assert set(expanded["download_urls"]) == exercise_piece_ids
+    assert expanded["expires_in"] > 0
+
+
+def test_routine_rejects_unknown_expansion(authenticated_client):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    routine, _ = create_routine_with_exercises(client, token, "Routine", ["Scales"])
+
+    response = client.get(
+        f"/routines/{routine['id']}",
+        params={"expand": "students"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 422
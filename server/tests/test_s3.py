@@ -0,0 +1,102 @@
+"""
+S3 client tests.
+
+These tests verify that one configured client is shared per process and rebuilt
+after fork, and that download URLs are reused until close to expiry or until
+the signing credentials rotate.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from app import s3, sigv4
+from app.config import settings
+
+# Bound before the autouse mock_s3 fixture patches the module attribute
+get_s3_client = s3.get_s3_client
+
+
+def test_client_is_shared_across_calls_and_threads():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: get_s3_client(), range(32)))
+
+    assert all(client is clients[0] for client in clients)
+
+
+def test_client_uses_configured_pool_and_timeouts():
+    config = get_s3_client().meta.config
+
+    assert config.max_pool_connections == settings.s3_max_pool_connections
+    assert config.connect_timeout == settings.s3_connect_timeout
+    assert config.read_timeout == settings.s3_read_timeout
+    assert config.retries["mode"] == settings.s3_retry_mode
+
+
+def test_forked_child_gets_a_fresh_client():
+    parent_client = get_s3_client()
+
+    s3._reset_s3_client()
+
+    assert get_s3_client() is not parent_client
+
+
+def test_download_url_is_reused_until_refresh_window():
+    hour = s3.DOWNLOAD_URL_BUCKET_SECONDS
+    start = 1_700_000_000 // hour * hour + 60
+
+    with patch("time.time", return_value=start):
+        first = s3.generate_download_url("pieces/a.pdf")
+    with patch("time.time", return_value=start + 1800):
+        again = s3.generate_download_url("pieces/a.pdf")
+    with patch("time.time", return_value=start + hour - 300):
+        refreshed = s3.generate_download_url("pieces/a.pdf")
+
+    assert again["url"] == first["url"]
+    assert first["expires_in"] == hour - 60
+    assert again["expires_in"] == hour - 60 - 1800
+    assert refreshed["url"] != first["url"]
+    assert refreshed["expires_in"] == 2 * hour - 60 - (hour - 300)
+
+
+def test_download_url_is_identical_across_processes():
+    hour = s3.DOWNLOAD_URL_BUCKET_SECONDS
+    start = 1_700_000_000 // hour * hour
+
+    with patch("time.time", return_value=start + 100):
+        first = s3.generate_download_url("videos/b.mp4")
+
+    # A different worker signs later in the same bucket with an empty cache
+    s3._download_url_cache.clear()
+    with patch("time.time", return_value=start + 2000):
+        second = s3.generate_download_url("videos/b.mp4")
+
+    assert second["url"] == first["url"]
+
+
+def test_download_url_never_expires_within_refresh_margin():
+    hour = s3.DOWNLOAD_URL_BUCKET_SECONDS
+    near_boundary = 1_700_000_000 // hour * hour + hour - 60
+
+    with patch("time.time", return_value=near_boundary):
+        url = s3.generate_download_url("videos/b.mp4")
+
+    assert url["expires_in"] > s3.DOWNLOAD_URL_REFRESH_MARGIN_SECONDS
+
+
+def test_download_url_is_resigned_when_credentials_rotate():
+    hour = s3.DOWNLOAD_URL_BUCKET_SECONDS
+    start = 1_700_000_000 // hour * hour + 60
+    session = sigv4.Credentials("ASIAFIRST", "first-secret", "first-token")
+    rotated = sigv4.Credentials("ASIASECOND", "second-secret", "second-token")
+
+    with patch("time.time", return_value=start):
+        with patch("app.s3._get_credentials", return_value=session):
+            first = s3.generate_download_url("videos/c.mp4")
+            again = s3.generate_download_url("videos/c.mp4")
+        with patch("app.s3._get_credentials", return_value=rotated):
+            resigned = s3.generate_download_url("videos/c.mp4")
+
+    assert again["url"] == first["url"]
+    assert "first-token" in first["url"]
+    assert "ASIASECOND" in resigned["url"]
+    assert "second-token" in resigned["url"]
@@ -0,0 +1,161 @@
+"""
+SigV4 presigner tests.
+
+The in-process presigner must produce exactly the URL botocore would for the same
+credentials, clock and parameters.
+"""
+
+import datetime
+from unittest.mock import patch
+
+import boto3
+import pytest
+from botocore.config import Config
+
+from app import sigv4
+
+SIGNED_AT = datetime.datetime(2026, 10, 18, 23, 59, 30)
+
+
+class _FrozenDatetime(datetime.datetime):
+    @classmethod
+    def utcnow(cls):
+        return SIGNED_AT
+
+
+def botocore_url(credentials, region, operation, params, expires_in, endpoint_url=None):
+    session = boto3.Session(
+        aws_access_key_id=credentials.access_key,
+        aws_secret_access_key=credentials.secret_key,
+        aws_session_token=credentials.token,
+    )
+    client = session.client(
+        "s3",
+        region_name=region,
+        endpoint_url=endpoint_url,
+        config=Config(signature_version="s3v4"),
+    )
+    with patch("botocore.auth.datetime.datetime", _FrozenDatetime):
+        return client.generate_presigned_url(
+            operation, Params=params, ExpiresIn=expires_in
+        )
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        "dev/cadenza/pieces/0b9c4f0e-7d1a-4a55-9d0e-5b0f0d7d2f10.pdf",
+        "cadenza/videos/42/messages/abc_thumb.jpg",
+        "infra/ios/bundle/Suzuki - Cello School - Volume 1.pdf",
+        "odd/keys/plus+tilde~percent%amp&eq=é.pdf",
+    ],
+)
+@pytest.mark.parametrize("token", [None, "FwoGZXIvYXdzEJr//////////wEaDH+token="])
+def test_get_url_matches_botocore(key, token):
+    credentials = sigv4.Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG", token)
+
+    expected = botocore_url(
+        credentials,
+        "us-west-2",
+        "get_object",
+        {"Bucket": "loopflow", "Key": key},
+        3600,
+    )
+    actual = sigv4.presign_s3_url(
+        "GET",
+        "loopflow",
+        key,
+        credentials=credentials,
+        region="us-west-2",
+        expires_in=3600,
+        signed_at=SIGNED_AT,
+    )
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("content_type", ["application/pdf", "video/mp4"])
+def test_put_url_with_content_type_matches_botocore(content_type):
+    credentials = sigv4.Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG", None)
+    key = "dev/cadenza/videos/7/upload.mp4"
+
+    expected = botocore_url(
+        credentials,
+        "eu-central-1",
+        "put_object",
+        {"Bucket": "loopflow", "Key": key, "ContentType": content_type},
+        900,
+    )
+    actual = sigv4.presign_s3_url(
+        "PUT",
+        "loopflow",
+        key,
+        credentials=credentials,
+        region="eu-central-1",
+        expires_in=900,
+        signed_at=SIGNED_AT,
+        headers={"Content-Type": content_type},
+    )
+
+    assert actual == expected
+
+
+def test_upload_part_url_matches_botocore():
+    credentials = sigv4.Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG", "token")
+    key = "dev/cadenza/videos/7/0b9c4f0e.mp4"
+    upload_id = "2~Vt3J.bHv/QM+Dc=="
+
+    expected = botocore_url(
+        credentials,
+        "us-west-2",
+        "upload_part",
+        {"Bucket": "loopflow", "Key": key, "UploadId": upload_id, "PartNumber": 12},
+        3600,
+    )
+    actual = sigv4.presign_s3_url(
+        "PUT",
+        "loopflow",
+        key,
+        credentials=credentials,
+        region="us-west-2",
+        expires_in=3600,
+        signed_at=SIGNED_AT,
+        query={"uploadId": upload_id, "partNumber": "12"},
+    )
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "endpoint_url",
+    [
+        "http://localhost:9000",
+        "https://s3.us-west-2.amazonaws.com",
+        "https://storage.example.com/s3/",
+    ],
+)
+def test_custom_endpoint_url_matches_botocore(endpoint_url):
+    credentials = sigv4.Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG", None)
+    key = "dev/cadenza/videos/7/upload.mp4"
+
+    expected = botocore_url(
+        credentials,
+        "us-west-2",
+        "put_object",
+        {"Bucket": "loopflow", "Key": key, "ContentType": "video/mp4"},
+        900,
+        endpoint_url=endpoint_url,
+    )
+    actual = sigv4.presign_s3_url(
+        "PUT",
+        "loopflow",
+        key,
+        credentials=credentials,
+        region="us-west-2",
+        expires_in=900,
+        signed_at=SIGNED_AT,
+        headers={"Content-Type": "video/mp4"},
+        endpoint_url=endpoint_url,
+    )
+
+    assert actual == expected
@@ -0,0 +1,130 @@
+"""
+Storage garbage collection tests.
+
+These tests verify reconciliation of S3 objects against the database:
+- Objects no row references are reported as orphans in a dry run
+- Referenced objects and recent uploads are never collected
+- Deletion uses DeleteObjects in batches of 1,000 keys
+- Released PDF blobs are removed once their object is gone
+- Piece uploads never finalized are forgotten after the grace period
+"""
+
+import io
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from sqlmodel import select
+
+from app import models, storage
+from app.storage_gc import collect_garbage
+
+OLD = datetime.now(timezone.utc) - timedelta(days=30)
+
+
+def create_piece(client, token, title, content):
+    response = client.post(
+        "/pieces",
+        data={"title": title},
+        files={"pdf_file": ("score.pdf", io.BytesIO(content), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()
+
+
+@pytest.fixture
+def bucket(mock_s3):
+    """Objects listed under the GC prefixes, as {key: last_modified}"""
+    objects = {}
+
+    def _paginate(Bucket, Prefix):
+        contents = [
+            {"Key": key, "Size": 100, "LastModified": modified}
+            for key, modified in objects.items()
+            if key.startswith(Prefix)
+        ]
+        return [{"Contents": contents}]
+
+    mock_s3.get_paginator.return_value.paginate.side_effect = _paginate
+    mock_s3.delete_objects.return_value = {}
+    return objects
+
+
+def test_dry_run_reports_orphans(authenticated_client, bucket, mock_s3, db):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    kept = create_piece(client, token, "Kept", b"%PDF-1.4 kept")
+    deleted = create_piece(client, token, "Deleted", b"%PDF-1.4 deleted")
+    client.delete(
+        f"/pieces/{deleted['id']}", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    prefix = storage.get_gc_prefixes()[1]
+    bucket[kept["s3_key"]] = OLD
+    bucket[deleted["s3_key"]] = OLD
+    bucket[f"{prefix}1/abandoned.mp4"] = OLD
+    bucket[f"{prefix}1/uploading.mp4"] = datetime.now(timezone.utc)
+
+    report = collect_garbage(db, dry_run=True)
+
+    assert report.scanned == 4
+    assert sorted(report.orphans) == sorted(
+        [deleted["s3_key"], f"{prefix}1/abandoned.mp4"]
+    )
+    assert report.orphan_bytes == 200
+    assert report.skipped_recent == 1
+    mock_s3.delete_objects.assert_not_called()
+    assert db.get(models.PdfBlob, deleted["blob_sha256"]) is not None
+
+
+def test_delete_run_batches_and_drops_released_blobs(
+    authenticated_client, bucket, mock_s3, db
+):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    token = user_data["access_token"]
+    deleted = create_piece(client, token, "Deleted", b"%PDF-1.4 deleted")
+    client.delete(
+        f"/pieces/{deleted['id']}", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    prefix = storage.get_gc_prefixes()[1]
+    bucket[deleted["s3_key"]] = OLD
+    for n in range(2100):
+        bucket[f"{prefix}1/{n}.mp4"] = OLD
+    mock_s3.delete_objects.side_effect = [
+        {},
+        {"Errors": [{"Key": f"{prefix}1/5.mp4", "Code": "AccessDenied"}]},
+        {},
+    ]
+
+    report = collect_garbage(db, dry_run=False)
+
+    batches = [
+        len(call.kwargs["Delete"]["Objects"])
+        for call in mock_s3.delete_objects.call_args_list
+    ]
+    assert batches == [1000, 1000, 101]
+    assert report.deleted == 2100
+    assert report.errors == {f"{prefix}1/5.mp4": "AccessDenied"}
+    db.expire_all()
+    assert db.get(models.PdfBlob, deleted["blob_sha256"]) is None
+
+
+def test_abandoned_piece_uploads_are_dropped(authenticated_client, bucket, db):
+    client, user_data = authenticated_client(email="teacher@example.com")
+    for _ in range(2):
+        client.post(
+            "/pieces/upload-url",
+            json={"piece_id": str(uuid4()), "filename": "score.pdf"},
+            headers={"Authorization": f"Bearer {user_data['access_token']}"},
+        )
+    abandoned, recent = db.exec(select(models.PieceUpload)).all()
+    abandoned.created_at = OLD
+    db.add(abandoned)
+    db.commit()
+
+    collect_garbage(db, dry_run=False)
+
+    db.expire_all()
+    remaining = db.exec(select(models.PieceUpload)).all()
+    assert [upload.piece_id for upload in remaining] == [recent.piece_id]
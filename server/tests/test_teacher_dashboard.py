@@ -0,0 +1,123 @@
+"""
+Teacher dashboard tests.
+
+These tests verify the /teacher/dashboard summary:
+- Every student is listed with their current routine
+- Practice time and pending reviews are aggregated per student
+- Students of other teachers are not included
+"""
+
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from app import models
+
+
+def add_student(client, authenticated_client, user_id, email, teacher_email):
+    _, student_data = authenticated_client(user_id=user_id, email=email)
+    client.post(
+        "/users/set-teacher",
+        params={"teacher_email": teacher_email},
+        headers={"Authorization": f"Bearer {student_data['access_token']}"},
+    )
+    return student_data
+
+
+def test_dashboard_summarizes_each_student(authenticated_client, db):
+    """Dashboard reports routine, practice and pending reviews per student"""
+    client, teacher_data = authenticated_client(
+        user_id="t1", email="teacher@example.com"
+    )
+    teacher_token = teacher_data["access_token"]
+
+    busy = add_student(
+        client, authenticated_client, "s1", "busy@example.com", "teacher@example.com"
+    )
+    idle = add_student(
+        client, authenticated_client, "s2", "idle@example.com", "teacher@example.com"
+    )
+
+    routine = client.post(
+        "/routines",
+        json={"title": "Scales"},
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    ).json()
+    client.post(
+        f"/students/{busy['user']['id']}/assign-routine",
+        params={"routine_id": routine["id"]},
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    )
+    assigned = client.get(
+        "/my-current-routine",
+        headers={"Authorization": f"Bearer {busy['access_token']}"},
+    ).json()
+
+    now = datetime.now(timezone.utc)
+    routine_id = UUID(assigned["routine"]["id"])
+    db.add_all(
+        [
+            models.PracticeSession(
+                user_id=busy["user"]["id"],
+                routine_id=routine_id,
+                started_at=now - timedelta(days=1),
+                duration_seconds=1200,
+            ),
+            models.PracticeSession(
+                user_id=busy["user"]["id"],
+                routine_id=routine_id,
+                started_at=now - timedelta(days=30),
+                duration_seconds=3600,
+            ),
+            models.VideoSubmission(
+                user_id=busy["user"]["id"],
+                s3_key="videos/a.mp4",
+                duration_seconds=30,
+            ),
+            models.VideoSubmission(
+                user_id=busy["user"]["id"],
+                s3_key="videos/b.mp4",
+                duration_seconds=30,
+                reviewed_at=now,
+            ),
+        ]
+    )
+    db.commit()
+
+    response = client.get(
+        "/teacher/dashboard", headers={"Authorization": f"Bearer {teacher_token}"}
+    )
+
+    assert response.status_code == 200
+    rows = {row["student"]["email"]: row for row in response.json()}
+    assert set(rows) == {"busy@example.com", "idle@example.com"}
+
+    assert rows["busy@example.com"]["current_routine_title"] == "Scales"
+    assert rows["busy@example.com"]["practice_minutes_7d"] == 20
+    assert rows["busy@example.com"]["pending_review_count"] == 1
+    assert rows["busy@example.com"]["last_practiced_at"] is not None
+
+    idle_row = rows["idle@example.com"]
+    assert idle_row["student"]["id"] == idle["user"]["id"]
+    assert idle_row["current_routine_title"] is None
+    assert idle_row["last_practiced_at"] is None
+    assert idle_row["practice_minutes_7d"] == 0
+    assert idle_row["pending_review_count"] == 0
+
+
+def test_dashboard_excludes_other_teachers_students(authenticated_client):
+    """Teachers only see students who chose them"""
+    client, teacher_data = authenticated_client(
+        user_id="t1", email="teacher@example.com"
+    )
+    authenticated_client(user_id="t2", email="other@example.com")
+    add_student(
+        client, authenticated_client, "s1", "student@example.com", "other@example.com"
+    )
+
+    response = client.get(
+        "/teacher/dashboard",
+        headers={"Authorization": f"Bearer {teacher_data['access_token']}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == []
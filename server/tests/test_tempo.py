@@ -0,0 +1,191 @@
+"""
+Tempo analysis tests.
+
+These tests verify spectral-flux onsets, tempo drift and the analysis.tempo job:
+- Onsets of a click track are found, one per note
+- A faster passage is reported as a rushing segment where it happens
+- Silence and noise have no pulse
+- The job stores its result where /analyses returns it
+- Backfills queue only missing or outdated analyses
+"""
+
+import io
+import json
+import subprocess
+from unittest.mock import MagicMock, patch
+from uuid import UUID
+
+import numpy as np
+import pytest
+from sqlmodel import select
+
+from app import audio, backfill, jobs, models, tasks, tempo  # noqa: F401
+
+SAMPLE_RATE = audio.ANALYSIS_SAMPLE_RATE
+
+
+def note(seconds=0.15, hz=440.0):
+    """A plucked note: decaying tone that fades out rather than cutting off"""
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    envelope = np.exp(-t * 8) * np.hanning(2 * n)[n:]
+    return 0.5 * envelope * np.sin(2 * np.pi * hz * t)
+
+
+def click_track(*sections):
+    """(bpm, seconds) sections of evenly spaced notes, back to back"""
+    parts = []
+    for bpm, seconds in sections:
+        beat = int(SAMPLE_RATE * 60 / bpm)
+        bar = np.zeros(beat)
+        bar[: int(0.15 * SAMPLE_RATE)] = note()
+        parts.append(np.tile(bar, int(seconds * bpm / 60)))
+    return np.concatenate(parts).astype(np.float32)
+
+
+def test_onsets_of_click_track():
+    samples = click_track((120, 10))
+
+    frames = tempo.onsets(tempo.novelty(samples, SAMPLE_RATE), SAMPLE_RATE)
+
+    assert len(frames) == 20
+    assert frames[0] == 0
+    # The first note is already sounding in frame 0; the rest are beat apart
+    seconds = frames[1:] * tempo.HOP / SAMPLE_RATE
+    assert np.allclose(np.diff(seconds), 0.5, atol=0.02)
+
+
+def test_rushing_segment():
+    samples = click_track((120, 20), (135, 20), (120, 20))
+
+    result = tempo.analyze(samples, SAMPLE_RATE)
+
+    assert result["summary"]["tempo_bpm"] == pytest.approx(120, abs=1.5)
+    [segment] = result["segments"]
+    assert segment["kind"] == "rushing"
+    assert segment["start_seconds"] == pytest.approx(20, abs=2)
+    assert segment["end_seconds"] == pytest.approx(40, abs=2)
+    assert segment["drift_percent"] == pytest.approx(12.5, abs=2)
+    json.dumps(result)
+
+
+def test_dragging_segment():
+    samples = click_track((100, 24), (85, 24), (100, 24))
+
+    result = tempo.analyze(samples, SAMPLE_RATE)
+
+    assert [s["kind"] for s in result["segments"]] == ["dragging"]
+
+
+@pytest.mark.parametrize("kind", ["silence", "noise"])
+def test_no_pulse(kind):
+    rng = np.random.default_rng(0)
+    samples = (
+        np.zeros(30 * SAMPLE_RATE, np.float32)
+        if kind == "silence"
+        else rng.normal(0, 0.1, 30 * SAMPLE_RATE).astype(np.float32)
+    )
+
+    result = tempo.analyze(samples, SAMPLE_RATE)
+
+    assert result["summary"]["tempo_bpm"] is None
+    assert result["segments"] == []
+
+
+@pytest.fixture
+def finalized(authenticated_client, mock_s3, db, probe_uploads):
+    """A finalized submission, with its pipeline jobs queued"""
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers=headers,
+    ).json()
+    submission = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 20},
+        headers=headers,
+    ).json()["submission"]
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+    with patch("app.media.subprocess.run", return_value=probe_result()):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+    return client, headers, submission
+
+
+def probe_result():
+    output = {
+        "format": {"duration": "20.0"},
+        "streams": [{"codec_type": "audio", "codec_name": "aac"}],
+    }
+    return subprocess.CompletedProcess([], 0, json.dumps(output), "")
+
+
+def test_job_stores_analysis(finalized, db):
+    client, headers, submission = finalized
+    for job in db.exec(select(models.Job)).all():
+        if job.kind != "analysis.tempo":
+            db.delete(job)
+    db.commit()
+
+    decoder = MagicMock()
+    decoder.stdout = io.BytesIO(click_track((90, 20)).astype("<f4").tobytes())
+    decoder.wait.return_value = 0
+    decoder.poll.return_value = 0
+    with (
+        patch("app.media.subprocess.run", return_value=probe_result()),
+        patch("app.media.subprocess.Popen", return_value=decoder),
+    ):
+        job = jobs.run_next(db, "test-worker")
+
+    assert job.status == "succeeded"
+    assert job.result["tempo_bpm"] == pytest.approx(90, abs=1.5)
+    analyses = client.get(
+        f"/video-submissions/{submission['id']}/analyses", headers=headers
+    ).json()
+    assert [a["kind"] for a in analyses] == ["tempo"]
+    assert analyses[0]["version"] == tempo.VERSION
+    assert analyses[0]["result"]["segments"] == []
+
+
+def test_backfill_queues_missing_and_outdated(finalized, db):
+    _, _, submission = finalized
+    for job in db.exec(select(models.Job)).all():
+        db.delete(job)
+    db.add(
+        models.SubmissionAnalysis(
+            submission_id=UUID(submission["id"]),
+            kind="intonation",
+            version=backfill.ANALYSES["analysis.intonation"][1],
+            result={},
+        )
+    )
+    db.add(
+        models.SubmissionAnalysis(
+            submission_id=UUID(submission["id"]),
+            kind="tempo",
+            version=backfill.ANALYSES["analysis.tempo"][1] - 1,
+            result={},
+        )
+    )
+    db.commit()
+
+    dry_run = backfill.backfill(db)
+    assert dry_run.queued == {
+        "analysis.intonation": 0,
+        "analysis.tempo": 1,
+        "analysis.alignment": 0,  # The piece has no reference
+    }
+    assert db.exec(select(models.Job)).all() == []
+
+    report = backfill.backfill(db, dry_run=False)
+    queued = db.exec(select(models.Job)).all()
+    assert report.scanned == 1
+    assert [(job.kind, job.payload["id"]) for job in queued] == [
+        ("analysis.tempo", submission["id"])
+    ]
+
+    # Already queued: nothing more to do
+    assert backfill.backfill(db, dry_run=False).queued["analysis.tempo"] == 0
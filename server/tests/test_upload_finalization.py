@@ -0,0 +1,249 @@
+"""
+Upload finalization tests.
+
+These tests verify how submission and message videos leave the "pending" state:
+- Finalizing records S3 size/ETag and queues a probe, without running ffprobe
+- The probe job records a content hash, duration, resolution and codec and
+  queues processing
+- Finalizing before the object exists is a conflict
+- Unreadable uploads are marked invalid
+- S3 event webhooks finalize by key and require the shared secret
+- List endpoints can hide uploads that haven't completed
+"""
+
+import hashlib
+import io
+import json
+import subprocess
+from urllib.parse import quote_plus
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlmodel import select
+
+from app import models
+from app.config import settings
+
+
+def create_submission(client, token):
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 600},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()["submission"]
+
+
+def ffprobe_result(duration="61.4", returncode=0):
+    output = {
+        "format": {"duration": duration},
+        "streams": [
+            {
+                "codec_type": "video",
+                "codec_name": "h264",
+                "width": 1920,
+                "height": 1080,
+            },
+            {"codec_type": "audio", "codec_name": "aac"},
+        ],
+    }
+    return subprocess.CompletedProcess(
+        args=[], returncode=returncode, stdout=json.dumps(output), stderr=""
+    )
+
+
+@pytest.fixture
+def uploaded(mock_s3):
+    """Make every HEAD succeed as if the object had been uploaded"""
+    mock_s3.head_object.return_value = {"ContentLength": 52428800, "ETag": '"abc123"'}
+    return mock_s3
+
+
+def test_finalize_submission_records_upload(
+    authenticated_client, uploaded, db, probe_uploads
+):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    submission = create_submission(client, token)
+    assert submission["upload_state"] == "pending"
+    body = uploaded.get_object.return_value["Body"]
+    body.iter_chunks.return_value = [b"video ", b"bytes"]
+
+    with patch("app.media.subprocess.run", return_value=ffprobe_result()) as probe:
+        response = client.post(
+            f"/video-submissions/{submission['id']}/finalize", headers=headers
+        )
+        # A duplicate finalize for the same object doesn't queue another probe
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        assert probe.call_count == 0
+        probe_uploads()
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["upload_state"] == "uploaded"
+    assert data["size_bytes"] == 52428800
+    assert data["etag"] == "abc123"
+    assert data["duration_seconds"] == 600
+    assert data["uploaded_at"].endswith("Z")
+    assert probe.call_count == 1
+
+    [probed] = client.get("/video-submissions", headers=headers).json()
+    assert probed["upload_state"] == "complete"
+    assert probed["duration_seconds"] == 61
+    assert (probed["width"], probed["height"]) == (1920, 1080)
+    assert probed["video_codec"] == "h264"
+    assert probed["sha256"] == hashlib.sha256(b"video bytes").hexdigest()
+    kinds = {job.kind for job in db.exec(select(models.Job)).all()}
+    assert {"uploads.probe_video", "media.transcode_hls"} <= kinds
+
+
+def test_finalize_before_upload_conflicts(authenticated_client, mock_s3):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    submission = create_submission(client, token)
+    mock_s3.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject"
+    )
+
+    response = client.post(
+        f"/video-submissions/{submission['id']}/finalize",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 409
+
+
+def test_unreadable_upload_is_invalid(authenticated_client, uploaded, probe_uploads):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    submission = create_submission(client, token)
+
+    with patch("app.media.subprocess.run", return_value=ffprobe_result(returncode=1)):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+
+    [invalid] = client.get("/video-submissions", headers=headers).json()
+    assert invalid["upload_state"] == "invalid"
+    assert invalid["duration_seconds"] == 600
+
+
+def test_reupload_skips_stale_probe(authenticated_client, uploaded, db, probe_uploads):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    submission = create_submission(client, token)
+    client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+    uploaded.head_object.return_value = {"ContentLength": 1024, "ETag": '"def456"'}
+    client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+
+    with patch("app.media.subprocess.run", return_value=ffprobe_result()) as probe:
+        probe_uploads()
+
+    results = [
+        job.result
+        for job in db.exec(select(models.Job)).all()
+        if job.kind == "uploads.probe_video"
+    ]
+    assert results == [{"skipped": "upload changed"}, {"upload_state": "complete"}]
+    assert probe.call_count == 1
+
+
+def test_only_owner_can_finalize(authenticated_client, uploaded):
+    client, student_data = authenticated_client(
+        email="student@example.com", user_id="student"
+    )
+    submission = create_submission(client, student_data["access_token"])
+    _, other_data = authenticated_client(email="other@example.com", user_id="other")
+
+    response = client.post(
+        f"/video-submissions/{submission['id']}/finalize",
+        headers={"Authorization": f"Bearer {other_data['access_token']}"},
+    )
+
+    assert response.status_code == 403
+
+
+def test_s3_event_finalizes_message_video(
+    authenticated_client, uploaded, probe_uploads
+):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    submission = create_submission(client, token)
+    message = client.post(
+        f"/video-submissions/{submission['id']}/messages",
+        json={"text": "Take two", "include_video": True, "video_duration_seconds": 30},
+        headers=headers,
+    ).json()["message"]
+    client.post(
+        f"/video-submissions/{submission['id']}/messages",
+        json={"text": "Text only"},
+        headers=headers,
+    )
+    event = {
+        "Records": [
+            {
+                "eventName": "ObjectCreated:CompleteMultipartUpload",
+                "s3": {"object": {"key": quote_plus(message["video_s3_key"])}},
+            }
+        ]
+    }
+
+    pending = client.get(
+        f"/video-submissions/{submission['id']}/messages?uploaded_only=true",
+        headers=headers,
+    ).json()
+    assert [m["text"] for m in pending] == ["Text only"]
+
+    rejected = client.post(
+        "/webhooks/s3", json=event, headers={"X-Webhook-Secret": "wrong"}
+    )
+    assert rejected.status_code == 401
+
+    with patch("app.media.subprocess.run", return_value=ffprobe_result("29.6")):
+        response = client.post(
+            "/webhooks/s3",
+            json=event,
+            headers={"X-Webhook-Secret": settings.s3_webhook_secret},
+        )
+        probe_uploads()
+
+    assert response.json() == {"finalized": 1}
+    messages = client.get(
+        f"/video-submissions/{submission['id']}/messages?uploaded_only=true",
+        headers=headers,
+    ).json()
+    assert [m["text"] for m in messages] == ["Take two", "Text only"]
+    assert messages[0]["upload_state"] == "complete"
+    assert messages[0]["video_duration_seconds"] == 30
+
+
+def test_uploaded_only_hides_pending_submissions(
+    authenticated_client, uploaded, probe_uploads
+):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    finished = create_submission(client, token)
+    create_submission(client, token)
+
+    with patch("app.media.subprocess.run", return_value=ffprobe_result()):
+        client.post(f"/video-submissions/{finished['id']}/finalize", headers=headers)
+        probe_uploads()
+
+    everything = client.get("/video-submissions", headers=headers).json()
+    uploaded_only = client.get(
+        "/video-submissions?uploaded_only=true", headers=headers
+    ).json()
+
+    assert len(everything) == 2
+    assert [s["id"] for s in uploaded_only] == [finished["id"]]
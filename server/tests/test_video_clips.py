@@ -0,0 +1,237 @@
+"""
+Video clip extraction tests.
+
+These tests verify cutting a passage out of a submission:
+- A teacher's clip request queues a job that stream-copies the range
+- The clip URL reports where the keyframe-aligned clip actually starts
+- Repeat requests for a range reuse the stored clip
+- Ranges past the end are clamped; clips of removed videos are skipped
+- Clip URLs wait for the job; invalid ranges and outsiders are rejected
+"""
+
+import io
+import json
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+from uuid import UUID
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlmodel import select
+
+from app import jobs, models, tasks  # noqa: F401 - registers job handlers
+
+
+def create_submission(client, token):
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 600},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()["submission"]
+
+
+def fake_media_tools(args, **kwargs):
+    """ffprobe reports 600s for the upload and 12.5s for clips; ffmpeg writes one"""
+    if "-show_streams" in args:
+        duration = "12.5" if args[-1].endswith("clip.mp4") else "600.0"
+        output = {
+            "format": {"duration": duration},
+            "streams": [{"codec_type": "video", "codec_name": "h264"}],
+        }
+        return subprocess.CompletedProcess(args, 0, json.dumps(output), "")
+    Path(args[-1]).write_bytes(b"\x00\x00\x00\x18ftypmp42")
+    return subprocess.CompletedProcess(args, 0, "", "")
+
+
+@pytest.fixture
+def submission(authenticated_client, mock_s3, probe_uploads):
+    """A finalized 10-minute submission by a student of teacher@example.com"""
+    client, teacher_data = authenticated_client(
+        user_id="teacher_1", email="teacher@example.com"
+    )
+    _, student_data = authenticated_client(
+        user_id="student_1", email="student@example.com"
+    )
+    student_token = student_data["access_token"]
+    client.post(
+        "/users/set-teacher",
+        params={"teacher_email": "teacher@example.com"},
+        headers={"Authorization": f"Bearer {student_token}"},
+    )
+    submission = create_submission(client, student_token)
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools):
+        client.post(
+            f"/video-submissions/{submission['id']}/finalize",
+            headers={"Authorization": f"Bearer {student_token}"},
+        )
+        probe_uploads()
+    return (
+        client,
+        {"Authorization": f"Bearer {teacher_data['access_token']}"},
+        submission,
+    )
+
+
+def drain_video_pipeline(db):
+    """Drop the finalized video's own jobs so clip jobs run next"""
+    for job in db.exec(select(models.Job)).all():
+        db.delete(job)
+    db.commit()
+
+
+def test_teacher_extracts_clip(submission, mock_s3, db):
+    client, headers, video = submission
+    drain_video_pipeline(db)
+    # No clip of this range yet
+    mock_s3.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404"}}, "HeadObject"
+    )
+
+    response = client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": 300, "end_seconds": 310.25},
+        headers=headers,
+    )
+    assert response.status_code == 202
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools) as ffmpeg:
+        job = jobs.run_next(db, "test-worker")
+
+    assert job.status == "succeeded"
+    probe, cut, _ = (call.args[0] for call in ffmpeg.call_args_list)
+    assert "-show_streams" in probe
+    assert cut[cut.index("-ss") + 1] == "300.000"
+    assert cut[cut.index("-to") + 1] == "310.250"
+    assert cut[cut.index("-c") + 1] == "copy"
+    clip_key = video["s3_key"].removesuffix(".mp4") + "/clips/300000-310250.mp4"
+    assert mock_s3.put_object.call_args.kwargs["Key"] == clip_key
+
+    url = client.get(
+        f"/video-submissions/{video['id']}/clips/{response.json()['id']}/url",
+        headers=headers,
+    )
+    assert url.status_code == 200
+    assert url.json()["start_seconds"] == 297.75
+    assert url.json()["duration_seconds"] == 12.5
+
+
+def test_existing_clip_is_reused(submission, mock_s3, db):
+    client, headers, video = submission
+    drain_video_pipeline(db)
+
+    client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": 10, "end_seconds": 20},
+        headers=headers,
+    )
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools) as ffmpeg:
+        job = jobs.run_next(db, "test-worker")
+
+    assert job.status == "succeeded"
+    # Only probes of the upload and the stored clip, no cut
+    assert ffmpeg.call_count == 2
+    assert all("-show_streams" in call.args[0] for call in ffmpeg.call_args_list)
+
+
+def test_clip_past_the_end_is_clamped(submission, mock_s3, db):
+    client, headers, video = submission
+    drain_video_pipeline(db)
+    mock_s3.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404"}}, "HeadObject"
+    )
+
+    response = client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": 595, "end_seconds": 600.9},
+        headers=headers,
+    )
+    with patch("app.media.subprocess.run", side_effect=fake_media_tools) as ffmpeg:
+        job = jobs.run_next(db, "test-worker")
+
+    cut = next(call.args[0] for call in ffmpeg.call_args_list if "-to" in call.args[0])
+    assert cut[cut.index("-to") + 1] == "600.000"
+    assert job.result["s3_key"].endswith("/clips/595000-600000.mp4")
+    url = client.get(
+        f"/video-submissions/{video['id']}/clips/{response.json()['id']}/url",
+        headers=headers,
+    )
+    # The 12.5 s clip ends at the end of the video, not at the requested end
+    assert url.json()["start_seconds"] == 587.5
+
+
+def test_clip_of_deleted_submission_is_skipped(submission, db):
+    client, headers, video = submission
+    drain_video_pipeline(db)
+    response = client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": 10, "end_seconds": 20},
+        headers=headers,
+    )
+    record = db.get(models.VideoSubmission, UUID(video["id"]))
+    record.upload_state = "pending"
+    db.add(record)
+    db.commit()
+
+    job = jobs.run_next(db, "test-worker")
+
+    # Retrying can't bring the video back
+    assert job.status == "succeeded"
+    assert job.result == {"skipped": "video not uploaded"}
+    url = client.get(
+        f"/video-submissions/{video['id']}/clips/{response.json()['id']}/url",
+        headers=headers,
+    )
+    assert url.status_code == 404
+
+
+def test_clip_url_before_job_finishes(submission):
+    client, headers, video = submission
+
+    response = client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": 10, "end_seconds": 20},
+        headers=headers,
+    )
+    url = client.get(
+        f"/video-submissions/{video['id']}/clips/{response.json()['id']}/url",
+        headers=headers,
+    )
+
+    assert url.status_code == 409
+
+
+@pytest.mark.parametrize(
+    "start,end",
+    [(20, 10), (0, 500), (700, 710), (-1, 5)],
+)
+def test_invalid_ranges_are_rejected(submission, start, end):
+    client, headers, video = submission
+
+    response = client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": start, "end_seconds": end},
+        headers=headers,
+    )
+
+    assert response.status_code == 422
+
+
+def test_outsider_cannot_clip(submission, authenticated_client):
+    client, _, video = submission
+    _, other = authenticated_client(user_id="other", email="other@example.com")
+
+    response = client.post(
+        f"/video-submissions/{video['id']}/clips",
+        json={"start_seconds": 10, "end_seconds": 20},
+        headers={"Authorization": f"Bearer {other['access_token']}"},
+    )
+
+    assert response.status_code == 403
@@ -227,3 +227,62 @@ def test_get_playback_url(authenticated_client):
         headers={"Authorization": f"Bearer {stranger_token}"},
     )
     assert stranger_response.status_code == 403
+
+
+def test_review_queue_pages_oldest_first_across_students(authenticated_client):
+    client, teacher_data = authenticated_client(
+        user_id="teacher_1", email="teacher@example.com"
+    )
+    teacher_token = teacher_data["access_token"]
+
+    submission_ids = []
+    for i in range(2):
+        _, student_data = authenticated_client(
+            user_id=f"student_{i}", email=f"student{i}@example.com"
+        )
+        student_token = student_data["access_token"]
+        client.post(
+            "/users/set-teacher",
+            params={"teacher_email": "teacher@example.com"},
+            headers={"Authorization": f"Bearer {student_token}"},
+        )
+        piece_id = create_piece(client, student_token, f"Piece {i}").json()["id"]
+        for _ in range(2):
+            response = create_video_submission(client, student_token, piece_id)
+            submission_ids.append(response.json()["submission"]["id"])
+
+    client.patch(
+        f"/video-submissions/{submission_ids[1]}/reviewed",
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    )
+    pending_ids = [submission_ids[0], *submission_ids[2:]]
+
+    first_page = client.get(
+        "/teacher/review-queue",
+        params={"limit": 2},
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    ).json()
+    assert [s["id"] for s in first_page["submissions"]] == pending_ids[:2]
+    assert first_page["next_cursor"] is not None
+
+    second_page = client.get(
+        "/teacher/review-queue",
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+        headers={"Authorization": f"Bearer {teacher_token}"},
+    ).json()
+    assert [s["id"] for s in second_page["submissions"]] == pending_ids[2:]
+    assert second_page["next_cursor"] is None
+
+
+def test_review_queue_rejects_malformed_cursor(authenticated_client):
+    client, teacher_data = authenticated_client(
+        user_id="teacher_1", email="teacher@example.com"
+    )
+
+    response = client.get(
+        "/teacher/review-queue",
+        params={"cursor": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {teacher_data['access_token']}"},
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,128 @@
+"""
+Resumable video upload tests.
+
+These tests verify multipart uploads for submission and message videos:
+- Uploads start at the submission's or message's existing S3 key
+- Clients can fetch part URLs and resume from the parts S3 already has
+- Completion requires a gap-free run of parts
+- Only the uploader can drive an upload
+"""
+
+import io
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+def create_submission(client, token):
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 600},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()["submission"]
+
+
+@pytest.fixture
+def s3_parts(mock_s3):
+    """Parts S3 has received for the mocked upload"""
+    parts = []
+    mock_s3.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+    mock_s3.list_parts.side_effect = lambda **_: {
+        "Parts": list(parts),
+        "IsTruncated": False,
+    }
+    return parts
+
+
+def test_resume_submission_upload(authenticated_client, s3_parts):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    submission = create_submission(client, token)
+    base = f"/video-submissions/{submission['id']}/multipart-uploads"
+
+    start = client.post(base, headers=headers)
+    assert start.status_code == 200
+    upload_id = start.json()["upload_id"]
+    assert start.json()["part_size"] >= 5 * 1024 * 1024
+
+    urls = client.post(
+        f"{base}/{upload_id}/part-urls",
+        json={"part_numbers": [1, 2, 3]},
+        headers=headers,
+    ).json()
+    assert set(urls["urls"]) == {"1", "2", "3"}
+    assert "partNumber=2" in urls["urls"]["2"]
+    assert f"uploadId={upload_id}" in urls["urls"]["2"]
+
+    # Connection drops after the first part
+    s3_parts.append({"PartNumber": 1, "ETag": '"a"', "Size": 8388608})
+    resumed = client.get(f"{base}/{upload_id}/parts", headers=headers).json()
+    assert [p["part_number"] for p in resumed] == [1]
+
+    s3_parts.append({"PartNumber": 3, "ETag": '"c"', "Size": 1024})
+    gap = client.post(f"{base}/{upload_id}/complete", headers=headers)
+    assert gap.status_code == 409
+
+    s3_parts.insert(1, {"PartNumber": 2, "ETag": '"b"', "Size": 8388608})
+    done = client.post(f"{base}/{upload_id}/complete", headers=headers)
+    assert done.status_code == 200
+
+
+def test_message_video_upload_is_sender_only(authenticated_client, s3_parts):
+    client, student_data = authenticated_client(
+        user_id="student", email="student@example.com"
+    )
+    submission = create_submission(client, student_data["access_token"])
+    message = client.post(
+        f"/video-submissions/{submission['id']}/messages",
+        json={"include_video": True, "video_duration_seconds": 20},
+        headers={"Authorization": f"Bearer {student_data['access_token']}"},
+    ).json()["message"]
+
+    _, other_data = authenticated_client(user_id="other", email="other@example.com")
+    forbidden = client.post(
+        f"/messages/{message['id']}/multipart-uploads",
+        headers={"Authorization": f"Bearer {other_data['access_token']}"},
+    )
+    assert forbidden.status_code == 403
+
+    allowed = client.post(
+        f"/messages/{message['id']}/multipart-uploads",
+        headers={"Authorization": f"Bearer {student_data['access_token']}"},
+    )
+    assert allowed.status_code == 200
+
+
+def test_unknown_upload_is_not_found(authenticated_client, mock_s3):
+    client, user_data = authenticated_client(email="student@example.com")
+    token = user_data["access_token"]
+    submission = create_submission(client, token)
+    mock_s3.list_parts.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchUpload"}}, "ListParts"
+    )
+
+    response = client.get(
+        f"/video-submissions/{submission['id']}/multipart-uploads/gone/parts",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 404
+
+
+def test_only_video_resources_take_multipart_uploads(authenticated_client):
+    client, user_data = authenticated_client(email="student@example.com")
+
+    response = client.post(
+        "/pieces/123/multipart-uploads",
+        headers={"Authorization": f"Bearer {user_data['access_token']}"},
+    )
+
+    assert response.status_code == 404
@@ -0,0 +1,168 @@
+"""
+Waveform peak tests.
+
+These tests verify the media.waveform job and /waveform endpoints:
+- Peaks are min/max per bucket at three resolutions, in a few KB
+- Samples split across pipe reads are decoded correctly
+- The job streams decoded audio and stores peaks next to the video
+- The endpoint serves peaks with an ETag and 404s only while they don't exist
+"""
+
+import io
+import json
+import subprocess
+from array import array
+from unittest.mock import MagicMock, patch
+from uuid import UUID
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlmodel import select
+
+from app import jobs, models, tasks, waveform  # noqa: F401 - registers job handlers
+
+
+def pcm(samples):
+    return array("h", samples).tobytes()
+
+
+def create_submission(client, token):
+    piece = client.post(
+        "/pieces",
+        data={"title": "Etude"},
+        files={"pdf_file": ("etude.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")},
+        headers={"Authorization": f"Bearer {token}"},
+    ).json()
+    response = client.post(
+        "/video-submissions",
+        json={"piece_id": piece["id"], "duration_seconds": 60},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.json()["submission"]
+
+
+def ffprobe_result(args, **kwargs):
+    output = {
+        "format": {"duration": "2.0"},
+        "streams": [
+            {"codec_type": "video", "codec_name": "h264"},
+            {"codec_type": "audio", "codec_name": "aac"},
+        ],
+    }
+    return subprocess.CompletedProcess(args, 0, json.dumps(output), "")
+
+
+def fake_decoder(data):
+    """Popen stand-in for an ffmpeg that decodes to `data`"""
+    process = MagicMock()
+    process.stdout = io.BytesIO(data)
+    process.wait.return_value = 0
+    process.poll.return_value = 0
+    return MagicMock(return_value=process)
+
+
+def test_peaks_cover_every_level():
+    # 2s ramp from -32768 to 32767
+    samples = [(n * 5) % 65536 - 32768 for n in range(2 * waveform.SAMPLE_RATE)]
+
+    data = waveform.compute([pcm(samples)], duration_seconds=2.0)
+    decoded = waveform.decode(data)
+
+    assert len(data) < 12 * 1024
+    assert decoded["samples"] == len(samples)
+    finest, middle, coarsest = decoded["levels"]
+    assert finest["samples_per_bucket"] == 4
+    assert len(finest["peaks"]) == 2 * 4000
+    assert len(middle["peaks"]) == 2 * 1000
+    assert len(coarsest["peaks"]) == 2 * 250
+    assert finest["peaks"][:2] == array("b", [-128, -128])
+    assert (min(coarsest["peaks"]), max(coarsest["peaks"])) == (-128, 127)
+
+
+def test_samples_split_across_reads():
+    samples = [100 * 256, -100 * 256, 50 * 256, -50 * 256] * 1000
+    data = pcm(samples)
+    chunks = [data[:1001], data[1001:2003], data[2003:]]
+
+    assert waveform.compute(chunks, 0.5) == waveform.compute([data], 0.5)
+
+
+@pytest.fixture
+def finalized(authenticated_client, mock_s3, db, probe_uploads):
+    """A finalized submission with only its waveform job queued"""
+    client, user_data = authenticated_client(email="student@example.com")
+    headers = {"Authorization": f"Bearer {user_data['access_token']}"}
+    submission = create_submission(client, user_data["access_token"])
+    mock_s3.head_object.return_value = {"ContentLength": 1024, "ETag": '"abc"'}
+    with patch("app.media.subprocess.run", side_effect=ffprobe_result):
+        client.post(f"/video-submissions/{submission['id']}/finalize", headers=headers)
+        probe_uploads()
+    for job in db.exec(select(models.Job)).all():
+        if job.kind != "media.waveform":
+            db.delete(job)
+    db.commit()
+    return client, headers, submission
+
+
+def test_job_stores_peaks_next_to_video(finalized, mock_s3, db):
+    client, headers, submission = finalized
+    decoded = pcm([1000, -1000] * waveform.SAMPLE_RATE)
+
+    with (
+        patch("app.media.subprocess.run", side_effect=ffprobe_result),
+        patch("app.media.subprocess.Popen", fake_decoder(decoded)),
+    ):
+        job = jobs.run_next(db, "test-worker")
+
+    assert job.kind == "media.waveform"
+    assert job.status == "succeeded"
+    key = submission["s3_key"].removesuffix(".mp4") + "/waveform.bin"
+    upload = mock_s3.put_object.call_args.kwargs
+    assert upload["Key"] == key
+    assert waveform.decode(upload["Body"])["samples"] == 2 * waveform.SAMPLE_RATE
+
+    waveform._peaks_cache.clear()
+    mock_s3.get_object.return_value["Body"].iter_chunks.return_value = [upload["Body"]]
+    response = client.get(
+        f"/video-submissions/{submission['id']}/waveform", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.content == upload["Body"]
+
+    cached = client.get(
+        f"/video-submissions/{submission['id']}/waveform",
+        headers={**headers, "If-None-Match": response.headers["ETag"]},
+    )
+    assert cached.status_code == 304
+
+
+def test_waveform_missing_until_computed(finalized):
+    client, headers, submission = finalized
+
+    response = client.get(
+        f"/video-submissions/{submission['id']}/waveform", headers=headers
+    )
+
+    assert response.status_code == 404
+
+
+def test_deleted_peaks_are_not_found(finalized, mock_s3, db):
+    client, headers, submission = finalized
+    record = db.get(models.VideoSubmission, UUID(submission["id"]))
+    record.waveform_s3_key = submission["s3_key"].removesuffix(".mp4") + "/waveform.bin"
+    db.add(record)
+    db.commit()
+    waveform._peaks_cache.clear()
+    url = f"/video-submissions/{submission['id']}/waveform"
+
+    mock_s3.get_object.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+    )
+    assert client.get(url, headers=headers).status_code == 404
+
+    # Anything else is a server error, not a missing waveform
+    mock_s3.get_object.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied"}}, "GetObject"
+    )
+    with pytest.raises(Exception, match="AccessDenied"):
+        client.get(url, headers=headers)